@@ -4,6 +4,10 @@ BARGE_IN_VAD_AGGR = 2            # 0..3 (3 = most sensitive)
 BARGE_IN_MIN_MS = 250             # speech must persist this long to cut TTS
 BARGE_IN_START_GRACE_MS = 300     # ignore first N ms to avoid self-trigger
 PIPER_OUTPUT_SR = 16000          # match mic/STT @ 16 kHz
+TTS_STREAMING = True             # synthesize + play reply sentence by sentence
+TTS_CACHE = True                 # reuse synthesized audio for repeated reply text
+TTS_CACHE_MAX_MB = 64            # in-memory LRU budget
+TTS_CACHE_DIR = "cache/tts"      # on-disk store (None = memory only); fill with: python -m utils.tts_cache --warm
 
 # Paths to your Piper models (update to your actual files)
 HINDI_VOICE_MODEL = "voices/hi_IN-priyamvada-medium.onnx"
@@ -14,6 +18,81 @@ SR = 16000                       # mic sample rate
 CHANNELS = 1                     # mono mic
 FRAME_SEC = 5                    # seconds to record before processing
 
+# Streaming capture (VAD endpointing instead of fixed FRAME_SEC windows)
+STREAM_CAPTURE = True            # False -> old fixed-length recordings
+CAPTURE_VAD_AGGR = 2             # 0..3 (3 = most aggressive speech filter)
+SPEECH_START_MS = 120            # voiced audio needed to open a turn
+END_SILENCE_MS = 500             # trailing silence that closes a turn
+MAX_UTTERANCE_SEC = 12           # hard cap on a single turn
+PRE_ROLL_MS = 200                # audio kept from before speech onset
+
+# STT (faster-whisper)
+STT_LID_MODE = "single_pass"     # "single_pass" (LID once, 1 decode) | "legacy" (auto + forced en/hi)
+STT_LID_MIN_PROB = 0.6           # below this hi/en LID prob, also decode the runner-up language
+STT_PARALLEL_FALLBACK = True     # run the en/hi fallback decodes concurrently
+STT_CPU_THREADS = 0              # CTranslate2 threads per decode (0 = default); ~cores / STT_NUM_WORKERS
+STT_NUM_WORKERS = 2              # concurrent decodes on the shared Whisper model
+
+# Decode tiers, cheapest first; escalate to the next one only on a low-confidence result
+STT_DECODE_PROFILES = [
+    {"name": "greedy", "beam_size": 1, "temperature": [0.0]},
+    {"name": "beam",   "beam_size": 5, "temperature": [0.0, 0.2, 0.4]},
+]
+STT_ESCALATE_LOGPROB = -0.8      # avg_logprob below this -> escalate
+STT_ESCALATE_COMPRESSION = 2.4   # compression_ratio above this (repetitive) -> escalate
+STT_ESCALATE_NO_SPEECH = 0.6     # no_speech_prob above this -> escalate
+
+# Domain biasing: project names + category/attribute labels from intents.json
+STT_BIAS_PROMPT = True           # pass them as Whisper initial_prompt on every decode
+STT_HOTWORDS = False             # also pass them as hotwords (faster-whisper >= 1.0.2)
+STT_BIAS_BRAND = "Ashar Group"   # prompt brand when intents.json config has no "brand_name"
+
+# Cross-call STT batching (server.py): one encoder/decoder pass for several utterances
+STT_BATCHING = True
+STT_BATCH_WINDOW_MS = 30         # max time the first utterance waits for company
+STT_BATCH_MAX = 8                # max utterances per batch
+
+# Intent classifier (SBERT)
+SBERT_BACKEND = "torch"          # "onnx" = onnxruntime int8, no torch in the process (python -m utils.sbert_onnx --export/--check)
+SBERT_ONNX_DIR = "cache/sbert_onnx"
+SBERT_ONNX_INT8 = True           # dynamic int8 quantized weights
+SBERT_ONNX_THREADS = 1           # intra-op threads per session (1 suits many worker threads/processes)
+SBERT_QUERY_CACHE = 2048         # LRU of query embeddings, keyed by normalized text
+SBERT_BATCH_SIZE = 32
+INTENT_INDEX_DIR = "cache/intents"  # fitted example embeddings, reused while intents.json + model are unchanged
+
+# NLU pipeline (utils/dialogue.run_nlu)
+NLU_STAGES = ("entities", "rules", "sbert")  # run in order; SBERT is skipped once a stage decides
+NLU_SBERT_THRESHOLD = 0.55
+NLU_ENTITY_SHORTCUT = True       # any project/category/attribute hit (exact or fuzzy) skips SBERT
+
+# Knowledge base (utils/kb.py)
+KB_CLIENTS_DIR = "clients"       # clients/<tenant>/project_facts.yaml|json or intents.json
+KB_DEFAULT_TENANT = "ashar"      # served from intents.json when it has no clients/ dir
+KB_MAX_TENANTS = 256             # LRU of loaded tenants (default tenant pinned)
+KB_WATCH_SEC = 2.0               # poll interval for hot reload (0 = off)
+
+# Startup (utils/startup.py)
+STARTUP_WARMUP = True            # run a dummy inference through each engine after loading
+STARTUP_REQUIRED = ("stt",)      # wait for these before taking calls; nlu falls back to rules, tts loads lazily
+
+# Metrics / tracing (utils/metrics.py)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108              # Prometheus text at /metrics (0 = no endpoint)
+METRICS_TRACE_PATH = "logs/traces.jsonl"  # one JSON line per turn (None = off)
+METRICS_WINDOW = 2048            # recent samples per span for p50/p95/p99
+
+# Profiling (utils/profiling.py): kill -USR1/-USR2 <pid> or GET /debug/profile on the metrics port
+PROFILE_DIR = "logs/profiles"
+PROFILE_SIGNALS = True           # USR1 = cProfile PROFILE_TURNS turns, USR2 = sample PROFILE_SECONDS
+PROFILE_ENDPOINT = True
+PROFILE_TURNS = 20
+PROFILE_SECONDS = 30
+PROFILE_SAMPLE_HZ = 100
+PROFILE_MEMORY = True            # tracemalloc diff around each profiled turn
+PROFILE_MEMORY_FRAMES = 16
+
 # Misc
 LOGGING = True
 
@@ -23,3 +102,15 @@ SINGLE_VOICE_MODEL = HINDI_VOICE_MODEL
 
 # Point to your actual Piper binary:
 PIPER_BIN = "./piper/piper"      # adjust if needed
+PIPER_POOL = True                # keep Piper processes alive between replies
+PIPER_POOL_SIZE = 1              # workers per voice (= concurrent syntheses per voice); server.py raises it to SERVER_TTS_WORKERS
+
+# Multi-call gateway (server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_MAX_CALLS = 64            # further connections are refused (1013 try again later)
+SERVER_STT_WORKERS = 2           # concurrent utterances in Whisper (keep <= STT_NUM_WORKERS)
+SERVER_NLU_WORKERS = 4
+SERVER_TTS_WORKERS = 4           # concurrent Piper renders (the Piper pool is sized to match)
+SERVER_STAGE_QUEUE = 32          # pending jobs per stage before callers wait (backpressure)
+SERVER_TURN_QUEUE = 2            # finished utterances buffered per call
@@ -1,65 +1,86 @@
 # main.py  —  STABLE BASELINE (no barge-in, guaranteed reply)
 
 import os, time
-import soundfile as sf
 import sounddevice as sd
 
-from utils import stt, tts
+from utils import stt, tts, audio, startup, metrics, profiling
 from utils.normalizer import normalize
-from utils.dialogue import DialogueCtx, nlu_router
+from utils.dialogue import nlu_router, T
+from utils.session import Session
 
 # -------- Config / defaults --------
 try:
     import config as CFG
     SR = int(getattr(CFG, "SR", 16000))
     FRAME_SEC = int(getattr(CFG, "FRAME_SEC", 5))
+    STREAM_CAPTURE = bool(getattr(CFG, "STREAM_CAPTURE", True))
+    TTS_STREAMING = bool(getattr(CFG, "TTS_STREAMING", True))
 except Exception:
     SR = 16000
     FRAME_SEC = 5
-
-CTX = DialogueCtx()
+    STREAM_CAPTURE = True
+    TTS_STREAMING = True
 
 # -------- Helpers --------
-def record_wav(path, sec=FRAME_SEC, sr=SR):
+def record_wav(sec=FRAME_SEC, sr=SR):
+    # fixed-length capture; stays in memory (no temp WAV)
     print(f"[Mic] Recording {sec:g}s @ {sr} Hz …")
-    audio = sd.rec(int(sec*sr), samplerate=sr, channels=1, dtype="float32")
-    sd.wait()
-    sf.write(path, audio, sr)
-    print(f"[Mic] Saved: {path}")
-    return path
+    with metrics.span("record", mode="fixed"):
+        rec = sd.rec(int(sec*sr), samplerate=sr, channels=1, dtype="float32")
+        sd.wait()
+    return rec[:, 0]
+
+def capture_utterance(sr=SR):
+    # streaming mic + VAD endpointing; returns float32 audio in memory
+    print("[Mic] Listening …")
+    with metrics.span("record", mode="vad"):
+        utt = audio.record_utterance(sr=sr)
+    print(f"[Mic] Captured {len(utt) / sr:.2f}s")
+    return utt
 
-def play_wav_simple(path: str):
+def play_pcm_simple(data, rate: int):
     # simple blocking playback (no barge-in) so we can isolate issues
-    data, rate = sf.read(path, dtype="float32")
-    sd.play(data, rate)
-    sd.wait()
+    with metrics.span("play"):
+        sd.play(data, rate)
+        sd.wait()
 
 def safe_tts_say(text: str, lang: str):
     try:
-        out_wav = tts.synthesize(text, lang)
-        print(f"[TTS] Wrote: {out_wav}")
-        play_wav_simple(out_wav)
+        if TTS_STREAMING:
+            # sentence-by-sentence: first audio after the first sentence
+            audio.play_stream(tts.synthesize_stream(text, lang), enable_barge_in=False)
+            return
+        pcm, rate = tts.synthesize_pcm(text, lang)
+        print(f"[TTS] {len(pcm) / rate:.2f}s @ {rate} Hz")
+        play_pcm_simple(pcm, rate)
     except Exception as e:
         print(f"[TTS] Error: {e}")
 
 # -------- Main turn handler --------
-def handle_utterance(wav_path: str):
-    # 1) STT
-    text, lang, p = stt.transcribe(wav_path)
-    print(f"[STT:{lang} p={p:.2f}] {text}")
+def handle_utterance(utt, sess: Session):
+    # 1) STT (utt: WAV path or float32 mono array @ SR)
+    with metrics.span("stt"):
+        text, lang, p = stt.transcribe(utt)
+    st = stt.last_turn_stats()
+    metrics.record("stt_decodes_per_turn", st.decodes)
+    print(f"[STT:{lang} p={p:.2f} decodes={st.decodes} tiers={','.join(st.tiers)} path={st.path}] {text}")
 
     # 2) If empty transcription, reprompt and return
     if not text or not text.strip():
-        msg = ("Sorry, I didn't catch that. Could you please repeat?"
-               if lang != "hi" else
-               "माफ़ कीजिए, आपकी बात समझ नहीं आई। कृपया दोबारा कहिए।")
+        msg = T["reprompt"]["hi" if lang == "hi" else "en"]
         safe_tts_say(msg, lang or "en")
         return
 
     # 3) Normalize + Dialogue
     ntext = normalize(text, lang)
-    reply, _ = nlu_router(ntext, lang, CTX)
-    print(f"[NLU] intent={CTX.last_intent} cat={CTX.category} proj={CTX.project} attr={CTX.attribute}")
+    ctx = sess.ctx
+    with metrics.span("nlu"):
+        reply, _ = nlu_router(ntext, lang, ctx)
+    tr = metrics.current()
+    if tr is not None:
+        tr.attrs.update(lang=lang, intent=ctx.last_intent, source=ctx.intent_source)
+    print(f"[NLU] intent={ctx.last_intent} ({ctx.intent_source}) cat={ctx.category} proj={ctx.project} "
+          f"attr={ctx.attribute} ms={ctx.nlu_ms}")
 
     # 4) TTS
     safe_tts_say(reply, lang)
@@ -69,8 +90,12 @@ if __name__ == "__main__":
     print("== Voice Bot (Piper) — Baseline ==")
     print("Press Ctrl+C to exit.")
 
-    # init STT
-    stt.init(model_size="small", device="cpu", compute_type="int8")  # use "medium" if CPU allows
+    # load Whisper, SBERT and the Piper pool in parallel, then warm each up
+    startup.start(stt_kwargs={"model_size": "small", "device": "cpu", "compute_type": "int8"})  # "medium" if CPU allows
+    startup.wait(components=startup.REQUIRED)
+    print(f"[Startup] {startup.status()}")
+    metrics.serve()
+    profiling.install()
 
     # quick environment sanity (doesn't stop run)
     try:
@@ -80,11 +105,22 @@ if __name__ == "__main__":
     except Exception:
         pass
 
+    use_stream = STREAM_CAPTURE and audio.HAVE_VAD
+    print(f"[Env] capture={'stream+VAD' if use_stream else f'fixed {FRAME_SEC}s'}")
+
+    sess = Session()
     try:
         while True:
-            utt = "/tmp/user_utt.wav"
-            record_wav(utt, FRAME_SEC, SR)
-            handle_utterance(utt)
-            time.sleep(0.2)
+            if use_stream:
+                utt = capture_utterance(SR)
+            else:
+                utt = record_wav(FRAME_SEC, SR)
+            with metrics.turn(sess.id, sess.next_turn(), tenant=sess.ctx.tenant) as tr, profiling.turn(tr.id):
+                handle_utterance(utt, sess)
+            print(f"[Turn] {tr.id} {tr.total_ms:.0f} ms")
+            if not use_stream:
+                time.sleep(0.2)
     except KeyboardInterrupt:
         print("\nBye!")
+    finally:
+        tts.shutdown()
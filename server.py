@@ -0,0 +1,341 @@
+# server.py  —  multi-call gateway (asyncio + PCM over WebSocket)
+#
+# Stand-in for the telephony leg: each WebSocket connection is one call.
+#   client -> server : binary frames = int16 LE mono PCM @ 16 kHz (any size)
+#                      text {"type": "eou"}     force end of utterance
+#                      text {"type": "hangup"}  end the call
+#   server -> client : text {"type": "transcript", ...}, {"type": "reply", ...}
+#                      binary int16 LE mono PCM @ reply sample_rate, piece by piece
+#                      text {"type": "reply_end", ...}
+# Query string: ws://host:port/?lang=en&tenant=ashar
+#
+# All calls share one Whisper model, one SBERT classifier and one Piper pool.
+# Blocking work runs in per-stage thread pools behind bounded queues: when a
+# stage is saturated, callers wait on the queue (backpressure) instead of
+# piling unbounded work onto the CPU.
+#
+# Run:  python server.py        Load test:  python -m tools.loadgen --help
+
+import json
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import websockets
+
+from utils import stt, tts, audio, startup, metrics, profiling
+from utils.normalizer import normalize
+from utils.dialogue import nlu_router, T
+from utils.session import Session
+from utils.stt_batch import BatchScheduler
+
+# -------- Config / defaults --------
+try:
+    import config as CFG
+    HOST = getattr(CFG, "SERVER_HOST", "127.0.0.1")
+    PORT = int(getattr(CFG, "SERVER_PORT", 8765))
+    MAX_CALLS = int(getattr(CFG, "SERVER_MAX_CALLS", 64))
+    STT_WORKERS = int(getattr(CFG, "SERVER_STT_WORKERS", 2))
+    NLU_WORKERS = int(getattr(CFG, "SERVER_NLU_WORKERS", 4))
+    TTS_WORKERS = int(getattr(CFG, "SERVER_TTS_WORKERS", 4))
+    STAGE_QUEUE = int(getattr(CFG, "SERVER_STAGE_QUEUE", 32))
+    TURN_QUEUE = int(getattr(CFG, "SERVER_TURN_QUEUE", 2))
+    STT_BATCHING = bool(getattr(CFG, "STT_BATCHING", True))
+except Exception:
+    HOST, PORT, MAX_CALLS = "127.0.0.1", 8765, 64
+    STT_WORKERS, NLU_WORKERS, TTS_WORKERS = 2, 4, 4
+    STAGE_QUEUE, TURN_QUEUE = 32, 2
+    STT_BATCHING = True
+
+SR = 16000                          # call leg rate (matches STT)
+FRAME = int(SR * audio.FRAME_MS / 1000)
+SEND_CHUNK = SR // 10               # 100 ms of reply audio per binary frame
+
+
+# -------- Stages --------
+class Stage:
+    """
+    A bounded job queue in front of a thread pool. submit() waits while the
+    queue is full, which is what pushes back on busy calls.
+    """
+
+    def __init__(self, name: str, fn: Callable, workers: int, queue_size: int):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.q: Optional[asyncio.Queue] = None
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self.queue_size = queue_size
+        self.done = 0
+        self._tasks = []
+
+    def start(self):
+        self.q = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, *args):
+        fut = asyncio.get_running_loop().create_future()
+        # the caller's context travels with the job, so its spans land in the caller's turn trace
+        await self.q.put((args, fut, contextvars.copy_context()))
+        return await fut
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            args, fut, ctx = await self.q.get()
+            try:
+                res = await loop.run_in_executor(self.pool, ctx.run, profiling.call, self.fn, *args)
+                if not fut.done():
+                    fut.set_result(res)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            finally:
+                self.done += 1
+                self.q.task_done()
+
+    def stats(self) -> dict:
+        return {"queued": self.q.qsize() if self.q else 0, "done": self.done}
+
+    def close(self):
+        for t in self._tasks:
+            t.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _stt_job(utt: np.ndarray):
+    text, lang, p = stt.transcribe(utt)
+    st = stt.last_turn_stats()
+    return text, lang, p, {"decodes": st.decodes, "path": st.path, "tiers": list(st.tiers)}
+
+def _nlu_job(text: str, lang: str, sess: Session):
+    if not text or not text.strip():
+        return T["reprompt"]["hi" if lang == "hi" else "en"]
+    reply, _ = nlu_router(normalize(text, lang), lang, sess.ctx)
+    return reply
+
+def _tts_job(piece: str, lang: Optional[str]):
+    return tts.render_piece(piece, lang)
+
+
+class Gateway:
+    def __init__(self):
+        # batching replaces the per-utterance STT stage when enabled
+        self.stt: Optional[Stage] = None if STT_BATCHING else Stage("stt", _stt_job, STT_WORKERS, STAGE_QUEUE)
+        self.nlu = Stage("nlu", _nlu_job, NLU_WORKERS, STAGE_QUEUE)
+        self.tts = Stage("tts", _tts_job, TTS_WORKERS, STAGE_QUEUE)
+        self.batcher: Optional[BatchScheduler] = None
+        self.active = 0
+        self.calls_total = 0
+        self.rejected = 0
+
+    def stages(self) -> list:
+        return [st for st in (self.stt, self.nlu, self.tts) if st is not None]
+
+    def start(self):
+        for st in self.stages():
+            st.start()
+        if STT_BATCHING:
+            self.batcher = BatchScheduler()
+        metrics.register_gauges(self.gauges)
+
+    def gauges(self) -> dict:
+        out = {"calls_active": self.active, "calls_rejected": self.rejected}
+        for st in self.stages():
+            out[f"stage_{st.name}_queued"] = st.q.qsize() if st.q else 0
+        return out
+
+    def close(self):
+        for st in self.stages():
+            st.close()
+        if self.batcher:
+            self.batcher.close()
+
+    def stats(self) -> dict:
+        out = {"ready": startup.ready(), "active": self.active,
+               "calls_total": self.calls_total, "rejected": self.rejected}
+        out.update((st.name, st.stats()) for st in self.stages())
+        if self.batcher:
+            out["stt_batch"] = self.batcher.stats()
+        return out
+
+    async def transcribe(self, utt: np.ndarray):
+        if self.batcher:
+            return await asyncio.wrap_future(self.batcher.submit(utt))
+        return await self.stt.submit(utt)
+
+    # ---- one call ----
+    async def handle(self, ws):
+        if self.active >= MAX_CALLS:
+            self.rejected += 1
+            await ws.close(code=1013, reason="server at capacity")
+            return
+        self.active += 1
+        self.calls_total += 1
+        path = getattr(getattr(ws, "request", None), "path", None) or getattr(ws, "path", "/")
+        qs = parse_qs(urlparse(path).query)
+        sess = Session(tenant=(qs.get("tenant") or ["ashar"])[0])
+        lang_hint = (qs.get("lang") or [None])[0]
+        turns: asyncio.Queue = asyncio.Queue(maxsize=TURN_QUEUE)
+        worker = asyncio.create_task(self._turn_loop(ws, sess, turns, lang_hint))
+        try:
+            await self._receive_loop(ws, turns)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            worker.cancel()
+            self.active -= 1
+
+    async def _receive_loop(self, ws, turns: asyncio.Queue):
+        ep = audio.Endpointer(sr=SR) if audio.HAVE_VAD else None
+        pending = np.zeros(0, dtype=np.float32)
+        raw = []  # used only without VAD: everything until "eou"
+        just_closed = False  # the Endpointer ended a turn and no new speech has started
+        async for msg in ws:
+            if isinstance(msg, str):
+                try:
+                    ev = json.loads(msg)
+                except ValueError:
+                    continue
+                if ev.get("type") == "hangup":
+                    return
+                if ev.get("type") == "eou":
+                    utt = ep.flush() if ep else (np.concatenate(raw) if raw else None)
+                    raw = []
+                    if utt is None and just_closed:
+                        # trailing silence already closed this turn; the eou is a duplicate
+                        just_closed = False
+                        continue
+                    just_closed = False
+                    # no speech heard still gets an answer (the reprompt)
+                    if utt is None:
+                        utt = np.zeros(0, dtype=np.float32)
+                    await turns.put((utt, time.monotonic()))  # blocks when the call is behind
+                continue
+
+            pcm = np.frombuffer(msg, dtype="<i2").astype(np.float32) / 32768.0
+            if ep is None:
+                raw.append(pcm)
+                continue
+            pending = np.concatenate([pending, pcm])
+            n = len(pending) // FRAME
+            for i in range(n):
+                utt = ep.feed(pending[i * FRAME:(i + 1) * FRAME])
+                if utt is not None:
+                    just_closed = True
+                    await turns.put((utt, time.monotonic()))
+                elif ep.triggered:
+                    just_closed = False
+            pending = pending[n * FRAME:]
+
+    async def _turn_loop(self, ws, sess: Session, turns: asyncio.Queue, lang_hint: Optional[str]):
+        while True:
+            utt, t_eos = await turns.get()
+            turn = sess.next_turn()
+            # the turn's work runs in stage threads (profiled via profiling.call), not here;
+            # a memory diff covers the whole process (other calls' turns included) and is
+            # taken on the profiler thread so tracemalloc never stalls this loop
+            with metrics.turn(sess.id, turn, tenant=sess.ctx.tenant) as tr, \
+                    profiling.turn(tr.id, profile_thread=False, offload=True):
+                if not await self._turn(ws, sess, turn, utt, t_eos, lang_hint, tr):
+                    return
+
+    async def _turn(self, ws, sess: Session, turn: int, utt: np.ndarray, t_eos: float,
+                    lang_hint: Optional[str], tr: "metrics.Trace") -> bool:
+        """One utterance -> transcript, reply and audio. False once the caller is gone."""
+        try:
+            t0 = time.perf_counter()
+            p_eos = t0 - (time.monotonic() - t_eos)   # end of speech on the perf_counter clock
+            text, lang, p, st = await self.transcribe(utt)
+            metrics.observe("stt", time.perf_counter() - t0, start=t0)
+            metrics.record("stt_decodes_per_turn", st.get("decodes", 1))
+            lang = lang or lang_hint or "en"
+            t_stt = time.monotonic()
+            await ws.send(json.dumps({"type": "transcript", "turn": turn, "text": text,
+                                      "lang": lang, "p": round(p, 3), **st}, ensure_ascii=False))
+            t0 = time.perf_counter()
+            reply = await self.nlu.submit(text, lang, sess)
+            metrics.observe("nlu", time.perf_counter() - t0, start=t0)
+            tr.attrs.update(lang=lang, intent=sess.ctx.last_intent, source=sess.ctx.intent_source)
+            await ws.send(json.dumps({"type": "reply", "turn": turn, "text": reply,
+                                      "sample_rate": SR}, ensure_ascii=False))
+            t_first = None
+            t0 = time.perf_counter()
+            pieces = tts.pieces(reply)
+            # render one piece ahead of the one being sent
+            nxt = asyncio.ensure_future(self.tts.submit(pieces[0], lang))
+            try:
+                for k in range(len(pieces)):
+                    pcm, rate = await nxt
+                    if k + 1 < len(pieces):
+                        nxt = asyncio.ensure_future(self.tts.submit(pieces[k + 1], lang))
+                    if rate != SR:
+                        pcm = audio.resample_linear(pcm, rate, SR)
+                    data = (np.clip(pcm, -1.0, 1.0) * 32767).astype("<i2")
+                    if t_first is None:
+                        t_first = time.monotonic()
+                        now = time.perf_counter()
+                        metrics.observe("tts.first_audio", now - t0, start=t0)
+                        metrics.observe("first_audio", now - p_eos, start=p_eos)   # end of speech -> first reply audio
+                    for i in range(0, len(data), SEND_CHUNK):
+                        await ws.send(data[i:i + SEND_CHUNK].tobytes())
+            finally:
+                # a failed piece or send leaves the prefetch behind: cancel it, or retrieve
+                # its error if it already finished, so nothing is left unawaited
+                if not nxt.cancel() and not nxt.cancelled():
+                    nxt.exception()
+            metrics.observe("reply", time.perf_counter() - t0, start=t0, pieces=len(pieces))
+            await ws.send(json.dumps({
+                "type": "reply_end", "turn": turn,
+                "stt_ms": round((t_stt - t_eos) * 1000, 1),
+                "first_audio_ms": round(((t_first or time.monotonic()) - t_eos) * 1000, 1),
+                "intent": sess.ctx.last_intent,
+            }))
+        except websockets.ConnectionClosed:
+            return False
+        except Exception as e:
+            metrics.inc("turn_errors")
+            print(f"[Server] call {sess.id} turn {turn} failed: {e}")
+        return True
+
+
+async def serve(host: str = HOST, port: int = PORT):
+    gw = Gateway()
+    gw.start()
+    metrics.serve()
+    print(f"== Voice Bot gateway on ws://{host}:{port} (max {MAX_CALLS} calls) ==")
+    try:
+        async with websockets.serve(gw.handle, host, port, max_size=2 ** 22):
+            while True:
+                await asyncio.sleep(30)
+                print(f"[Server] {json.dumps(gw.stats())}")
+    finally:
+        gw.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Multi-call voice bot gateway")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--model", default="small")
+    args = ap.parse_args()
+
+    # shared engines, loaded once for every call (in parallel, warmed up);
+    # one Piper process per TTS worker and voice, so renders never queue on the pool
+    tts.set_pool_size(max(tts.POOL_SIZE, TTS_WORKERS))
+    startup.start(stt_kwargs={"model_size": args.model, "device": "cpu", "compute_type": "int8"})
+    if not startup.wait(components=startup.REQUIRED):
+        print(f"[Server] required engines failed: {startup.status()}")
+    print(f"[Server] startup {json.dumps(startup.status())}")
+    profiling.install()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nBye!")
+    finally:
+        tts.shutdown()
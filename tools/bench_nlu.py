@@ -0,0 +1,265 @@
+# tools/bench_nlu.py
+# Microbenchmarks for the text-only NLU hot path: normalize, the entity
+# detectors (legacy fuzzy + compiled index), rule intents, SBERT predict and
+# the whole nlu_router.
+#
+#   python -m tools.bench_nlu [--size 600] [--threads 1,8,64] [--out runs/nlu.json]
+#   python -m tools.bench_nlu --baseline runs/nlu.json --max-regress 0.15
+#
+# The corpus is generated (seeded): English, Hindi and Hinglish turns built
+# from the project/category/attribute vocabularies, with ASR misspellings from
+# attributes.FUZZY_ALIASES and single-character typos mixed in.
+# Per case: ns/op (best of --repeat passes), tracemalloc peak and retained
+# bytes per op, and ops/s with 1, 8 and 64 threads sharing the process.
+# The entity LRU and the SBERT query cache are switched off unless --warm, so
+# the numbers are for utterances the process has not seen before.
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from utils import dialogue, entity_index
+from utils import entity_fuzzy as _ef
+from utils import attributes as _attr
+from utils.normalizer import normalize
+from utils.dialogue import DialogueCtx, nlu_router
+
+Case = Tuple[Callable, List[tuple]]   # fn, argument tuples
+
+_EN = ["what is the {a} of {p}", "tell me the {a} in {p}", "show me {c} projects", "{p} {a} please",
+       "i want {c} flats", "how many {a} does {p} have", "go back", "connect me to a representative",
+       "send it on whatsapp", "hello", "{p}", "list all projects", "{c}"]
+_HINGLISH = ["{p} ka {a} kya hai", "{p} mein {a} kitne hain", "mujhe {c} projects dikhao",
+             "{p} ke baare mein batao", "wapas jao", "whatsapp pe bhej do", "{a} batao {p} ka",
+             "representative se baat karni hai", "{c} wale dikhao"]
+_HI = ["{p} की कीमत क्या है", "{p} में कितनी मंजिल हैं", "{c} प्रोजेक्ट्स बताइए", "वापस जाइए",
+       "कृपया प्रतिनिधि से जोड़िए", "नमस्ते", "{p} के टावर कितने हैं", "व्हाट्सएप पर भेजिए"]
+_HI_CATS = ["रेडी टू मूव", "अंडर कंस्ट्रक्शन", "पूरे हो चुके"]
+
+
+def _typo(rng: random.Random, s: str) -> str:
+    if len(s) < 4:
+        return s
+    i = rng.randrange(1, len(s) - 1)
+    return rng.choice([s[:i] + s[i + 1:], s[:i] + s[i + 1] + s[i] + s[i + 2:], s[:i] + s[i] + s[i:]])
+
+
+def corpus(size: int = 600, seed: int = 7) -> List[Tuple[str, str]]:
+    """[(text, lang)] — unique, deterministic for a given size/seed."""
+    rng = random.Random(seed)
+    # sorted: the vocabularies are sets, whose order changes with the hash seed
+    projects = sorted({v for canon, vs in _ef.CANON_PROJECTS.items() for v in (canon, *vs)})
+    cats = sorted({v for canon, vs in _ef.CANON_CATEGORIES.items() for v in (canon, *vs)})
+    attrs = sorted({p for _, p in _attr._PHRASE_TABLE if p.isascii()})
+    misspelt = sorted({p for ps in _attr.FUZZY_ALIASES.values() for p in ps})
+    out: Dict[str, str] = {}
+    tries = 0
+    while len(out) < size and tries < size * 20:
+        tries += 1
+        roll = rng.random()
+        if roll < 0.45:
+            tpl, lang = rng.choice(_EN), "en"
+        elif roll < 0.8:
+            tpl, lang = rng.choice(_HINGLISH), "en"
+        else:
+            tpl, lang = rng.choice(_HI), "hi"
+        a = rng.choice(misspelt) if rng.random() < 0.3 else rng.choice(attrs)
+        c = rng.choice(_HI_CATS) if lang == "hi" else rng.choice(cats)
+        text = tpl.format(p=rng.choice(projects), a=a, c=c)
+        if lang == "en" and rng.random() < 0.15:
+            text = _typo(rng, text)
+        if rng.random() < 0.1:
+            text = text.capitalize() + rng.choice(["?", ".", "!", ""])
+        out.setdefault(text, lang)
+    return list(out.items())
+
+
+def _low(text: str, lang: str) -> str:
+    return " ".join(normalize(text, lang).lower().split())
+
+
+def build_cases(texts: List[Tuple[str, str]], clf=None) -> Dict[str, Case]:
+    low = [(_low(t, l),) for t, l in texts]
+    local = threading.local()
+
+    def route(text, lang):
+        ctx = getattr(local, "ctx", None)
+        if ctx is None:
+            ctx = local.ctx = DialogueCtx()
+        return nlu_router(text, lang, ctx)
+
+    cases: Dict[str, Case] = {
+        "normalize": (normalize, list(texts)),
+        "detect_project": (_ef.detect_project, low),
+        "detect_category": (_ef.detect_category, low),
+        "detect_attribute": (_attr.detect_attribute, low),
+        "match_entities": (entity_index.match_entities, low),
+        "rule_intent": (dialogue._rule_intent, low),
+    }
+    if clf is not None:
+        cases["sbert_predict"] = (clf.predict, low)
+    cases["nlu_router"] = (route, [(normalize(t, l), l) for t, l in texts])
+    return cases
+
+
+@contextmanager
+def caches(enabled: bool, clf=None):
+    """Run with the per-utterance caches on (as deployed) or bypassed (every call computes)."""
+    idx = entity_index.get_index()
+    cached, size = idx.match, getattr(clf, "_cache_max", None)
+    if not enabled:
+        idx.match = idx._match
+        if clf is not None:
+            clf._cache.clear()
+            clf._cache_max = 0
+    try:
+        yield
+    finally:
+        idx.match = cached
+        if clf is not None:
+            clf._cache_max = size
+
+
+# ---- measurements ----
+def ns_per_op(fn: Callable, args: List[tuple], repeat: int) -> float:
+    for a in args:
+        fn(*a)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        for a in args:
+            fn(*a)
+        best = min(best, (time.perf_counter_ns() - t0) / len(args))
+    return best
+
+
+def alloc_per_op(fn: Callable, args: List[tuple]) -> dict:
+    """Mean tracemalloc high-water above the starting point per call, and net bytes kept per call."""
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        peaks = 0
+        for a in args:
+            cur, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn(*a)
+            peaks += tracemalloc.get_traced_memory()[1] - cur
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_b": round(peaks / len(args)), "retained_b": round((end - start) / len(args), 1)}
+
+
+def throughput(fn: Callable, args: List[tuple], threads: int, seconds: float) -> float:
+    """ops/s with `threads` workers looping over the corpus (each from its own offset)."""
+    counts = [0] * threads
+    stop = threading.Event()
+    gate = threading.Barrier(threads + 1)
+
+    def worker(k):
+        i = (k * len(args)) // threads
+        n = 0
+        gate.wait()
+        while not stop.is_set():
+            fn(*args[i])
+            i = (i + 1) % len(args)
+            n += 1
+        counts[k] = n
+
+    ts = [threading.Thread(target=worker, args=(k,), daemon=True) for k in range(threads)]
+    for t in ts:
+        t.start()
+    gate.wait()
+    t0 = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for t in ts:
+        t.join()
+    return sum(counts) / (time.perf_counter() - t0)
+
+
+def compare(cur: dict, base: dict, max_regress: float) -> List[str]:
+    out = []
+    for name, r in cur["cases"].items():
+        b = base.get("cases", {}).get(name)
+        if not b:
+            continue
+        if b.get("ns_op") and r["ns_op"] > b["ns_op"] * (1 + max_regress):
+            out.append(f"{name} ns/op {b['ns_op']} -> {r['ns_op']} ({r['ns_op'] / b['ns_op'] - 1:+.0%})")
+        for th, ops in r.get("ops_s", {}).items():
+            old = b.get("ops_s", {}).get(th)
+            if old and ops < old * (1 - max_regress):
+                out.append(f"{name} {th} threads ops/s {old} -> {ops} ({ops / old - 1:+.0%})")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="NLU hot-path microbenchmarks")
+    ap.add_argument("--size", type=int, default=600, help="generated corpus size")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--repeat", type=int, default=5, help="timed passes for ns/op (best is kept)")
+    ap.add_argument("--threads", default="1,8,64")
+    ap.add_argument("--seconds", type=float, default=1.0, help="per throughput level")
+    ap.add_argument("--only", help="comma-separated case names")
+    ap.add_argument("--no-sbert", action="store_true")
+    ap.add_argument("--warm", action="store_true", help="keep caches between passes")
+    ap.add_argument("--out", help="write the JSON report here")
+    ap.add_argument("--baseline", help="earlier --out report to compare against")
+    ap.add_argument("--max-regress", type=float, default=0.15)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    texts = corpus(args.size, args.seed)
+    clf = None if args.no_sbert else dialogue.load_classifier()
+    skipped = {} if clf is not None or args.no_sbert else \
+        {"sbert_predict": f"classifier unavailable ({dialogue.classifier_state()})"}
+    cases = build_cases(texts, clf)
+    if args.only:
+        keep = set(args.only.split(","))
+        cases = {k: v for k, v in cases.items() if k in keep}
+    levels = [int(x) for x in args.threads.split(",") if x.strip()]
+
+    report = {"corpus": {"size": len(texts), "seed": args.seed,
+                         "hi": sum(1 for _, l in texts if l == "hi")},
+              "warm": args.warm, "python": sys.version.split()[0], "skipped": skipped, "cases": {}}
+    if not args.json:
+        print(f"corpus={len(texts)} (hi={report['corpus']['hi']}) warm={args.warm}")
+    with caches(args.warm, clf):
+        for name, (fn, xs) in cases.items():
+            r = {"ns_op": round(ns_per_op(fn, xs, args.repeat))}
+            r.update(alloc_per_op(fn, xs))
+            r["ops_s"] = {str(n): round(throughput(fn, xs, n, args.seconds)) for n in levels}
+            report["cases"][name] = r
+            if not args.json:
+                ops = "  ".join(f"{n}t {v:>9}/s" for n, v in r["ops_s"].items())
+                print(f"  {name:17s} {r['ns_op']:>10} ns/op  peak {r['peak_b']:>7} B/op  "
+                      f"kept {r['retained_b']:>7} B/op  {ops}", flush=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        if (base.get("corpus"), base.get("warm")) != (report["corpus"], report["warm"]):
+            print(f"  NOTE baseline ran with corpus={base.get('corpus')} warm={base.get('warm')}", file=sys.stderr)
+        regressions = compare(report, base, args.max_regress)
+        report["regressions"] = regressions
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        for name, why in skipped.items():
+            print(f"  SKIPPED {name}: {why}")
+        for r in regressions:
+            print(f"  REGRESSION {r}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+# tools/bench_pipeline.py
+# Offline end-to-end benchmark: recorded utterances through
+# stt.transcribe -> normalize -> nlu_router -> tts, no sound devices.
+#
+#   python -m tools.bench_pipeline samples/ --out runs/today.json
+#   python -m tools.bench_pipeline samples/ --baseline runs/last.json --max-regress 0.10
+#
+# samples/ holds WAVs plus their expectations, either
+#   manifest.jsonl   {"audio": "a.wav", "text": "...", "intent": "...", "project": "...",
+#                     "category": "...", "attribute": "...", "session": "call1", "tenant": "ashar"}
+# or one sidecar per clip: a.json (same keys, "audio" implied) or a.txt (transcript only).
+# Every key but "audio" is optional; items sharing a "session" run in order
+# through one Session (dialogue context carries over), others get a fresh one.
+#
+# Reports per-stage latency percentiles, real-time factor, CPU time, peak RSS,
+# WER and intent/entity accuracy; JSON output can be compared against a
+# baseline run, exiting 1 on regressions beyond the thresholds.
+import os
+import re
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List
+
+from utils import stt, tts, startup, metrics
+from utils.normalizer import normalize
+from utils.dialogue import nlu_router, T
+from utils.session import Session
+
+ENTITY_KEYS = ("project", "category", "attribute")
+STAGES = ("stt", "normalize", "nlu", "tts", "total")
+_WORD_DROP = re.compile(r"[^\w\s]+")
+
+
+# ---- corpus ----
+def load_corpus(root: str) -> List[dict]:
+    manifest = os.path.join(root, "manifest.jsonl")
+    items: List[dict] = []
+    if os.path.isfile(manifest):
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    items.append(json.loads(line))
+    else:
+        for wav in sorted(glob.glob(os.path.join(root, "*.wav"))):
+            stem = os.path.splitext(wav)[0]
+            item = {"audio": os.path.basename(wav)}
+            if os.path.isfile(stem + ".json"):
+                with open(stem + ".json", "r", encoding="utf-8") as f:
+                    item.update(json.load(f))
+            elif os.path.isfile(stem + ".txt"):
+                with open(stem + ".txt", "r", encoding="utf-8") as f:
+                    item["text"] = f.read().strip()
+            items.append(item)
+    for it in items:
+        it["audio"] = os.path.join(root, it["audio"])
+    return items
+
+
+# ---- scoring ----
+def _words(text: str) -> List[str]:
+    text = unicodedata.normalize("NFC", (text or "").replace("।", " ")).lower()
+    return _WORD_DROP.sub(" ", text).split()
+
+
+def word_errors(ref: str, hyp: str):
+    """(edit distance in words, reference length)."""
+    r, h = _words(ref), _words(hyp)
+    prev = list(range(len(h) + 1))
+    for i, rw in enumerate(r, 1):
+        cur = [i] + [0] * len(h)
+        for j, hw in enumerate(h, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (rw != hw))
+        prev = cur
+    return prev[-1], len(r)
+
+
+def _pct(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q / 100.0 * (len(xs) - 1))))]
+
+
+def _summary(xs: List[float]) -> dict:
+    return {"n": len(xs), "mean": round(sum(xs) / len(xs), 2) if xs else 0.0,
+            **{f"p{q}": round(_pct(xs, q), 2) for q in (50, 95, 99)}}
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+# ---- run ----
+def run_item(item: dict, sess: Session, audio, do_tts: bool) -> dict:
+    """One utterance through the pipeline; returns timings (ms) and what the bot heard/understood."""
+    ms, cpu = {}, {}
+
+    def timed(name, fn, *a):
+        t0, c0 = time.perf_counter(), time.process_time()
+        with metrics.span(name):
+            out = fn(*a)
+        ms[name] = (time.perf_counter() - t0) * 1000
+        cpu[name] = (time.process_time() - c0) * 1000
+        return out
+
+    with metrics.turn(sess.id, sess.next_turn()) as tr:
+        text, lang, p = timed("stt", stt.transcribe, audio)
+        decodes = stt.last_turn_stats().decodes
+        if text and text.strip():
+            ntext = timed("normalize", normalize, text, lang)
+            reply, _ = timed("nlu", nlu_router, ntext, lang, sess.ctx)
+            nlu = sess.ctx.nlu   # the router's own result, scored without running NLU again
+        else:
+            ntext, nlu = "", None
+            reply = T["reprompt"]["hi" if lang == "hi" else "en"]
+        if do_tts:
+            timed("tts", tts.synthesize_pcm, reply, lang)
+    ms["total"] = tr.total_ms
+    return {"text": text, "lang": lang, "p": round(p, 3), "decodes": decodes,
+            "intent": sess.ctx.last_intent if nlu else None,
+            "entities": {k: getattr(nlu, k) for k in ENTITY_KEYS} if nlu else {},
+            "ms": ms, "cpu_ms": cpu}
+
+
+def bench(items: List[dict], repeat: int = 1, do_tts: bool = True) -> dict:
+    audios = {it["audio"]: stt._as_audio(it["audio"]) for it in items}
+    groups: "OrderedDict[str, List[dict]]" = OrderedDict()
+    for i, it in enumerate(items):
+        groups.setdefault(it.get("session") or f"_{i}", []).append(it)
+
+    lat: Dict[str, List[float]] = {s: [] for s in STAGES}
+    cpu_stage: Dict[str, float] = {s: 0.0 for s in STAGES if s != "total"}
+    edits = ref_words = 0
+    intent_hit = intent_n = 0
+    ent_hit = {k: 0 for k in ENTITY_KEYS}
+    ent_n = {k: 0 for k in ENTITY_KEYS}
+    audio_sec = stt_sec = wall_sec = 0.0
+    decodes = []
+    failures = []
+
+    c0, t0 = time.process_time(), time.perf_counter()
+    for _ in range(repeat):
+        for turns in groups.values():
+            sess = Session(tenant=turns[0].get("tenant") or "ashar")
+            for it in turns:
+                x = audios[it["audio"]]
+                r = run_item(it, sess, x, do_tts)
+                for s, v in r["ms"].items():
+                    lat[s].append(v)
+                for s, v in r["cpu_ms"].items():
+                    cpu_stage[s] += v
+                audio_sec += len(x) / stt.SAMPLE_RATE
+                stt_sec += r["ms"]["stt"] / 1000
+                wall_sec += r["ms"]["total"] / 1000
+                decodes.append(r["decodes"])
+                miss = []
+                if "text" in it:
+                    e, n = word_errors(it["text"], r["text"])
+                    edits, ref_words = edits + e, ref_words + n
+                if it.get("intent"):
+                    intent_n += 1
+                    if r["intent"] == it["intent"]:
+                        intent_hit += 1
+                    else:
+                        miss.append(f"intent {r['intent']}!={it['intent']}")
+                for k in ENTITY_KEYS:
+                    if k in it:
+                        ent_n[k] += 1
+                        if r["entities"].get(k) == it[k]:
+                            ent_hit[k] += 1
+                        else:
+                            miss.append(f"{k} {r['entities'].get(k)}!={it[k]}")
+                if miss:
+                    failures.append({"audio": os.path.basename(it["audio"]), "heard": r["text"], "miss": miss})
+    cpu_total = time.process_time() - c0
+    elapsed = time.perf_counter() - t0
+
+    ent_total = sum(ent_n.values())
+    return {
+        "utterances": len(lat["stt"]),
+        "audio_sec": round(audio_sec, 2),
+        "latency_ms": {s: _summary(v) for s, v in lat.items() if v},
+        "rtf": {"stt": round(stt_sec / audio_sec, 4) if audio_sec else None,
+                "pipeline": round(wall_sec / audio_sec, 4) if audio_sec else None},
+        "cpu_sec": {"total": round(cpu_total, 2), "wall": round(elapsed, 2),
+                    "per_audio_sec": round(cpu_total / audio_sec, 3) if audio_sec else None,
+                    **{s: round(v / 1000, 2) for s, v in cpu_stage.items()}},
+        "peak_rss_mb": _rss_mb(),
+        "wer": round(edits / ref_words, 4) if ref_words else None,
+        "intent_acc": round(intent_hit / intent_n, 4) if intent_n else None,
+        "entity_acc": {**{k: round(ent_hit[k] / ent_n[k], 4) for k in ENTITY_KEYS if ent_n[k]},
+                       "all": round(sum(ent_hit.values()) / ent_total, 4) if ent_total else None},
+        "stt_decodes_per_utt": round(sum(decodes) / len(decodes), 2) if decodes else None,
+        "spans": metrics.snapshot(),
+        "failures": failures[:50],
+    }
+
+
+def _meta(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "corpus": args.corpus,
+            "repeat": args.repeat, "model": args.model, "tts": not args.no_tts,
+            "tts_cache": tts.USE_CACHE, "lid_mode": stt.LID_MODE,
+            "python": platform.python_version(), "cpus": os.cpu_count(), "host": platform.node()}
+
+
+# ---- regression check ----
+def compare(cur: dict, base: dict, max_regress: float, max_acc_drop: float) -> List[str]:
+    """Human-readable regressions of cur vs base (empty list = pass)."""
+    out = []
+
+    def worse(label, new, old, higher_is_worse=True):
+        if new is None or old is None or old == 0:
+            return
+        rel = (new - old) / abs(old) if higher_is_worse else (old - new) / abs(old)
+        if rel > max_regress:
+            out.append(f"{label}: {old} -> {new} ({rel:+.0%})")
+
+    for s, v in cur["latency_ms"].items():
+        b = base.get("latency_ms", {}).get(s)
+        if b:
+            worse(f"latency {s} p50", v["p50"], b["p50"])
+            worse(f"latency {s} p95", v["p95"], b["p95"])
+    for k in ("stt", "pipeline"):
+        worse(f"rtf {k}", cur["rtf"].get(k), base.get("rtf", {}).get(k))
+    worse("cpu per audio sec", cur["cpu_sec"].get("per_audio_sec"), base.get("cpu_sec", {}).get("per_audio_sec"))
+    worse("peak rss", cur.get("peak_rss_mb"), base.get("peak_rss_mb"))
+
+    def dropped(label, new, old, higher_is_worse=False):
+        if new is None or old is None:
+            return
+        delta = (new - old) if higher_is_worse else (old - new)
+        if delta > max_acc_drop:
+            out.append(f"{label}: {old} -> {new}")
+
+    dropped("wer", cur.get("wer"), base.get("wer"), higher_is_worse=True)
+    dropped("intent accuracy", cur.get("intent_acc"), base.get("intent_acc"))
+    dropped("entity accuracy", cur["entity_acc"].get("all"), base.get("entity_acc", {}).get("all"))
+    return out
+
+
+def _print(rep: dict):
+    print(f"utterances={rep['utterances']} audio={rep['audio_sec']}s "
+          f"rtf stt={rep['rtf']['stt']} pipeline={rep['rtf']['pipeline']} "
+          f"cpu={rep['cpu_sec']['total']}s peak_rss={rep['peak_rss_mb']} MB")
+    print(f"wer={rep['wer']} intent_acc={rep['intent_acc']} entity_acc={rep['entity_acc']} "
+          f"decodes/utt={rep['stt_decodes_per_utt']}")
+    for s, v in rep["latency_ms"].items():
+        print(f"  {s:10s} p50 {v['p50']:>9.2f}  p95 {v['p95']:>9.2f}  p99 {v['p99']:>9.2f}  ms  (n={v['n']})")
+    for f in rep["failures"][:10]:
+        print(f"  MISS {f['audio']}: {f['heard']!r} {'; '.join(f['miss'])}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline STT -> NLU -> TTS benchmark over recorded utterances")
+    ap.add_argument("corpus", help="directory of WAVs + manifest.jsonl or per-clip .json/.txt")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--model", default="small", help="Whisper size")
+    ap.add_argument("--no-tts", action="store_true", help="skip synthesis (e.g. no Piper on this host)")
+    ap.add_argument("--no-tts-cache", action="store_true", help="synthesize every reply (cold TTS numbers)")
+    ap.add_argument("--out", help="write the JSON report here")
+    ap.add_argument("--baseline", help="earlier --out report to compare against")
+    ap.add_argument("--max-regress", type=float, default=0.10, help="allowed relative latency/RTF/CPU/RSS increase")
+    ap.add_argument("--max-acc-drop", type=float, default=0.02, help="allowed absolute WER rise / accuracy drop")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args()
+
+    items = load_corpus(args.corpus)
+    if not items:
+        sys.exit(f"no utterances found in {args.corpus}")
+    if args.no_tts_cache:
+        tts.USE_CACHE = False
+    metrics.TRACE_PATH = None
+
+    comps = ("stt", "nlu") if args.no_tts else startup.COMPONENTS
+    startup.start(comps, stt_kwargs={"model_size": args.model, "device": "cpu", "compute_type": "int8"})
+    startup.wait(components=comps)
+    boot = startup.status()
+    metrics.reset()   # warm-up inferences are not part of the run
+
+    rep = {"meta": _meta(args), "startup": boot, **bench(items, args.repeat, not args.no_tts)}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(rep, json.load(f), args.max_regress, args.max_acc_drop)
+        rep["regressions"] = regressions
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False))
+    else:
+        _print(rep)
+        for r in regressions:
+            print(f"  REGRESSION {r}")
+    tts.shutdown()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
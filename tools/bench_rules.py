@@ -0,0 +1,106 @@
+# tools/bench_rules.py
+# Microbenchmark: rule intent + normalizer, old per-call re.* paths vs the
+# precompiled ones in utils/rules.py and utils/normalizer.py.
+#
+#   python -m tools.bench_rules [--repeat 20] [--json]
+#
+# The corpus is every intents.json example plus mixed en/hi/Hinglish turns.
+# Both paths must agree on every turn; the script exits 1 if they don't.
+import re
+import sys
+import json
+import time
+import argparse
+import unicodedata
+from typing import Callable, List
+
+from utils.domain import resolve_intents_path
+from utils.normalizer import normalize
+from utils.rules import RuleSet
+from utils import dialogue
+
+
+# ---- the pre-compilation implementations, kept here as the reference ----
+def legacy_rule_intent(text: str, rules) -> str:
+    for pat, lab in rules:
+        if re.search(pat, text, re.I):
+            return lab
+    return None
+
+
+def legacy_normalize(text: str, lang: str = None) -> str:
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("।", ".")
+    if lang == "hi":
+        text = re.sub(r"[^ऀ-ॿ0-9\s.,?!\-–—():;\"']", "", text)
+    elif lang == "en":
+        text = text.lower()
+        text = re.sub(r"[^a-z0-9\s.,?!\-–—():;\"']", "", text)
+    else:
+        text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+
+def corpus() -> List[str]:
+    with open(resolve_intents_path(), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    out = [x for v in data.values() if isinstance(v, list) for x in v if isinstance(x, str)]
+    out += [
+        "Hello, show me ready to move projects", "aria ka price kya hai?", "Go back please",
+        "mujhe representative se baat karni hai", "WhatsApp pe bhej do", "under construction wale dikhao",
+        "नमस्ते, रेडी टू मूव प्रोजेक्ट्स बताइए।", "वापस जाइए", "कृपया प्रतिनिधि से जोड़िए।",
+        "Ashar Metro — floors kitne hain?", "completed projects", "ok thank you bye", "",
+        "  lots   of    spaces  ", "what is the starting price of titan", "३ बीएचके फ्लैट",
+    ]
+    return out
+
+
+def _ns_per_op(fn: Callable[[str], object], texts: List[str], repeat: int) -> float:
+    for t in texts:
+        fn(t)
+    t0 = time.perf_counter_ns()
+    for _ in range(repeat):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter_ns() - t0) / (repeat * len(texts))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rule engine + normalizer microbenchmark")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    texts = corpus()
+    rules = dialogue._RULES
+    rs = RuleSet(rules)
+    low = [" ".join(t.lower().split()) for t in texts]
+
+    bad = [t for t in low if legacy_rule_intent(t, rules) != rs.first(t)]
+    for lang in ("en", "hi", None):
+        bad += [f"{lang}:{t}" for t in texts if legacy_normalize(t, lang) != normalize(t, lang)]
+
+    cases = {
+        "rules": (lambda t: legacy_rule_intent(t, rules), rs.first, low),
+        "normalize_en": (lambda t: legacy_normalize(t, "en"), lambda t: normalize(t, "en"), texts),
+        "normalize_hi": (lambda t: legacy_normalize(t, "hi"), lambda t: normalize(t, "hi"), texts),
+    }
+    report = {"turns": len(texts), "mismatches": len(bad), "examples": bad[:10]}
+    for name, (old, new, xs) in cases.items():
+        o, n = _ns_per_op(old, xs, args.repeat), _ns_per_op(new, xs, args.repeat)
+        report[name] = {"old_ns": round(o), "new_ns": round(n), "speedup": round(o / n, 2) if n else None}
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print(f"turns={report['turns']} mismatches={report['mismatches']}")
+        for name in cases:
+            r = report[name]
+            print(f"  {name:13s} old {r['old_ns']:>7} ns/op   new {r['new_ns']:>7} ns/op   x{r['speedup']}")
+        for ex in report["examples"]:
+            print(f"  MISMATCH {ex!r}")
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# tools/loadgen.py
+# Replays WAV files against server.py as N concurrent fake callers.
+#
+#   python -m tools.loadgen --calls 16 --wavs samples/ --turns 5
+#
+# Each caller streams a WAV in real time (20 ms frames), adds trailing
+# silence, sends {"type": "eou"}, then waits for "reply_end". Reported
+# latencies are measured from the end of the caller's speech. The default
+# tail stays under the server's END_SILENCE_MS so the eou is what closes the
+# turn; with a longer tail the server's VAD closes it first and ignores the eou.
+import os
+import sys
+import json
+import time
+import glob
+import random
+import asyncio
+import argparse
+from typing import List
+
+import numpy as np
+import soundfile as sf
+import websockets
+
+SR = 16000
+FRAME = SR // 50  # 20 ms
+
+
+def _load(path: str) -> bytes:
+    wav, rate = sf.read(path, dtype="float32", always_2d=False)
+    if wav.ndim > 1:
+        wav = wav[:, 0]
+    if rate != SR:
+        n_out = int(round(len(wav) * SR / float(rate)))
+        wav = np.interp(np.linspace(0, len(wav), n_out, endpoint=False),
+                        np.arange(len(wav)), wav).astype(np.float32)
+    return (np.clip(wav, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def _pct(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q / 100.0 * (len(xs) - 1))))]
+
+
+async def caller(idx: int, url: str, clips: List[bytes], turns: int, tail_ms: int,
+                 realtime: bool, results: list):
+    silence = b"\x00\x00" * (SR * tail_ms // 1000)
+    rng = random.Random(idx)
+    try:
+        async with websockets.connect(url, max_size=2 ** 22) as ws:
+            for _ in range(turns):
+                pcm = rng.choice(clips) + silence
+                step = FRAME * 2
+                for i in range(0, len(pcm), step):
+                    await ws.send(pcm[i:i + step])
+                    if realtime:
+                        await asyncio.sleep(FRAME / SR)
+                t_eos = time.monotonic()
+                await ws.send(json.dumps({"type": "eou"}))
+
+                t_first, audio_bytes, rec = None, 0, {"caller": idx}
+                while True:
+                    msg = await ws.recv()
+                    if isinstance(msg, bytes):
+                        audio_bytes += len(msg)
+                        if t_first is None:
+                            t_first = time.monotonic()
+                        continue
+                    ev = json.loads(msg)
+                    if ev["type"] == "transcript":
+                        rec["text"] = ev.get("text")
+                        rec["t_transcript"] = time.monotonic() - t_eos
+                    elif ev["type"] == "reply_end":
+                        rec["t_first_audio"] = ((t_first or time.monotonic()) - t_eos)
+                        rec["t_reply_end"] = time.monotonic() - t_eos
+                        rec["reply_audio_s"] = audio_bytes / 2 / SR
+                        rec["intent"] = ev.get("intent")
+                        break
+                results.append(rec)
+            await ws.send(json.dumps({"type": "hangup"}))
+    except Exception as e:
+        results.append({"caller": idx, "error": f"{type(e).__name__}: {e}"})
+
+
+async def run(args) -> dict:
+    paths = sorted(glob.glob(os.path.join(args.wavs, "*.wav"))) if os.path.isdir(args.wavs) else [args.wavs]
+    if not paths:
+        sys.exit(f"no WAVs under {args.wavs}")
+    clips = [_load(p) for p in paths]
+    results: list = []
+    t0 = time.monotonic()
+    await asyncio.gather(*(caller(i, args.url, clips, args.turns, args.tail_ms,
+                                  not args.fast, results) for i in range(args.calls)))
+    wall = time.monotonic() - t0
+
+    ok = [r for r in results if "error" not in r]
+    summary = {"calls": args.calls, "turns_ok": len(ok),
+               "errors": len(results) - len(ok), "wall_s": round(wall, 2),
+               "turns_per_s": round(len(ok) / wall, 2) if wall else 0.0}
+    for key in ("t_transcript", "t_first_audio", "t_reply_end"):
+        xs = [r[key] * 1000 for r in ok if key in r]
+        summary[key + "_ms"] = {f"p{q}": round(_pct(xs, q), 1) for q in (50, 95, 99)}
+    errs = [r["error"] for r in results if "error" in r]
+    if errs:
+        summary["first_errors"] = errs[:5]
+    return summary
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Concurrent fake callers for server.py")
+    ap.add_argument("--url", default="ws://127.0.0.1:8765/?lang=en")
+    ap.add_argument("--wavs", required=True, help="WAV file or directory of WAVs")
+    ap.add_argument("--calls", type=int, default=8, help="concurrent callers")
+    ap.add_argument("--turns", type=int, default=3, help="utterances per caller")
+    ap.add_argument("--tail-ms", type=int, default=300,
+                    help="silence appended after each clip (keep below END_SILENCE_MS)")
+    ap.add_argument("--fast", action="store_true", help="send audio as fast as possible (no real-time pacing)")
+    ap.add_argument("--out", help="write the JSON summary here too")
+    args = ap.parse_args()
+
+    summary = asyncio.run(run(args))
+    text = json.dumps(summary, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
 # utils/audio.py
 import time
 import threading
+import contextvars
 import queue
+import collections
+from typing import Optional, Iterable, Tuple
 import numpy as np
-import sounddevice as sd
 import soundfile as sf
 
+from utils import metrics
+
+# Sound devices are optional: the network server endpoints and resamples
+# audio with this module on hosts that have no PortAudio at all.
+try:
+    import sounddevice as sd
+    HAVE_SD = True
+except Exception:
+    sd = None
+    HAVE_SD = False
+
 try:
     import webrtcvad
     HAVE_VAD = True
@@ -20,12 +33,22 @@ try:
     VAD_AGGR = int(getattr(CFG, "BARGE_IN_VAD_AGGR", 2))
     MIN_MS = int(getattr(CFG, "BARGE_IN_MIN_MS", 250))
     GRACE_MS = int(getattr(CFG, "BARGE_IN_START_GRACE_MS", 300))
+    CAPTURE_VAD_AGGR = int(getattr(CFG, "CAPTURE_VAD_AGGR", 2))
+    SPEECH_START_MS = int(getattr(CFG, "SPEECH_START_MS", 120))
+    END_SILENCE_MS = int(getattr(CFG, "END_SILENCE_MS", 500))
+    MAX_UTTERANCE_SEC = float(getattr(CFG, "MAX_UTTERANCE_SEC", 12))
+    PRE_ROLL_MS = int(getattr(CFG, "PRE_ROLL_MS", 200))
 except Exception:
     SR = 16000
     BARGE_IN_ENABLED = True
     VAD_AGGR = 2
     MIN_MS = 250
     GRACE_MS = 300
+    CAPTURE_VAD_AGGR = 2
+    SPEECH_START_MS = 120
+    END_SILENCE_MS = 500
+    MAX_UTTERANCE_SEC = 12.0
+    PRE_ROLL_MS = 200
 
 FRAME_MS = 20
 IN_BLOCK = int(SR * FRAME_MS / 1000)     # samples per input frame
@@ -37,7 +60,11 @@ def _to_mono(x: np.ndarray) -> np.ndarray:
         return x
     return x[:, 0]
 
-def _resample_linear(wav: np.ndarray, in_sr: int, out_sr: int) -> np.ndarray:
+def _pcm16(mono: np.ndarray) -> bytes:
+    """float32 [-1,1] -> int16 bytes (what WebRTC-VAD expects)."""
+    return np.clip(mono * 32768.0, -32768, 32767).astype(np.int16).tobytes()
+
+def resample_linear(wav: np.ndarray, in_sr: int, out_sr: int) -> np.ndarray:
     """Lightweight linear resampler to avoid SciPy dependency."""
     if in_sr == out_sr or wav.size == 0:
         return wav.astype(np.float32, copy=False)
@@ -54,7 +81,7 @@ def _simple_play(path: str):
     wav, rate = sf.read(path, dtype="float32", always_2d=False)
     wav = _to_mono(wav)
     if rate != SR:
-        wav = _resample_linear(wav, rate, SR)
+        wav = resample_linear(wav, rate, SR)
     sd.play(wav, SR)
     sd.wait()
 
@@ -65,27 +92,61 @@ def play_with_barge_in(path: str, enable_barge_in: bool = True) -> bool:
     Returns True if interrupted by barge-in, else False.
     """
     if not enable_barge_in or not BARGE_IN_ENABLED or not HAVE_VAD:
-        _simple_play(path)
+        with metrics.span("play"):
+            _simple_play(path)
         return False
 
-    # Prepare playback buffer (mono, SR)
     wav, rate = sf.read(path, dtype="float32", always_2d=False)
-    wav = _to_mono(wav)
-    if rate != SR:
-        wav = _resample_linear(wav, rate, SR)
+    return play_stream([(wav, rate)], enable_barge_in=True)
+
+def play_stream(chunks: Iterable[Tuple[np.ndarray, int]], enable_barge_in: bool = True) -> bool:
+    """
+    Plays (pcm, rate) chunks as they arrive (e.g. tts.synthesize_stream), so
+    the first sentence is audible while later ones are still synthesizing.
+    With barge-in on, sustained mic speech stops playback and abandons the
+    remaining chunks. Returns True if interrupted by barge-in, else False.
+    """
+    barge_in = enable_barge_in and BARGE_IN_ENABLED and HAVE_VAD
+    t0 = time.perf_counter()
+    t_first = None   # first real audio handed to the device
 
     out_q: queue.Queue[np.ndarray] = queue.Queue(maxsize=32)
     stop_flag = threading.Event()
     barged = threading.Event()
     playback_done = threading.Event()
 
-    # Chunk the wav into ~40 ms pieces for responsive writes
+    # Chunk into ~40 ms pieces for responsive writes
     CHUNK = int(SR * 0.04)  # 40 ms
-    for i in range(0, len(wav), CHUNK):
-        out_q.put(wav[i:i+CHUNK].astype(np.float32))
-    out_q.put(None)  # sentinel
+
+    def _put(item) -> bool:
+        while not stop_flag.is_set():
+            try:
+                out_q.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        it = iter(chunks)
+        try:
+            for wav, rate in it:
+                wav = _to_mono(np.asarray(wav, dtype=np.float32))
+                if rate != SR:
+                    wav = resample_linear(wav, rate, SR)
+                for i in range(0, len(wav), CHUNK):
+                    if not _put(wav[i:i+CHUNK].astype(np.float32)):
+                        return
+        except Exception as e:
+            print(f"[Audio] stream source failed: {e}")
+        finally:
+            close = getattr(it, "close", None)
+            if close:
+                close()  # barge-in: don't synthesize what won't be played
+            _put(None)  # sentinel
 
     def _out_cb(outdata, frames, time_info, status):
+        nonlocal t_first
         if status:
             # buffer underrun/overrun; continue
             pass
@@ -95,14 +156,15 @@ def play_with_barge_in(path: str, enable_barge_in: bool = True) -> bool:
         try:
             chunk = out_q.get_nowait()
         except queue.Empty:
+            # next sentence still synthesizing: play silence and keep going
             outdata[:] = 0
-            # queue drained unexpectedly; mark done and stop
-            playback_done.set()
-            raise sd.CallbackStop()
+            return
         if chunk is None:
             outdata[:] = 0
             playback_done.set()     # <— mark natural end
             raise sd.CallbackStop()
+        if t_first is None:
+            t_first = time.perf_counter()
         if len(chunk) < frames:
             out = np.zeros(frames, dtype=np.float32)
             out[:len(chunk)] = chunk
@@ -121,9 +183,7 @@ def play_with_barge_in(path: str, enable_barge_in: bool = True) -> bool:
             if stop_flag.is_set():
                 raise sd.CallbackStop()
             mono = _to_mono(indata)
-            # convert float32 [-1,1] -> int16 bytes
-            pcm16 = np.clip(mono * 32768.0, -32768, 32767).astype(np.int16).tobytes()
-            ok = vad.is_speech(pcm16, sample_rate=SR)
+            ok = vad.is_speech(_pcm16(mono), sample_rate=SR)
             seen_frames += 1
 
             # ignore startup to avoid self-trigger
@@ -144,19 +204,122 @@ def play_with_barge_in(path: str, enable_barge_in: bool = True) -> bool:
             while not stop_flag.is_set() and not playback_done.is_set():
                 time.sleep(0.01)
 
-    watcher = threading.Thread(target=mic_watch, daemon=True)
-    watcher.start()
+    # the producer runs the TTS generator: keep its spans in this turn's trace
+    feeder = threading.Thread(target=contextvars.copy_context().run, args=(producer,), daemon=True)
+    feeder.start()
+
+    watcher = None
+    if barge_in:
+        watcher = threading.Thread(target=mic_watch, daemon=True)
+        watcher.start()
 
     # Start playback stream
     with sd.OutputStream(samplerate=SR, channels=1, dtype="float32",
-                         blocksize=int(SR * 0.04), callback=_out_cb):
+                         blocksize=CHUNK, callback=_out_cb):
         # Wait until either barge-in or natural end
         while not (stop_flag.is_set() or playback_done.is_set()):
             time.sleep(0.01)
 
-    # Ensure mic watcher exits
+    # Ensure mic watcher and feeder exit
     stop_flag.set()
-    # give mic thread a moment to exit cleanly
-    watcher.join(timeout=0.5)
+    # give threads a moment to exit cleanly
+    if watcher:
+        watcher.join(timeout=0.5)
+    feeder.join(timeout=0.5)
 
+    if t_first is not None:
+        metrics.observe("play.first_audio", t_first - t0, start=t0)
+    if barged.is_set():
+        metrics.inc("barge_ins")
+    metrics.observe("play", time.perf_counter() - t0, start=t0, barged=barged.is_set())
     return barged.is_set()
+
+# ---- Streaming capture with VAD endpointing ----
+class Endpointer:
+    """
+    Frame-level speech endpointer on top of WebRTC-VAD.
+    Feed fixed FRAME_MS float32 frames; feed() returns the finished
+    utterance (mono float32 @ SR) once trailing silence or the length
+    cap closes the turn, else None.
+    """
+    def __init__(self, sr: int = SR,
+                 vad_aggr: int = CAPTURE_VAD_AGGR,
+                 start_ms: int = SPEECH_START_MS,
+                 end_silence_ms: int = END_SILENCE_MS,
+                 max_sec: float = MAX_UTTERANCE_SEC,
+                 pre_roll_ms: int = PRE_ROLL_MS):
+        if not HAVE_VAD:
+            raise RuntimeError("webrtcvad is not installed; streaming capture unavailable.")
+        self.sr = sr
+        self.vad = webrtcvad.Vad(vad_aggr)
+        self.start_frames = max(1, start_ms // FRAME_MS)
+        self.end_frames = max(1, end_silence_ms // FRAME_MS)
+        self.max_frames = max(1, int(max_sec * 1000) // FRAME_MS)
+        # ring keeps pre-roll + the onset run so the first phoneme isn't clipped
+        self._ring = collections.deque(maxlen=max(0, pre_roll_ms // FRAME_MS) + self.start_frames)
+        self.reset()
+
+    def reset(self):
+        self._ring.clear()
+        self._frames = []
+        self._voiced_run = 0
+        self._silence_run = 0
+        self.triggered = False
+
+    def feed(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        frame = _to_mono(frame).astype(np.float32, copy=False)
+        voiced = self.vad.is_speech(_pcm16(frame), sample_rate=self.sr)
+
+        if not self.triggered:
+            self._ring.append(frame)
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run >= self.start_frames:
+                self.triggered = True
+                self._frames = list(self._ring)
+                self._ring.clear()
+            return None
+
+        self._frames.append(frame)
+        self._silence_run = 0 if voiced else self._silence_run + 1
+        if self._silence_run >= self.end_frames or len(self._frames) >= self.max_frames:
+            # drop most of the trailing silence, keep a short tail for STT
+            keep = len(self._frames) - max(0, self._silence_run - 5)
+            utt = np.concatenate(self._frames[:keep]).astype(np.float32, copy=False)
+            self.reset()
+            return utt
+        return None
+
+    def flush(self) -> Optional[np.ndarray]:
+        """Force-close the current turn (e.g. explicit end-of-utterance); None if no speech started."""
+        utt = np.concatenate(self._frames).astype(np.float32, copy=False) if self.triggered else None
+        self.reset()
+        return utt
+
+def record_utterance(timeout_sec: Optional[float] = None, sr: int = SR) -> Optional[np.ndarray]:
+    """
+    Streams the mic through an Endpointer and returns one utterance as
+    mono float32 @ sr, in memory. Starts on speech onset, stops after
+    END_SILENCE_MS of trailing silence or MAX_UTTERANCE_SEC.
+    Returns None if no speech started within timeout_sec (None = wait forever).
+    """
+    ep = Endpointer(sr=sr)
+    block = int(sr * FRAME_MS / 1000)
+    frames_q: queue.Queue = queue.Queue()
+
+    def _on_input(indata, frames, time_info, status):
+        frames_q.put(indata[:, 0].copy())
+
+    deadline = (time.monotonic() + timeout_sec) if timeout_sec else None
+    with sd.InputStream(samplerate=sr, channels=1, dtype="float32",
+                        blocksize=block, callback=_on_input):
+        while True:
+            try:
+                frame = frames_q.get(timeout=0.1)
+            except queue.Empty:
+                frame = None
+            if frame is not None and len(frame) == block:
+                utt = ep.feed(frame)
+                if utt is not None:
+                    return utt
+            if deadline and not ep.triggered and time.monotonic() > deadline:
+                return None
@@ -1,9 +1,23 @@
 # utils/dialogue.py
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional, Tuple, Dict, List
 import os
 import re
 import json
+import time
+import weakref
+import threading
+
+# ---- NLU pipeline config ----
+try:
+    import config as CFG
+    NLU_STAGES = tuple(getattr(CFG, "NLU_STAGES", ("entities", "rules", "sbert")))
+    NLU_SBERT_THRESHOLD = float(getattr(CFG, "NLU_SBERT_THRESHOLD", 0.55))
+    NLU_ENTITY_SHORTCUT = bool(getattr(CFG, "NLU_ENTITY_SHORTCUT", True))
+except Exception:
+    NLU_STAGES = ("entities", "rules", "sbert")
+    NLU_SBERT_THRESHOLD = 0.55
+    NLU_ENTITY_SHORTCUT = True
 
 # ---- Entity / attribute detectors from your project ----
 try:
@@ -30,6 +44,13 @@ except Exception:
             return "towers"
         return None
 
+# One-pass compiled matcher (same answers as the three detectors above)
+try:
+    from utils.entity_index import match_entities
+except Exception:
+    def match_entities(text: str):
+        return detect_project(text), detect_category(text), detect_attribute(text)
+
 # ---- Optional classifier to keep it NON rule-only ----
 def _load_classifier(intents_path: str):
     try:
@@ -61,43 +82,41 @@ def _predict_intent(clf, text: str, threshold: float = 0.55) -> Tuple[str, float
     return ("fallback", 0.0)
 
 # ---- Resolve and load data/intents.json robustly ----
-def _resolve_intents_path() -> str:
-    try:
-        import config as CFG
-        p = getattr(CFG, "INTENTS_PATH", None)
-        if p and os.path.exists(p):
-            return os.path.abspath(p)
-    except Exception:
-        pass
-
-    envp = os.environ.get("INTENTS_PATH")
-    if envp and os.path.exists(envp):
-        return os.path.abspath(envp)
+from utils.rules import RuleSet, parse_rules
+from utils.dialogue_fsm import DialogueMachine
+from utils.domain import resolve_intents_path as _resolve_intents_path, CAT_LABELS, ATTR_LABELS
 
-    here = os.path.dirname(__file__)
-    candidates = [
-        os.path.join(os.getcwd(), "data", "intents.json"),
-        os.path.join(here, "..", "data", "intents.json"),
-        os.path.join(os.getcwd(), "intents.json"),
-    ]
-    for c in candidates:
-        if os.path.exists(c):
-            return os.path.abspath(c)
-
-    raise FileNotFoundError("intents.json not found via config/ENV/fallbacks.")
+from utils import kb, metrics
 
 _INTENTS_PATH = _resolve_intents_path()
-with open(_INTENTS_PATH, "r", encoding="utf-8") as f:
-    _INTENTS_RAW = json.load(f)
-
-# Domain knowledge
-_FACTS: Dict[str, dict] = _INTENTS_RAW.get("project_facts", {})
-_CATS:  Dict[str, List[str]] = _INTENTS_RAW.get("project_categories", {})
-_CFG:   Dict[str, str] = _INTENTS_RAW.get("config", {})
-_PHONE: str = _CFG.get("phone_number", "9999999999")
 
-# Optional classifier
-_CLF = _load_classifier(_INTENTS_PATH)
+# Domain knowledge (facts, categories, phone) lives in utils/kb.py, per tenant
+
+# Optional classifier: built off the import path (utils/startup.py or the
+# first routed turn), rules answer until it is ready.
+_CLF = None
+_CLF_STATE = "idle"        # idle | loading | ready | failed
+_CLF_LOCK = threading.Lock()
+
+def load_classifier():
+    """Build the SBERT classifier once (blocking). Safe to call from many threads."""
+    global _CLF, _CLF_STATE
+    with _CLF_LOCK:
+        if _CLF_STATE in ("ready", "failed"):
+            return _CLF
+        _CLF_STATE = "loading"
+        _CLF = _load_classifier(_INTENTS_PATH)
+        _CLF_STATE = "ready" if _CLF is not None else "failed"
+        return _CLF
+
+def classifier_state() -> str:
+    return _CLF_STATE
+
+def _classifier_nowait():
+    """The classifier if ready; otherwise start loading it in the background and return None."""
+    if _CLF_STATE == "idle":
+        threading.Thread(target=load_classifier, name="nlu-load", daemon=True).start()
+    return _CLF if _CLF_STATE == "ready" else None
 
 # ---- Dialogue state ----
 @dataclass
@@ -110,6 +129,9 @@ class DialogueCtx:
     lang: str = "en"
     greeted: bool = False
     handoff: bool = False
+    intent_source: Optional[str] = None    # rule | entity | sbert | none (last turn)
+    nlu_ms: Dict[str, float] = field(default_factory=dict)  # per-stage timings, last turn
+    nlu: Optional["NLUResult"] = None      # this utterance's entities/intent, last turn
 
 # ---- Copy/text templates (Female 1st-person Hindi; 2nd-person polite-masculine) ----
 T = {
@@ -150,8 +172,12 @@ T = {
         "hi": "ठीक है, मैं अभी आपको प्रतिनिधि से जोड़ रही हूँ।"
     },
     "whatsapp": {
-        "en": f"Please send ‘Hi’ on WhatsApp to {_PHONE}. I’ll share the project details there.",
-        "hi": f"कृपया WhatsApp पर ‘Hi’ भेजिए: {_PHONE}। मैं वहाँ विवरण साझा कर दूँगी।"
+        "en": "Please send ‘Hi’ on WhatsApp to {phone}. I’ll share the project details there.",
+        "hi": "कृपया WhatsApp पर ‘Hi’ भेजिए: {phone}। मैं वहाँ विवरण साझा कर दूँगी।"
+    },
+    "reprompt": {
+        "en": "Sorry, I didn't catch that. Could you please repeat?",
+        "hi": "माफ़ कीजिए, आपकी बात समझ नहीं आई। कृपया दोबारा कहिए।"
     },
     "fallback": {
         "en": "I can help with Ashar’s projects and details (Configuration, Starting price, Floors, Towers). What would you like to know?",
@@ -159,56 +185,37 @@ T = {
     }
 }
 
-CAT_LABELS = {
-    "under_construction": {"en": "Under-Construction", "hi": "अंडर-कंस्ट्रक्शन"},
-    "ready_to_move":      {"en": "Ready-to-Move",      "hi": "रेडी-टू-मूव"},
-    "completed":          {"en": "Completed",          "hi": "कम्प्लीटेड"},
-}
-
-ATTR_LABELS = {
-    "price":  {"en": "Starting from", "hi": "स्टार्टिंग फ्रॉम"},
-    "config": {"en": "Configuration", "hi": "कॉन्फ़िगरेशन"},
-    "floors": {"en": "Floors",        "hi": "फ्लोर्स"},
-    "towers": {"en": "No. of Towers", "hi": "टावर्स"},
-}
-
 # ---- Helpers ----
 def _L(lang: str) -> str:
     return "hi" if lang == "hi" else "en"
 
-def _pretty_list(keys: List[str]) -> str:
-    names = []
-    for k in keys or []:
-        rec = _FACTS.get(k, {})
-        names.append(rec.get("name", k.title()))
-    return ", ".join(names) if names else "—"
+def all_static_replies(lang: str, tenant: Optional[str] = None) -> List[str]:
+    """
+    Every reply nlu_router can produce for this language, fully rendered
+    (templates × categories × projects × attributes). Used to pre-warm TTS.
+    """
+    L = _L(lang)
+    return list(dict.fromkeys(_machine_for(kb.get(tenant)).all_replies(L) + [T["reprompt"][L]]))
 
-def _category_for_project(pkey: Optional[str]) -> Optional[str]:
-    if not pkey:
-        return None
-    rec = _FACTS.get(pkey, {})
-    return rec.get("category")
-
-def _project_answer_all(pkey: str, L: str) -> str:
-    rec = _FACTS.get(pkey, {})
-    return T["proj_details"][L].format(
-        name=rec.get("name", pkey.title()),
-        config=rec.get("config", "—"),
-        price=rec.get("price", "—"),
-        floors=rec.get("floors", "—"),
-        towers=rec.get("towers", "—"),
-    )
-
-def _project_answer_attr(pkey: str, attr: str, L: str) -> Optional[str]:
-    rec = _FACTS.get(pkey, {})
-    if not rec:
-        return None
-    label = ATTR_LABELS.get(attr, {}).get(L, attr.title())
-    value = rec.get(attr)
-    if value in (None, ""):
-        return None
-    name = rec.get("name", pkey.title())
-    return T["attr_answer"][L].format(name=name, label=label, value=value)
+# Dialogue policy per KB version, every static reply rendered once per language.
+# Keyed weakly by the KB object: a reload or LRU eviction frees its tables.
+try:
+    from utils.entity_fuzzy import PROJECT_LIST as _CANON_PROJECTS
+except Exception:
+    _CANON_PROJECTS = []
+_machines: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_machines_lock = threading.Lock()
+
+def _machine_for(base: "kb.KnowledgeBase") -> DialogueMachine:
+    m = _machines.get(base)
+    if m is None:
+        with _machines_lock:
+            m = _machines.get(base)
+            if m is None:
+                m = DialogueMachine(T, base.facts, base.categories, CAT_LABELS, ATTR_LABELS,
+                                    projects=_CANON_PROJECTS, phone=base.phone)
+                _machines[base] = m
+    return m
 
 # Minimal rules fallback + navigation/back
 _RULES = [
@@ -221,17 +228,98 @@ _RULES = [
     (r"\bhi\b|hello|hey|नमस्ते|हेलो|सलाम", "greet"),
 ]
 
+# intents.json "rules" (same shape) replaces the defaults above; edits are
+# picked up on the next turn (one stat() per call, like the STT bias cache)
+_rules_key = None
+_ruleset: Optional[RuleSet] = None
+_rules_lock = threading.Lock()
+
+def _current_rules() -> RuleSet:
+    global _rules_key, _ruleset
+    try:
+        key = os.stat(_INTENTS_PATH).st_mtime_ns
+    except OSError:
+        key = _rules_key
+    if _ruleset is None or key != _rules_key:
+        with _rules_lock:
+            if _ruleset is None or key != _rules_key:
+                try:
+                    with open(_INTENTS_PATH, "r", encoding="utf-8") as f:
+                        raw = json.load(f)
+                except (OSError, ValueError):
+                    raw = {}
+                try:
+                    custom = parse_rules(raw.get("rules") if isinstance(raw, dict) else None)
+                    _ruleset = RuleSet(custom or _RULES)
+                except (re.error, TypeError) as e:
+                    # keep serving the last good set (the defaults on first load)
+                    print(f"[Rules] reload failed ({e}); keeping the previous rules")
+                    if _ruleset is None:
+                        _ruleset = RuleSet(_RULES)
+                _rules_key = key
+    return _ruleset
+
 def _rule_intent(text: str) -> Optional[str]:
-    for pat, lab in _RULES:
-        if re.search(pat, text, re.I):
-            return lab
-    return None
+    return _current_rules().first(text)
+
+# ---- Staged NLU: one prep pass, cheap stages first, SBERT only if undecided ----
+@dataclass
+class NLUResult:
+    text: str                              # as given (entity fuzzy scores are case-sensitive)
+    low: str                               # lowercased, whitespace-collapsed
+    project: Optional[str] = None
+    category: Optional[str] = None
+    attribute: Optional[str] = None
+    intent: Optional[str] = None
+    score: float = 0.0
+    source: str = "none"
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def decided(self) -> bool:
+        return self.intent is not None
+
+def _stage_entities(r: NLUResult):
+    r.project, r.category, r.attribute = match_entities(r.text)
+    # any entity hit, exact or fuzzy, answers the turn without SBERT (the router below
+    # is entity-driven); a rule match still overrides it
+    if NLU_ENTITY_SHORTCUT and not r.decided and (r.project or r.category or r.attribute):
+        r.intent, r.score, r.source = "entity", 1.0, "entity"
+
+def _stage_rules(r: NLUResult):
+    lab = _rule_intent(r.low)
+    # rules are precise: they override an entity shortcut, never a rule/SBERT answer
+    if lab and r.source in ("none", "entity"):
+        r.intent, r.score, r.source = lab, 1.0, "rule"
+
+def _stage_sbert(r: NLUResult):
+    if r.decided:
+        metrics.inc("nlu_sbert_skipped")
+        return
+    lab, sc = _predict_intent(_classifier_nowait(), r.low, threshold=NLU_SBERT_THRESHOLD)
+    if lab != "fallback":
+        r.intent, r.score, r.source = lab, sc, "sbert"
+
+_STAGES = {"entities": _stage_entities, "rules": _stage_rules, "sbert": _stage_sbert}
+
+def run_nlu(text_norm: str, stages: Tuple[str, ...] = NLU_STAGES) -> NLUResult:
+    """Entities + intent for one utterance, with per-stage timings (ms)."""
+    text = text_norm or ""
+    r = NLUResult(text=text, low=" ".join(text.lower().split()))
+    for name in stages:
+        t0 = time.perf_counter()
+        with metrics.span(f"nlu.{name}"):
+            _STAGES[name](r)
+        r.timings[name] = round((time.perf_counter() - t0) * 1000, 3)
+    if r.intent is None:
+        r.intent = "fallback"
+    return r
 
 # ---- Public API ----
 def nlu_router(text_norm: str, lang: str, ctx: DialogueCtx) -> Tuple[str, DialogueCtx]:
     """
-    Hybrid router with navigation:
-      • Classifier first, rules as fallback
+    Hybrid router with navigation (policy table: utils/dialogue_fsm.TRANSITIONS):
+      • Staged NLU (NLU_STAGES): entities, rules, then SBERT only if undecided
       • Saying a category or 'projects' clears selected project (go up a level)
       • 'Back' intent navigates up one level
       • Attribute is RESET when switching project or category (precise change)
@@ -239,119 +327,15 @@ def nlu_router(text_norm: str, lang: str, ctx: DialogueCtx) -> Tuple[str, Dialog
     L = _L(lang)
     ctx.lang = L
 
-    # Detect entities for THIS utterance (before mutating ctx)
-    detected_proj = detect_project(text_norm)        # e.g., "metro"
-    detected_cat  = detect_category(text_norm)       # e.g., "under_construction"
-    detected_attr = detect_attribute(text_norm)      # e.g., "price"
-
-    # Intent via classifier, fallback to rules
-    intent, score = _predict_intent(_CLF, text_norm, threshold=0.55)
-    if intent == "fallback":
-        intent = _rule_intent(text_norm) or "fallback"
+    # Entities + intent for THIS utterance (before mutating ctx)
+    nlu = run_nlu(text_norm)
+    detected_proj, detected_cat, detected_attr = nlu.project, nlu.category, nlu.attribute
+    intent = nlu.intent
     ctx.last_intent = intent
+    ctx.intent_source = nlu.source
+    ctx.nlu_ms = nlu.timings
+    ctx.nlu = nlu
 
-    # ---- NAVIGATION: handle "back"
-    if intent == "go_back":
-        if ctx.project:
-            # go back from project -> category list
-            ctx.project = None
-            # (intentionally NOT resetting attribute here unless you want that behavior too)
-            if ctx.category:
-                items = _CATS.get(ctx.category, [])
-                if items:
-                    cat_name = CAT_LABELS[ctx.category][L]
-                    return T["list_projects"][L].format(cat=cat_name, items=_pretty_list(items)), ctx
-                return T["ask_attribute"][L], ctx
-            # if no category, go to top
-            return T["ask_category"][L], ctx
-        # already at category or top
-        if ctx.category:
-            items = _CATS.get(ctx.category, [])
-            if items:
-                cat_name = CAT_LABELS[ctx.category][L]
-                return T["list_projects"][L].format(cat=cat_name, items=_pretty_list(items)), ctx
-        return T["ask_category"][L], ctx
-
-    # ------------------ SURGICAL CHANGE START ------------------
-    # Remember previous selections to see if the user changed layer
-    prev_proj = ctx.project
-    prev_cat  = ctx.category
-
-    # Update ctx with **newly detected** entities
-    if detected_proj:
-        # if user picked a DIFFERENT project, reset attribute
-        if detected_proj != prev_proj:
-            ctx.attribute = None
-        ctx.project = detected_proj
-        # derive category if missing
-        ctx.category = _category_for_project(detected_proj) or ctx.category
-
-    if detected_cat:
-        # if user picked a DIFFERENT category, reset attribute
-        if detected_cat != prev_cat:
-            ctx.attribute = None
-        ctx.category = detected_cat
-        ctx.project = None  # moving up a level clears project
-
-    if detected_attr:
-        ctx.attribute = detected_attr
-    # ------------------- SURGICAL CHANGE END -------------------
-
-    # First turn / greet
-    if not ctx.greeted or intent == "greet":
-        ctx.greeted = True
-        return T["greet"][L], ctx
-
-    # WhatsApp / handoff
-    if intent == "whatsapp_details":
-        return T["whatsapp"][L], ctx
-    if intent == "connect_representative":
-        ctx.handoff = True
-        return T["handoff"][L], ctx
-
-    # Asking for project lists or category referenced
-    if intent == "ask_projects" or detected_cat:
-        # Projects request: ensure we are at the category layer
-        ctx.project = None
-        # If attribute requested but no project yet -> ask to pick a project within that category
-        if ctx.category and ctx.attribute:
-            items = _CATS.get(ctx.category, [])
-            if items:
-                cat_name = CAT_LABELS[ctx.category][L]
-                label = ATTR_LABELS[ctx.attribute][L]
-                return T["ask_project_for_attr"][L].format(
-                    label=label, cat=cat_name, items=_pretty_list(items)
-                ), ctx
-        # Otherwise list projects for the chosen/derived category
-        if ctx.category:
-            items = _CATS.get(ctx.category, [])
-            if items:
-                cat_name = CAT_LABELS[ctx.category][L]
-                return T["list_projects"][L].format(
-                    cat=cat_name, items=_pretty_list(items)
-                ), ctx
-        # No category yet – ask for it
-        return T["ask_category"][L], ctx
-
-    # Project chosen -> answer attribute if asked, else full details
-    if ctx.project:
-        if ctx.attribute:
-            ans = _project_answer_attr(ctx.project, ctx.attribute, L)
-            if ans:
-                return ans, ctx
-        return _project_answer_all(ctx.project, L), ctx
-
-    # Category chosen (but no project) -> list projects; if none, nudge attribute
-    if ctx.category and not ctx.project:
-        items = _CATS.get(ctx.category, [])
-        if items:
-            cat_name = CAT_LABELS[ctx.category][L]
-            return T["list_projects"][L].format(cat=cat_name, items=_pretty_list(items)), ctx
-        return T["ask_attribute"][L], ctx
-
-    # Attribute only (no category) -> ask category
-    if ctx.attribute and not ctx.category:
-        return T["ask_category"][L], ctx
-
-    # Final fallback
-    return T["fallback"][L], ctx
+    # Policy: table-driven state machine over this tenant's precomputed replies
+    machine = _machine_for(kb.get(ctx.tenant))
+    return machine.step(ctx, intent, detected_proj, detected_cat, detected_attr, L), ctx
@@ -0,0 +1,359 @@
+# utils/dialogue_fsm.py
+# Declarative dialogue policy for nlu_router + precomputed reply tables.
+#
+# States (after this turn's entities are applied):
+#   start     not greeted yet
+#   top       nothing selected
+#   category  category selected, no project
+#   project   project selected (attribute is a slot, not a state)
+# Events:
+#   back | greet | whatsapp | handoff | list (ask_projects or a category hit) | inform (anything else)
+#
+# TRANSITIONS maps (state, event) to the next state and an ordered list of
+# reply keys; the first key whose table has an entry for the current slots
+# is the answer. Every reply string (per language) is rendered once when the
+# machine is built, so a turn is a couple of dict lookups.
+#
+#   python -m utils.dialogue_fsm --check    # table lint + exhaustive diff vs the old if/elif router
+from typing import Callable, Dict, List, Optional, Tuple
+
+LANGS = ("en", "hi")
+STATES = ("start", "top", "category", "project")
+EVENTS = ("back", "greet", "whatsapp", "handoff", "list", "inform")
+
+# (state, event) -> (next state, reply keys tried in order)
+# next state "same" keeps it; "up" is back's one-level-up move; "by_slots" is
+# derived from the selected category/project after the event's slot changes.
+TRANSITIONS: Dict[Tuple[str, str], Tuple[str, Tuple[str, ...]]] = {}
+for _s in STATES:
+    TRANSITIONS[(_s, "greet")] = ("by_slots", ("greet",))
+    TRANSITIONS[(_s, "whatsapp")] = ("same", ("whatsapp",))
+    TRANSITIONS[(_s, "handoff")] = ("same", ("handoff",))
+    TRANSITIONS[(_s, "list")] = ("by_slots", ("ask_project_for_attr", "list_projects", "ask_category"))
+# back ignores this turn's entities and works from the previous selection
+TRANSITIONS[("project", "back")] = ("up", ("list_projects", "ask_attribute_if_cat", "ask_category"))
+TRANSITIONS[("category", "back")] = ("same", ("list_projects", "ask_category"))
+TRANSITIONS[("top", "back")] = ("same", ("ask_category",))
+TRANSITIONS[("project", "inform")] = ("same", ("attr_answer", "proj_details"))
+TRANSITIONS[("category", "inform")] = ("same", ("list_projects", "ask_attribute"))
+TRANSITIONS[("top", "inform")] = ("same", ("ask_category_if_attr", "fallback"))
+# the first turn always greets (entities are still remembered); back works
+# from the selection whatever the greeting state, so "start" has no back row
+for _e in EVENTS[1:]:
+    TRANSITIONS[("start", _e)] = ("by_slots", ("greet",))
+
+# reply keys that never depend on slots (always answer)
+UNCONDITIONAL = {"greet", "whatsapp", "handoff", "ask_category", "ask_attribute", "fallback", "proj_details"}
+
+INTENT_EVENTS = {
+    "go_back": "back", "greet": "greet", "whatsapp_details": "whatsapp",
+    "connect_representative": "handoff", "ask_projects": "list",
+}
+
+
+def state_of(ctx) -> str:
+    if not ctx.greeted:
+        return "start"
+    if ctx.project:
+        return "project"
+    return "category" if ctx.category else "top"
+
+
+class DialogueMachine:
+    def __init__(self, templates: dict, facts: Dict[str, dict], cats: Dict[str, List[str]],
+                 cat_labels: dict, attr_labels: dict, projects: List[str] = (), phone: str = ""):
+        self.T = templates
+        self.phone = phone
+        self.facts = facts
+        self.cats = cats
+        self.cat_labels = cat_labels
+        self.attr_labels = attr_labels
+        # selectable projects: every fact + every canonical name a detector can return
+        self.projects = list(dict.fromkeys(list(facts) + list(projects)))
+        self.project_category = {p: rec.get("category") for p, rec in facts.items()}
+        self._build()
+
+    # ---- reply tables ----
+    def _pretty_list(self, keys: List[str]) -> str:
+        names = [self.facts.get(k, {}).get("name", k.title()) for k in keys or []]
+        return ", ".join(names) if names else "—"
+
+    def _proj_details(self, p: str, L: str) -> str:
+        rec = self.facts.get(p, {})
+        return self.T["proj_details"][L].format(
+            name=rec.get("name", p.title()), config=rec.get("config", "—"), price=rec.get("price", "—"),
+            floors=rec.get("floors", "—"), towers=rec.get("towers", "—"))
+
+    def _build(self):
+        T = self.T
+        self.static = {L: {k: T[k][L] for k in ("greet", "ask_category", "ask_attribute", "handoff",
+                                                "fallback")} for L in LANGS}
+        for L in LANGS:
+            self.static[L]["whatsapp"] = T["whatsapp"][L].format(phone=self.phone)
+        self.list_projects: Dict[str, Dict[str, str]] = {L: {} for L in LANGS}
+        self.ask_project_for_attr: Dict[str, Dict[Tuple[str, str], str]] = {L: {} for L in LANGS}
+        self.proj_details: Dict[str, Dict[str, str]] = {L: {} for L in LANGS}
+        self.attr_answer: Dict[str, Dict[Tuple[str, str], str]] = {L: {} for L in LANGS}
+        for L in LANGS:
+            for cat, items in self.cats.items():
+                if not items or cat not in self.cat_labels:
+                    continue  # no entry -> the next reply key in the transition answers
+                cat_name = self.cat_labels[cat][L]
+                self.list_projects[L][cat] = T["list_projects"][L].format(cat=cat_name, items=self._pretty_list(items))
+                for attr, labels in self.attr_labels.items():
+                    self.ask_project_for_attr[L][(cat, attr)] = T["ask_project_for_attr"][L].format(
+                        label=labels[L], cat=cat_name, items=self._pretty_list(items))
+            for p in self.projects:
+                self.proj_details[L][p] = self._proj_details(p, L)
+                rec = self.facts.get(p)
+                if not rec:
+                    continue
+                for attr, labels in self.attr_labels.items():
+                    value = rec.get(attr)
+                    if value in (None, ""):
+                        continue
+                    self.attr_answer[L][(p, attr)] = T["attr_answer"][L].format(
+                        name=rec.get("name", p.title()), label=labels.get(L, attr.title()), value=value)
+
+        # reply key -> lookup(ctx, L); None means "not available, try the next key"
+        self.lookups: Dict[str, Callable] = {
+            "list_projects": lambda c, L: self.list_projects[L].get(c.category),
+            "ask_project_for_attr": lambda c, L: self.ask_project_for_attr[L].get((c.category, c.attribute)),
+            "attr_answer": lambda c, L: self.attr_answer[L].get((c.project, c.attribute)),
+            "proj_details": lambda c, L: self.proj_details[L].get(c.project) or self._proj_details(c.project, L),
+            "ask_category_if_attr": lambda c, L: self.static[L]["ask_category"] if c.attribute else None,
+            "ask_attribute_if_cat": lambda c, L: self.static[L]["ask_attribute"] if c.category else None,
+        }
+        for k in self.static["en"]:
+            self.lookups[k] = (lambda key: lambda c, L: self.static[L][key])(k)
+
+    def all_replies(self, L: str) -> List[str]:
+        """Every precomputed reply for a language (TTS warm-up)."""
+        out = list(self.static[L].values())
+        for table in (self.list_projects, self.ask_project_for_attr, self.proj_details, self.attr_answer):
+            out += list(table[L].values())
+        return list(dict.fromkeys(out))
+
+    # ---- one turn ----
+    @staticmethod
+    def event_of(intent: str, detected_cat: Optional[str]) -> str:
+        ev = INTENT_EVENTS.get(intent, "inform")
+        # a category mention lists that category unless the intent is more specific
+        return "list" if ev == "inform" and detected_cat else ev
+
+    def _apply_entities(self, ctx, proj, cat, attr):
+        prev_proj, prev_cat = ctx.project, ctx.category
+        if proj:
+            if proj != prev_proj:
+                ctx.attribute = None   # a different project resets the attribute
+            ctx.project = proj
+            ctx.category = self.project_category.get(proj) or ctx.category
+        if cat:
+            if cat != prev_cat:
+                ctx.attribute = None
+            ctx.category = cat
+            ctx.project = None         # moving up a level clears the project
+        if attr:
+            ctx.attribute = attr
+
+    def step(self, ctx, intent: str, proj: Optional[str], cat: Optional[str], attr: Optional[str], L: str) -> str:
+        """Apply one turn to ctx and return the reply."""
+        if intent == "go_back":
+            state, event = ("project" if ctx.project else "category" if ctx.category else "top"), "back"
+        else:
+            self._apply_entities(ctx, proj, cat, attr)
+            state = state_of(ctx)
+            event = "greet" if state == "start" else self.event_of(intent, cat)
+        nxt, keys = TRANSITIONS[(state, event)]
+
+        if nxt == "up":
+            ctx.project = None
+        if event == "greet":
+            ctx.greeted = True
+        if event == "handoff":
+            ctx.handoff = True
+        if event == "list":
+            ctx.project = None
+        for key in keys:
+            reply = self.lookups[key](ctx, L)
+            if reply is not None:
+                return reply
+        return self.static[L]["fallback"]   # unreachable when the table passes check()
+
+    # ---- table lint ----
+    def check(self) -> List[str]:
+        """Problems with the transition table or the domain data it is built from."""
+        problems = []
+        for s in STATES:
+            for e in EVENTS:
+                if (s, e) not in TRANSITIONS and (s, e) != ("start", "back"):
+                    problems.append(f"dead: no transition for ({s}, {e})")
+        for (s, e), (nxt, keys) in TRANSITIONS.items():
+            for k in keys:
+                if k not in self.lookups:
+                    problems.append(f"({s}, {e}) uses unknown reply {k!r}")
+            if not keys or keys[-1] not in UNCONDITIONAL:
+                problems.append(f"({s}, {e}) can end without a reply (last key {keys[-1] if keys else None!r})")
+        # reachability over the state graph from "start"
+        seen, todo = set(), ["start"]
+        while todo:
+            s = todo.pop()
+            if s in seen:
+                continue
+            seen.add(s)
+            for e in EVENTS:
+                nxt, _ = TRANSITIONS.get((s, e), ("same", ()))
+                todo += [s] if nxt == "same" else list(STATES[1:]) if nxt == "by_slots" else ["category", "top"]
+        problems += [f"unreachable state: {s}" for s in STATES if s not in seen]
+        # domain data: selections that can never be reached or lead nowhere
+        for cat, items in self.cats.items():
+            if not items:
+                problems.append(f"category {cat!r} has no projects (only ask_category/ask_attribute replies)")
+            for p in items:
+                if p not in self.facts:
+                    problems.append(f"category {cat!r} lists {p!r} with no project_facts entry")
+        for p, c in self.project_category.items():
+            if c and c not in self.cats:
+                problems.append(f"project {p!r} points at unknown category {c!r}")
+        return problems
+
+
+# ---- exhaustive comparison against the original if/elif router ----
+def _legacy_step(d, kb, ctx, intent, detected_proj, detected_cat, detected_attr, L):
+    """The pre-state-machine nlu_router policy, verbatim, used as the reference."""
+    T, _CATS, CAT_LABELS, ATTR_LABELS = d.T, kb.categories, d.CAT_LABELS, d.ATTR_LABELS
+    _FACTS = kb.facts
+
+    def _pretty_list(keys):
+        return ", ".join(_FACTS.get(k, {}).get("name", k.title()) for k in keys or []) or "—"
+
+    def _project_answer_all(pkey, L):
+        rec = _FACTS.get(pkey, {})
+        return T["proj_details"][L].format(name=rec.get("name", pkey.title()), config=rec.get("config", "—"),
+                                           price=rec.get("price", "—"), floors=rec.get("floors", "—"),
+                                           towers=rec.get("towers", "—"))
+
+    def _project_answer_attr(pkey, attr, L):
+        rec = _FACTS.get(pkey, {})
+        if not rec:
+            return None
+        value = rec.get(attr)
+        if value in (None, ""):
+            return None
+        return T["attr_answer"][L].format(name=rec.get("name", pkey.title()),
+                                          label=ATTR_LABELS.get(attr, {}).get(L, attr.title()), value=value)
+    if intent == "go_back":
+        if ctx.project:
+            ctx.project = None
+            if ctx.category:
+                items = _CATS.get(ctx.category, [])
+                if items:
+                    return T["list_projects"][L].format(cat=CAT_LABELS[ctx.category][L], items=_pretty_list(items))
+                return T["ask_attribute"][L]
+            return T["ask_category"][L]
+        if ctx.category:
+            items = _CATS.get(ctx.category, [])
+            if items:
+                return T["list_projects"][L].format(cat=CAT_LABELS[ctx.category][L], items=_pretty_list(items))
+        return T["ask_category"][L]
+    prev_proj, prev_cat = ctx.project, ctx.category
+    if detected_proj:
+        if detected_proj != prev_proj:
+            ctx.attribute = None
+        ctx.project = detected_proj
+        ctx.category = _FACTS.get(detected_proj, {}).get("category") or ctx.category
+    if detected_cat:
+        if detected_cat != prev_cat:
+            ctx.attribute = None
+        ctx.category = detected_cat
+        ctx.project = None
+    if detected_attr:
+        ctx.attribute = detected_attr
+    if not ctx.greeted or intent == "greet":
+        ctx.greeted = True
+        return T["greet"][L]
+    if intent == "whatsapp_details":
+        return T["whatsapp"][L].format(phone=kb.phone)
+    if intent == "connect_representative":
+        ctx.handoff = True
+        return T["handoff"][L]
+    if intent == "ask_projects" or detected_cat:
+        ctx.project = None
+        if ctx.category and ctx.attribute:
+            items = _CATS.get(ctx.category, [])
+            if items:
+                return T["ask_project_for_attr"][L].format(label=ATTR_LABELS[ctx.attribute][L],
+                                                          cat=CAT_LABELS[ctx.category][L], items=_pretty_list(items))
+        if ctx.category:
+            items = _CATS.get(ctx.category, [])
+            if items:
+                return T["list_projects"][L].format(cat=CAT_LABELS[ctx.category][L], items=_pretty_list(items))
+        return T["ask_category"][L]
+    if ctx.project:
+        if ctx.attribute:
+            ans = _project_answer_attr(ctx.project, ctx.attribute, L)
+            if ans:
+                return ans
+        return _project_answer_all(ctx.project, L)
+    if ctx.category and not ctx.project:
+        items = _CATS.get(ctx.category, [])
+        if items:
+            return T["list_projects"][L].format(cat=CAT_LABELS[ctx.category][L], items=_pretty_list(items))
+        return T["ask_attribute"][L]
+    if ctx.attribute and not ctx.category:
+        return T["ask_category"][L]
+    return T["fallback"][L]
+
+
+def exhaustive_diff(limit: int = 10) -> Tuple[int, List[str]]:
+    """Every (ctx, intent, entities, language) combination through both policies."""
+    import itertools
+    from dataclasses import replace
+    from utils import dialogue as d
+
+    kb = d.kb.get()
+    m = d._machine_for(kb)
+    projects = [None] + m.projects
+    cats = [None] + list(d.CAT_LABELS)
+    attrs = [None] + list(d.ATTR_LABELS)
+    intents = ["fallback", "entity", "go_back", "greet", "whatsapp_details", "connect_representative",
+               "ask_projects", "goodbye", "affirm", "deny"]
+    n, diffs = 0, []
+    for greeted, p0, c0, a0 in itertools.product((False, True), projects, cats, attrs):
+        base = d.DialogueCtx(greeted=greeted, project=p0, category=c0, attribute=a0)
+        for intent, p, c, a, L in itertools.product(intents, projects, cats, attrs, LANGS):
+            c_old, c_new = replace(base), replace(base)
+            r_old = _legacy_step(d, kb, c_old, intent, p, c, a, L)
+            r_new = m.step(c_new, intent, p, c, a, L)
+            n += 1
+            if r_old != r_new or c_old != c_new:
+                if len(diffs) < limit:
+                    diffs.append(f"{base} + {(intent, p, c, a, L)}: {r_old!r} {c_old} != {r_new!r} {c_new}")
+                else:
+                    return n, diffs
+    return n, diffs
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser(description="Dialogue state machine checks")
+    ap.add_argument("--check", action="store_true", help="lint the table and diff against the old router")
+    args = ap.parse_args()
+    if not args.check:
+        ap.print_help()
+        sys.exit(0)
+
+    from utils import dialogue as d
+    problems = d._machine_for(d.kb.get()).check()
+    for pr in problems:
+        print(f"[FSM] {pr}")
+    t0 = time.perf_counter()
+    n, diffs = exhaustive_diff()
+    print(f"[FSM] {n} combinations in {time.perf_counter() - t0:.1f}s, {len(diffs)} differences")
+    for df in diffs:
+        print(f"  {df}")
+    hard = [p for p in problems if p.startswith(("dead", "unreachable")) or "without a reply" in p or "unknown reply" in p]
+    sys.exit(1 if diffs or hard else 0)
@@ -0,0 +1,44 @@
+# utils/domain.py
+# Import-light domain vocabulary shared by STT biasing, dialogue and tools:
+# where intents.json lives, and the display labels for categories/attributes.
+import os
+
+# ---- Resolve and load data/intents.json robustly ----
+def resolve_intents_path() -> str:
+    try:
+        import config as CFG
+        p = getattr(CFG, "INTENTS_PATH", None)
+        if p and os.path.exists(p):
+            return os.path.abspath(p)
+    except Exception:
+        pass
+
+    envp = os.environ.get("INTENTS_PATH")
+    if envp and os.path.exists(envp):
+        return os.path.abspath(envp)
+
+    here = os.path.dirname(__file__)
+    candidates = [
+        os.path.join(os.getcwd(), "data", "intents.json"),
+        os.path.join(here, "..", "data", "intents.json"),
+        os.path.join(os.getcwd(), "intents.json"),
+    ]
+    for c in candidates:
+        if os.path.exists(c):
+            return os.path.abspath(c)
+
+    raise FileNotFoundError("intents.json not found via config/ENV/fallbacks.")
+
+# ---- Display labels ----
+CAT_LABELS = {
+    "under_construction": {"en": "Under-Construction", "hi": "अंडर-कंस्ट्रक्शन"},
+    "ready_to_move":      {"en": "Ready-to-Move",      "hi": "रेडी-टू-मूव"},
+    "completed":          {"en": "Completed",          "hi": "कम्प्लीटेड"},
+}
+
+ATTR_LABELS = {
+    "price":  {"en": "Starting from", "hi": "स्टार्टिंग फ्रॉम"},
+    "config": {"en": "Configuration", "hi": "कॉन्फ़िगरेशन"},
+    "floors": {"en": "Floors",        "hi": "फ्लोर्स"},
+    "towers": {"en": "No. of Towers", "hi": "टावर्स"},
+}
@@ -0,0 +1,268 @@
+# utils/entity_index.py
+# Precompiled project / category / attribute matcher (one call per utterance).
+#
+# Built once from the same tables entity_fuzzy.py and attributes.py use, and
+# returns exactly what detect_project / detect_category / detect_attribute
+# would:
+#   • exact phrase hits: one compiled alternation per priority run, so the
+#     first matching run wins just like the original ordered substring loops;
+#     a combined "any hit" regex skips them all when nothing is present.
+#   • fuzzy fallback: a char-bigram index, plus a whole-token index (WRatio's
+#     token-set path can accept on one shared short token like "3" in
+#     "3 bhk"), shortlists attribute phrases before WRatio, and every extractOne gets a score_cutoff equal to its accept
+#     threshold so RapidFuzz can prune early.
+#
+#   python -m utils.entity_index --verify     # regression vs the old detectors
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from rapidfuzz import process, fuzz
+
+from utils import entity_fuzzy as _ef
+from utils import attributes as _attr
+
+ATTR_CUTOFF = 80            # detect_attribute's fuzzy accept score
+SHORT_QUERY = 4             # queries this short (or shorter) skip the shortlist
+MATCH_CACHE = 4096          # callers repeat "price", "aria", "ready to move" a lot
+
+
+class Entities(NamedTuple):
+    project: Optional[str]
+    category: Optional[str]
+    attribute: Optional[str]
+
+
+def _runs(pairs: Iterable[Tuple[str, str]]) -> List[Tuple[str, List[str]]]:
+    """Collapse an ordered (phrase, value) table into consecutive same-value runs."""
+    runs: List[Tuple[str, List[str]]] = []
+    for phrase, value in pairs:
+        if runs and runs[-1][0] == value:
+            runs[-1][1].append(phrase)
+        else:
+            runs.append((value, [phrase]))
+    return runs
+
+
+def _alternation(phrases: Sequence[str]) -> "re.Pattern":
+    # longest first so the regex engine never stops at a shorter prefix
+    return re.compile("|".join(re.escape(p) for p in sorted(set(phrases), key=len, reverse=True)))
+
+
+def _bigrams(s: str) -> set:
+    return {s[i:i + 2] for i in range(len(s) - 1)}
+
+
+class _PhraseMatcher:
+    """Ordered substring runs + bigram-shortlisted fuzzy match for one table."""
+
+    def __init__(self, pairs: Sequence[Tuple[str, str]], fuzzy: Sequence[Tuple[str, str]] = ()):
+        self.runs = [(value, _alternation(ph)) for value, ph in _runs(pairs)]
+        self.any = _alternation([p for p, _ in pairs]) if pairs else None
+        # duplicates can never win extractOne (ties go to the first), so drop them
+        first = dict(reversed(list(fuzzy)))
+        order = list(dict.fromkeys(p for p, _ in fuzzy))
+        self.fuzzy_phrases = order
+        self.fuzzy_values = [first[p] for p in order]
+        self._post: Dict[str, List[int]] = defaultdict(list)
+        self._tok: Dict[str, List[int]] = defaultdict(list)
+        self._always: List[int] = []
+        for i, p in enumerate(self.fuzzy_phrases):
+            grams = _bigrams(p)
+            if not grams:
+                self._always.append(i)
+            for g in grams:
+                self._post[g].append(i)
+            for w in set(p.split()):
+                self._tok[w].append(i)
+
+    def exact(self, t: str) -> Optional[str]:
+        if self.any is None or not self.any.search(t):
+            return None
+        for value, rx in self.runs:
+            if rx.search(t):
+                return value
+        return None
+
+    def shortlist(self, t: str) -> List[int]:
+        if len(t) <= SHORT_QUERY:
+            return list(range(len(self.fuzzy_phrases)))
+        ids = set(self._always)
+        for g in _bigrams(t):
+            ids.update(self._post.get(g, ()))
+        for w in t.split():
+            ids.update(self._tok.get(w, ()))
+        return sorted(ids)   # original order keeps extractOne's tie-breaking
+
+    def fuzzy(self, t: str, cutoff: float) -> Optional[str]:
+        ids = self.shortlist(t)
+        if not ids:
+            return None
+        m = process.extractOne(t, [self.fuzzy_phrases[i] for i in ids], scorer=fuzz.WRatio, score_cutoff=cutoff)
+        return self.fuzzy_values[ids[m[2]]] if m else None
+
+
+class EntityIndex:
+    def __init__(self):
+        # projects: token lookup + whole-string fuzzy over the canonical list
+        self.var_to_project = dict(_ef.VAR_TO_CANON_PROJECT)
+        self.project_list = list(_ef.PROJECT_LIST)
+        # categories: substring keys in VAR_TO_CANON_CAT order
+        self.categories = _PhraseMatcher(list(_ef.VAR_TO_CANON_CAT.items()))
+        self.category_list = list(_ef.CATEGORY_LIST)
+        # attributes: substring + fuzzy over _PHRASE_TABLE (same order)
+        table = [(p, a) for a, p in _attr._PHRASE_TABLE]
+        self.attributes = _PhraseMatcher(table, fuzzy=table)
+        self.match = lru_cache(maxsize=MATCH_CACHE)(self._match)
+
+    # ---- projects (mirrors entity_fuzzy.detect_project) ----
+    def _token_candidates(self, tokens: List[str]) -> List[str]:
+        found = [self.var_to_project[t] for t in tokens if t in self.var_to_project]
+        if "Ashar" in found and len(set(found)) > 1:
+            found = [c for c in found if c != "Ashar"]
+        return list(dict.fromkeys(found))
+
+    def project(self, text: str, tokens: Optional[List[str]] = None,
+                threshold_high: int = 90, threshold_low: int = 78) -> Optional[str]:
+        match = process.extractOne(text, self.project_list, scorer=fuzz.WRatio,
+                                   score_cutoff=min(threshold_high, threshold_low))
+        if match and match[1] >= threshold_high:
+            return match[0]
+        cand = self._token_candidates(tokens if tokens is not None else text.lower().split())
+        if len(cand) == 1:
+            return cand[0]
+        if len(cand) > 1:
+            best = process.extractOne(text, cand, scorer=fuzz.WRatio)
+            if best:
+                return best[0]
+        if match and match[1] >= threshold_low:
+            return match[0]
+        return None
+
+    # ---- categories (mirrors entity_fuzzy.detect_category) ----
+    def category(self, text: str, lowered: Optional[str] = None,
+                 threshold_high: int = 90, threshold_low: int = 78) -> Optional[str]:
+        hit = self.categories.exact(lowered if lowered is not None else text.lower())
+        if hit:
+            return hit
+        match = process.extractOne(text, self.category_list, scorer=fuzz.WRatio,
+                                   score_cutoff=min(threshold_high, threshold_low))
+        return match[0] if match else None
+
+    # ---- attributes (mirrors attributes.detect_attribute) ----
+    def attribute(self, text: str, lowered: Optional[str] = None) -> Optional[str]:
+        if not text:
+            return None
+        t = (lowered if lowered is not None else text.lower()).strip()
+        return self.attributes.exact(t) or self.attributes.fuzzy(t, ATTR_CUTOFF)
+
+    def _match(self, text: str) -> Entities:
+        """Project, category and attribute for one utterance, sharing the lowercase/tokenize work."""
+        text = text or ""
+        low = text.lower()
+        return Entities(self.project(text, low.split()), self.category(text, low), self.attribute(text, low))
+
+
+_INDEX: Optional[EntityIndex] = None
+
+
+def get_index() -> EntityIndex:
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = EntityIndex()
+    return _INDEX
+
+
+def match_entities(text: str) -> Entities:
+    return get_index().match(text)
+
+
+# ---- regression check against the original detectors ----
+def regression_corpus() -> List[str]:
+    """Every known phrase/variant, mixed utterances, and single-edit typos of each."""
+    from utils.domain import resolve_intents_path
+    import json
+
+    base: List[str] = []
+    for canon, variants in _ef.CANON_PROJECTS.items():
+        base += [canon, *variants]
+    for canon, variants in _ef.CANON_CATEGORIES.items():
+        base += [canon, *variants]
+    base += [p for _, p in _attr._PHRASE_TABLE]
+    with open(resolve_intents_path(), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for k, v in data.items():
+        if isinstance(v, list):
+            base += [x for x in v if isinstance(x, str)]
+
+    projects = list(_ef.CANON_PROJECTS)
+    attrs = ["price", "floors", "kitne tower", "configuration", "flores", "prise", "bhk"]
+    cats = ["ready to move", "under construction", "completed", "ongoing", "rtm"]
+    for i, p in enumerate(projects):
+        a, c = attrs[i % len(attrs)], cats[i % len(cats)]
+        base += [f"{a} of {p}", f"{p} ka {a} kya hai", f"tell me about {p}", f"{c} projects",
+                 f"ashar {p} {a}", f"{p} {c}", f"what is the {a} in {p} please", p.upper(), f"  {p}  "]
+    base += ["", " ", "hello", "haan", "no", "back", "what", "already", "floor", "blocks tower",
+             "kya aap mujhe batayenge", "connect me to a representative", "1 bhk", "3bhk flat in aria",
+             "mapple 3", "tell me about metro 1"]
+    # a project plus a lone digit / letter: WRatio can accept these on the short token alone
+    for i, p in enumerate(projects):
+        base += [f"{p} {i % 10}", f"tell me about {p} {i % 5 + 1}", f"{p} {'abcxyz'[i % 6]}"]
+
+    typos: List[str] = []
+    for s in base:
+        if 3 <= len(s) <= 30:
+            typos += [s[1:], s[:-1], s[:len(s) // 2] + s[len(s) // 2 + 1:],
+                      s[:1] + s[2:1:-1] + s[1:2] + s[3:] if len(s) > 3 else s]
+    return list(dict.fromkeys(base + typos))
+
+
+def verify(corpus: Optional[List[str]] = None) -> dict:
+    import time
+
+    corpus = corpus if corpus is not None else regression_corpus()
+    idx = get_index()
+    old_fns = (_ef.detect_project, _ef.detect_category, _attr.detect_attribute)
+    mismatches = []
+    for s in corpus:
+        old = tuple(f(s) for f in old_fns)
+        new = tuple(idx.match(s))
+        if old != new:
+            mismatches.append({"text": s, "old": old, "new": new})
+
+    def _time(fn, n=3):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            for s in corpus:
+                fn(s)
+        return (time.perf_counter() - t0) * 1e6 / (n * len(corpus))
+
+    return {
+        "corpus": len(corpus), "mismatches": len(mismatches), "examples": mismatches[:10],
+        "us_per_utt_old": round(_time(lambda s: tuple(f(s) for f in old_fns)), 1),
+        "us_per_utt_new": round(_time(idx._match), 1),   # uncached
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Compiled entity matcher")
+    ap.add_argument("--verify", action="store_true", help="compare with detect_project/category/attribute")
+    ap.add_argument("--corpus", default=None, help="extra utterances, one per line")
+    ap.add_argument("text", nargs="*")
+    args = ap.parse_args()
+
+    if args.verify:
+        corpus = regression_corpus()
+        if args.corpus:
+            with open(args.corpus, "r", encoding="utf-8") as f:
+                corpus += [ln.rstrip("\n") for ln in f]
+        rep = verify(corpus)
+        print(json.dumps(rep, indent=2, ensure_ascii=False))
+        sys.exit(1 if rep["mismatches"] else 0)
+    for t in args.text:
+        print(t, "->", tuple(match_entities(t)))
@@ -1,23 +1,17 @@
 # utils/facts.py
-from pathlib import Path
-import yaml
-from typing import Optional, Dict
+# Thin helpers over the tenant knowledge base (utils/kb.py), which owns
+# loading, caching and hot reload of clients/<tenant>/project_facts.yaml.
+from typing import Optional
 
-_CACHE: Dict[str, dict] = {}
+from utils import kb
 
 def load_facts(tenant_id: str = "ashar") -> dict:
-    if tenant_id in _CACHE:
-        return _CACHE[tenant_id]
-    p = Path("clients") / tenant_id / "project_facts.yaml"
-    data = yaml.safe_load(p.read_text(encoding="utf-8"))
-    _CACHE[tenant_id] = data
-    return data
+    """Current facts for a tenant in the project_facts.yaml shape (read-only mappings)."""
+    base = kb.get(tenant_id)
+    return {"projects": base.facts, "categories": base.categories, "config": base.config}
 
 def get_project_field(project_key: str, field: str, tenant_id: str = "ashar") -> Optional[str]:
-    data = load_facts(tenant_id)
-    proj = data["projects"].get(project_key or "", {})
-    return proj.get(field)
+    return kb.get(tenant_id).value(project_key, field)
 
 def list_projects_by_category(category: str, tenant_id: str = "ashar") -> list:
-    data = load_facts(tenant_id)
-    return data["categories"].get(category, [])
+    return list(kb.get(tenant_id).projects_in(category))
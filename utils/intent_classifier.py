@@ -1,7 +1,26 @@
+import os
+import re
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+
+try:
+    import config as CFG
+    BACKEND = getattr(CFG, "SBERT_BACKEND", "torch")   # "torch" | "onnx"
+    QUERY_CACHE = int(getattr(CFG, "SBERT_QUERY_CACHE", 2048))
+    BATCH_SIZE = int(getattr(CFG, "SBERT_BATCH_SIZE", 32))
+    INDEX_DIR = getattr(CFG, "INTENT_INDEX_DIR", "cache/intents")
+except Exception:
+    BACKEND = "torch"
+    QUERY_CACHE = 2048
+    BATCH_SIZE = 32
+    INDEX_DIR = "cache/intents"
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 INTENT_KEYS = {
     "greet", "goodbye", "ask_projects", "whatsapp_details",
@@ -9,42 +28,171 @@ INTENT_KEYS = {
 }
 
 class SBERTIntentClassifier:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = DEFAULT_MODEL, backend: str = BACKEND):
+        self.model_name = model_name
+        self.backend, self.model = _load_encoder(model_name, backend)
+        self.model_id = f"{model_name}@{self.backend}"  # embeddings differ slightly per backend
         self.intent_examples = {}
         self.labels = []
-        self.embeddings = None
+        self.embeddings = None          # (N, D) float32, rows L2-normalized
+        self.index_source = None        # "disk" | "encoded" after fit()
+        self._intents_sha = None
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()  # norm text -> unit query vector
+        self._cache_max = QUERY_CACHE
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def load_intents(self, path: str):
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        with open(path, "rb") as f:
+            raw = f.read()
+        self._intents_sha = hashlib.sha1(raw).hexdigest()
+        data = json.loads(raw.decode("utf-8"))
         # keep only the intent keys
         self.intent_examples = {k: v for k, v in data.items() if k in INTENT_KEYS}
         self._raw_data = data  # expose full json for facts/config if needed
 
-    def fit(self):
+    def fit(self, index_dir: str = INDEX_DIR):
+        """
+        Build the example matrix. With index_dir set, a saved index for the
+        same intents file + model is mmap-loaded instead of re-encoding, and
+        a fresh one is written when the hash changes.
+        """
         self.labels = []
         examples = []
         for intent, phrases in self.intent_examples.items():
             for p in phrases:
                 self.labels.append(intent)
                 examples.append(p)
+        with self._lock:
+            self._cache.clear()
         if not examples:
             self.embeddings = None
             return
-        self.embeddings = self.model.encode(examples, convert_to_tensor=False)  # numpy
+        key = self._index_key(examples)
+        if index_dir:
+            emb = self._load_index(index_dir, key)
+            if emb is not None:
+                self.embeddings = emb
+                self.index_source = "disk"
+                return
+        emb = self.model.encode(examples, batch_size=BATCH_SIZE, convert_to_tensor=False)  # numpy
+        self.embeddings = _unit_rows(np.asarray(emb, dtype=np.float32))
+        self.index_source = "encoded"
+        if index_dir:
+            self._save_index(index_dir, key)
+
+    # ---- on-disk index: <dir>/intents.<model tag>.<hash>.npy + .json ----
+    def _model_tag(self) -> str:
+        # filename-safe model@backend; other models' indexes in a shared dir are left alone
+        return re.sub(r"[^A-Za-z0-9]+", "_", self.model_id).strip("_")
+
+    def _index_key(self, examples: List[str]) -> str:
+        h = hashlib.sha1(self.model_id.encode("utf-8"))
+        if self._intents_sha:
+            h.update(self._intents_sha.encode("ascii"))
+        else:  # examples set by hand, not from a file
+            h.update(json.dumps(self.intent_examples, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return f"{self._model_tag()}.{h.hexdigest()[:16]}"
+
+    def _load_index(self, index_dir: str, key: str):
+        base = os.path.join(index_dir, f"intents.{key}")
+        try:
+            with open(base + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model") != self.model_id or meta.get("labels") != self.labels:
+                return None
+            emb = np.load(base + ".npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return emb if emb.ndim == 2 and emb.shape[0] == len(self.labels) else None
+
+    def _save_index(self, index_dir: str, key: str):
+        base = os.path.join(index_dir, f"intents.{key}")
+        tmp = f".{os.getpid()}.tmp"
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            with open(base + ".npy" + tmp, "wb") as f:
+                np.save(f, self.embeddings)
+            with open(base + ".json" + tmp, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_id, "intents_sha1": self._intents_sha,
+                           "dim": int(self.embeddings.shape[1]), "labels": self.labels},
+                          f, ensure_ascii=False)
+            # same key == same content, so a half-swapped pair is still consistent
+            os.replace(base + ".npy" + tmp, base + ".npy")
+            os.replace(base + ".json" + tmp, base + ".json")
+        except OSError:
+            for ext in (".npy", ".json"):
+                try:
+                    os.remove(base + ext + tmp)
+                except OSError:
+                    pass
+            return
+        # drop this model's indexes for older versions of the intents file
+        mine = f"intents.{self._model_tag()}."
+        for fn in os.listdir(index_dir):
+            if fn.startswith(mine) and not fn.startswith(f"intents.{key}.") and fn.endswith((".npy", ".json")):
+                try:
+                    os.remove(os.path.join(index_dir, fn))
+                except OSError:
+                    pass
+
+    # ---- query embeddings (batched + LRU) ----
+    @staticmethod
+    def _cache_key(query: str) -> str:
+        return " ".join((query or "").lower().split())
+
+    def _embed(self, queries: List[str]) -> np.ndarray:
+        """Unit vectors for queries; cache hits skip the model, misses go in one forward pass."""
+        keys = [self._cache_key(q) for q in queries]
+        out = [None] * len(keys)
+        missing = {}  # key -> positions
+        with self._lock:
+            for i, k in enumerate(keys):
+                v = self._cache.get(k)
+                if v is not None:
+                    self._cache.move_to_end(k)
+                    out[i] = v
+                    self.cache_hits += 1
+                else:
+                    missing.setdefault(k, []).append(i)
+            self.cache_misses += len(missing)
+        if missing:
+            todo = list(missing)
+            emb = self.model.encode(todo, batch_size=BATCH_SIZE, convert_to_tensor=False)
+            emb = _unit_rows(np.asarray(emb, dtype=np.float32))
+            with self._lock:
+                for k, v in zip(todo, emb):
+                    for i in missing[k]:
+                        out[i] = v
+                    if self._cache_max > 0:
+                        self._cache[k] = v
+                        self._cache.move_to_end(k)
+                while len(self._cache) > self._cache_max:
+                    self._cache.popitem(last=False)
+        return np.stack(out)
 
     def predict(self, query: str, threshold: float = 0.6):
+        return self.predict_batch([query], threshold=threshold)[0]
+
+    def predict_batch(self, queries: List[str], threshold: float = 0.6) -> List[Tuple[str, float]]:
+        """(label, score) per query; one encode call for all cache misses."""
+        if not queries:
+            return []
         if self.embeddings is None or len(self.labels) == 0:
-            return "fallback", 0.0
-        q_emb = self.model.encode([query], convert_to_tensor=False)  # numpy
-        sims = cosine_similarity(q_emb, self.embeddings)[0]
-        best_idx = int(np.argmax(sims))
-        best_score = float(sims[best_idx])
-        best_label = self.labels[best_idx]
-        if best_score < threshold:
-            return "fallback", best_score
-        return best_label, best_score
+            return [("fallback", 0.0)] * len(queries)
+        sims = self._embed(queries) @ self.embeddings.T   # cosine, both sides unit-norm
+        best = np.argmax(sims, axis=1)
+        res = []
+        for row, j in enumerate(best):
+            score = float(sims[row, j])
+            res.append(("fallback", score) if score < threshold else (self.labels[int(j)], score))
+        return res
+
+    def cache_stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._cache), "max": self._cache_max,
+                    "hits": self.cache_hits, "misses": self.cache_misses}
 
     # helpers for facts/config
     def get_facts(self):
@@ -55,3 +203,28 @@ class SBERTIntentClassifier:
 
     def get_config(self):
         return self._raw_data.get("config", {})
+
+
+def _load_encoder(model_name: str, backend: str):
+    """
+    (backend, encoder). "onnx" runs onnxruntime on the exported int8 model and
+    never imports torch. Exporting is a build step (python -m utils.sbert_onnx
+    --export); without it this falls back to torch.
+    """
+    if backend == "onnx":
+        try:
+            from utils import sbert_onnx
+            if not sbert_onnx.is_exported(model_name):
+                raise FileNotFoundError(f"no ONNX export at {sbert_onnx.model_dir(model_name)}; "
+                                        f"run python -m utils.sbert_onnx --export")
+            return "onnx", sbert_onnx.OnnxSentenceEncoder(model_name)
+        except Exception as e:
+            print(f"[NLU] ONNX backend unavailable, using torch: {e}")
+    from sentence_transformers import SentenceTransformer
+    return "torch", SentenceTransformer(model_name)
+
+
+def _unit_rows(m: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    return m / n
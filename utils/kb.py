@@ -0,0 +1,270 @@
+# utils/kb.py
+# Tenant-keyed knowledge base: project facts, categories and per-tenant config.
+#
+# Sources, first match wins:
+#   clients/<tenant>/project_facts.yaml|.yml|.json   {"projects", "categories", "config"}
+#   clients/<tenant>/intents.json                    {"project_facts", "project_categories", "config"}
+#   intents.json (domain.resolve_intents_path)       for DEFAULT_TENANT only
+#
+# Each load becomes an immutable KnowledgeBase (read-only mappings, tuples,
+# prebuilt indexes). A daemon thread polls the files of loaded tenants every
+# KB_WATCH_SEC; on a content change (sha1, checked only when mtime/size move)
+# it builds the new version and swaps the reference, so turns never stat or
+# parse anything. Inactive tenants fall out of an LRU (KB_MAX_TENANTS); the
+# default tenant is pinned.
+import os
+import re
+import sys
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from utils.domain import resolve_intents_path
+
+# ---- Config (safe defaults if config.py is missing) ----
+try:
+    import config as CFG
+    CLIENTS_DIR = getattr(CFG, "KB_CLIENTS_DIR", "clients")
+    DEFAULT_TENANT = getattr(CFG, "KB_DEFAULT_TENANT", "ashar")
+    MAX_TENANTS = int(getattr(CFG, "KB_MAX_TENANTS", 256))
+    WATCH_SEC = float(getattr(CFG, "KB_WATCH_SEC", 2.0))
+except Exception:
+    CLIENTS_DIR = "clients"
+    DEFAULT_TENANT = "ashar"
+    MAX_TENANTS = 256
+    WATCH_SEC = 2.0
+
+DEFAULT_PHONE = "9999999999"
+_TENANT_RE = re.compile(r"[A-Za-z0-9_-]+")   # tenant names come from the client's query string
+_FILES = ("project_facts.yaml", "project_facts.yml", "project_facts.json", "intents.json")
+_EMPTY = MappingProxyType({})
+
+
+def _freeze(obj):
+    """Read-only copy: dicts -> MappingProxyType, lists -> tuples, strings interned."""
+    if isinstance(obj, dict):
+        return MappingProxyType({(_freeze(k)): _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(v) for v in obj)
+    if isinstance(obj, str):
+        return sys.intern(obj)
+    return obj
+
+
+@dataclass(frozen=True, eq=False)
+class KnowledgeBase:
+    tenant: str
+    version: str                                   # sha1 of the source bytes
+    source: str
+    facts: Mapping[str, Mapping[str, object]]      # project key -> record
+    categories: Mapping[str, Tuple[str, ...]]      # category -> project keys
+    config: Mapping[str, object]
+    project_category: Mapping[str, Optional[str]] = field(default_factory=lambda: _EMPTY)
+    names: Mapping[str, str] = field(default_factory=lambda: _EMPTY)  # project key -> display name
+
+    @property
+    def phone(self) -> str:
+        return str(self.config.get("phone_number", DEFAULT_PHONE))
+
+    def project(self, key: Optional[str]) -> Mapping[str, object]:
+        return self.facts.get(key or "", _EMPTY)
+
+    def value(self, key: Optional[str], name: str):
+        return self.project(key).get(name)
+
+    def projects_in(self, category: Optional[str]) -> Tuple[str, ...]:
+        return self.categories.get(category or "", ())
+
+
+def _parse(path: str, raw: bytes):
+    text = raw.decode("utf-8")
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        return yaml.safe_load(text) or {}
+    return json.loads(text)
+
+
+def build(tenant: str, path: str, raw: bytes) -> KnowledgeBase:
+    """Normalize either file shape into an immutable KnowledgeBase."""
+    data = _parse(path, raw)
+    facts = data.get("project_facts", data.get("projects")) or {}
+    cats = data.get("project_categories", data.get("categories")) or {}
+    config = data.get("config") or {}
+    facts = {str(k): dict(v or {}) for k, v in facts.items()}
+    return KnowledgeBase(
+        tenant=tenant,
+        version=hashlib.sha1(raw).hexdigest(),
+        source=path,
+        facts=_freeze(facts),
+        categories=_freeze({str(c): list(v or []) for c, v in cats.items()}),
+        config=_freeze(dict(config)),
+        project_category=_freeze({k: rec.get("category") for k, rec in facts.items()}),
+        names=_freeze({k: rec.get("name", k.title()) for k, rec in facts.items()}),
+    )
+
+
+class KnowledgeBaseService:
+    def __init__(self, clients_dir: str = CLIENTS_DIR, default_tenant: str = DEFAULT_TENANT,
+                 max_tenants: int = MAX_TENANTS, watch_sec: float = WATCH_SEC):
+        self.clients_dir = clients_dir
+        self.default_tenant = default_tenant
+        self.max_tenants = max(1, max_tenants)
+        self.watch_sec = watch_sec
+        self._kbs: "OrderedDict[str, KnowledgeBase]" = OrderedDict()
+        self._stamps: Dict[str, Tuple[str, int, int]] = {}   # tenant -> (path, mtime_ns, size)
+        self._missing: "OrderedDict[str, None]" = OrderedDict()  # tenants with no data (served the default)
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.loads = self.reloads = self.evictions = 0
+
+    # ---- lookup ----
+    def _source_for(self, tenant: str) -> Optional[str]:
+        if not _TENANT_RE.fullmatch(tenant):
+            return None   # never let "../x" or "/etc" reach a path join
+        for fn in _FILES:
+            p = os.path.join(self.clients_dir, tenant, fn)
+            if os.path.isfile(p):
+                return p
+        if tenant == self.default_tenant:
+            return resolve_intents_path()
+        return None
+
+    def get(self, tenant: Optional[str] = None) -> KnowledgeBase:
+        """Current KB for a tenant; unknown tenants get the default tenant's KB."""
+        tenant = tenant or self.default_tenant
+        kb = self._kbs.get(tenant)
+        if kb is not None:
+            with self._lock:
+                if tenant in self._kbs:
+                    self._kbs.move_to_end(tenant)
+            return kb
+        if tenant in self._missing:
+            return self.get(self.default_tenant)
+        return self._load(tenant)
+
+    def _load(self, tenant: str) -> KnowledgeBase:
+        path = self._source_for(tenant)
+        if path is None:
+            if tenant == self.default_tenant:
+                raise FileNotFoundError(f"no knowledge base for default tenant {tenant!r}")
+            print(f"[KB] no data for tenant {tenant!r}; using {self.default_tenant!r}")
+            return self._fall_back(tenant)
+        try:
+            st = os.stat(path)
+            with open(path, "rb") as f:
+                raw = f.read()
+            kb = build(tenant, path, raw)
+        except Exception as e:
+            if tenant == self.default_tenant:
+                raise
+            # a broken client file must not fail the turn; the watcher retries it
+            print(f"[KB] load of {tenant!r} failed ({e}); using {self.default_tenant!r}")
+            return self._fall_back(tenant)
+        with self._lock:
+            self._kbs[tenant] = kb
+            self._kbs.move_to_end(tenant)
+            self._stamps[tenant] = (path, st.st_mtime_ns, st.st_size)
+            self.loads += 1
+            while len(self._kbs) > self.max_tenants:
+                victim = next((t for t in self._kbs if t != self.default_tenant), None)
+                if victim is None:
+                    break
+                self._kbs.pop(victim)
+                self._stamps.pop(victim, None)
+                self.evictions += 1
+        self._ensure_watcher()
+        return kb
+
+    def _fall_back(self, tenant: str) -> KnowledgeBase:
+        with self._lock:
+            self._missing[tenant] = None
+            while len(self._missing) > self.max_tenants:
+                self._missing.popitem(last=False)
+        self._ensure_watcher()
+        return self.get(self.default_tenant)
+
+    # ---- change detection (off the turn path) ----
+    def refresh(self) -> List[str]:
+        """Reload tenants whose source changed; returns their names."""
+        with self._lock:
+            stamps = list(self._stamps.items())
+            missing = list(self._missing)
+        for tenant in missing:
+            if self._source_for(tenant):
+                with self._lock:
+                    self._missing.pop(tenant, None)   # loaded on its next turn
+        changed = []
+        for tenant, (path, mtime, size) in stamps:
+            new_path = self._source_for(tenant) or path
+            try:
+                st = os.stat(new_path)
+            except OSError:
+                continue   # keep serving the last good version
+            if (new_path, st.st_mtime_ns, st.st_size) == (path, mtime, size):
+                continue
+            try:
+                with open(new_path, "rb") as f:
+                    raw = f.read()
+                old = self._kbs.get(tenant)
+                if old is not None and old.source == new_path and hashlib.sha1(raw).hexdigest() == old.version:
+                    kb = old   # touched, not changed
+                else:
+                    kb = build(tenant, new_path, raw)
+            except Exception as e:
+                print(f"[KB] reload of {tenant!r} failed, keeping previous version: {e}")
+                continue
+            with self._lock:
+                if tenant not in self._stamps:
+                    continue   # evicted meanwhile
+                self._stamps[tenant] = (new_path, st.st_mtime_ns, st.st_size)
+                if kb is not self._kbs.get(tenant):
+                    self._kbs[tenant] = kb   # atomic swap; readers keep their old reference
+                    self.reloads += 1
+                    changed.append(tenant)
+        return changed
+
+    def _ensure_watcher(self):
+        if self.watch_sec <= 0 or self._watcher is not None:
+            return
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name="kb-watch", daemon=True)
+                self._watcher.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_sec):
+            try:
+                for t in self.refresh():
+                    print(f"[KB] reloaded {t!r} (version {self._kbs[t].version[:8]})")
+            except Exception as e:
+                print(f"[KB] watcher error: {e}")
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tenants": len(self._kbs), "max": self.max_tenants, "loads": self.loads,
+                    "reloads": self.reloads, "evictions": self.evictions}
+
+
+_service: Optional[KnowledgeBaseService] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> KnowledgeBaseService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = KnowledgeBaseService()
+    return _service
+
+
+def get(tenant: Optional[str] = None) -> KnowledgeBase:
+    return get_service().get(tenant)
@@ -0,0 +1,330 @@
+# utils/metrics.py
+# Per-turn latency tracing and process metrics, stdlib only.
+#
+#   with metrics.turn(sess.id, n, tenant=...):      # one trace per caller turn
+#       with metrics.span("stt"):                   # timed, nested freely
+#           ...
+#       metrics.inc("barge_ins")                    # counter (+ per-turn count)
+#
+# Every span feeds a latency histogram (Prometheus buckets + a rolling window
+# for p50/p95/p99). When a turn trace is active (a contextvar, so it follows
+# asyncio tasks and any thread started through copy_context), the span is also
+# appended to it; finished turns are written one JSON object per line to
+# METRICS_TRACE_PATH. serve() exposes everything as Prometheus text on
+# http://METRICS_HOST:METRICS_PORT/metrics.
+import os
+import json
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+# ---- Config (safe defaults if config.py is missing) ----
+try:
+    import config as CFG
+    ENABLED = bool(getattr(CFG, "METRICS_ENABLED", True))
+    HOST = getattr(CFG, "METRICS_HOST", "127.0.0.1")
+    PORT = int(getattr(CFG, "METRICS_PORT", 9108))
+    TRACE_PATH = getattr(CFG, "METRICS_TRACE_PATH", "logs/traces.jsonl")
+    WINDOW = int(getattr(CFG, "METRICS_WINDOW", 2048))
+except Exception:
+    ENABLED = True
+    HOST = "127.0.0.1"
+    PORT = 9108
+    TRACE_PATH = "logs/traces.jsonl"
+    WINDOW = 2048
+
+PREFIX = "voicebot"
+QUANTILES = (0.5, 0.95, 0.99)
+# seconds; spans range from sub-ms NLU stages to multi-second playback
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12)
+
+
+class Histogram:
+    """Cumulative buckets for Prometheus plus the last `window` samples for quantiles."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS, window: int = WINDOW):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent: deque = deque(maxlen=max(1, window))
+
+    def observe(self, v: float):
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+        self.recent.append(v)
+
+    def quantiles(self, qs: Iterable[float] = QUANTILES) -> Dict[float, float]:
+        xs = sorted(self.recent)
+        if not xs:
+            return {q: 0.0 for q in qs}
+        return {q: xs[min(len(xs) - 1, int(q * len(xs)))] for q in qs}
+
+
+class Trace:
+    """Spans and counts of one caller turn."""
+
+    def __init__(self, session: str, turn: int, **attrs):
+        self.session = session
+        self.turn = turn
+        self.attrs = dict(attrs)
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        self.spans: List[dict] = []
+        self.counts: Dict[str, int] = {}
+        self.total_ms: Optional[float] = None
+
+    @property
+    def id(self) -> str:
+        return f"{self.session}-{self.turn}"
+
+    def add(self, name: str, start: float, dur: float, attrs: Optional[dict] = None):
+        sp = {"name": name, "start_ms": round((start - self.t0) * 1000, 3), "ms": round(dur * 1000, 3)}
+        if attrs:
+            sp.update(attrs)
+        self.spans.append(sp)   # list.append is atomic; pool threads may add concurrently
+
+    def to_dict(self) -> dict:
+        return {"ts": round(self.ts, 3), "session": self.session, "turn": self.turn, **self.attrs,
+                "total_ms": self.total_ms, "counts": dict(self.counts), "spans": list(self.spans)}
+
+
+_lock = threading.Lock()
+_spans: Dict[str, Histogram] = {}      # span name -> latency histogram
+_values: Dict[str, Histogram] = {}     # e.g. stt_decodes_per_turn
+_counters: Dict[str, float] = {}
+_gauges: List[Callable[[], Dict[str, float]]] = []
+_current: contextvars.ContextVar = contextvars.ContextVar("voicebot_trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def _observe(table: Dict[str, Histogram], name: str, v: float, buckets: Tuple[float, ...]):
+    with _lock:
+        h = table.get(name)
+        if h is None:
+            h = table[name] = Histogram(buckets)
+        h.observe(v)
+
+
+def observe(name: str, seconds: float, start: Optional[float] = None, **attrs):
+    """Record an externally timed span (e.g. across awaits); start is a perf_counter() value."""
+    if not ENABLED:
+        return
+    _observe(_spans, name, seconds, LATENCY_BUCKETS)
+    tr = _current.get()
+    if tr is not None:
+        tr.add(name, time.perf_counter() - seconds if start is None else start, seconds, attrs)
+
+
+def record(name: str, value: float, buckets: Tuple[float, ...] = COUNT_BUCKETS):
+    """Record a non-latency distribution sample (e.g. decodes per turn)."""
+    if ENABLED:
+        _observe(_values, name, value, buckets)
+
+
+def inc(name: str, n: float = 1):
+    """Bump a process counter and, inside a turn, that turn's count."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+    tr = _current.get()
+    if tr is not None:
+        tr.counts[name] = tr.counts.get(name, 0) + n
+
+
+def register_gauges(fn: Callable[[], Dict[str, float]]):
+    """fn() -> {name: value}, sampled on every scrape."""
+    _gauges.append(fn)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block. Yields its attrs dict, so the block can add fields (e.g. cache hit)."""
+    if not ENABLED:
+        yield attrs
+        return
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        dur = time.perf_counter() - t0
+        _observe(_spans, name, dur, LATENCY_BUCKETS)
+        tr = _current.get()
+        if tr is not None:
+            tr.add(name, t0, dur, attrs)
+
+
+@contextmanager
+def turn(session: str, turn_no: int, **attrs):
+    """Open a turn trace for this context; on exit it is timed, counted and logged."""
+    tr = Trace(session, turn_no, **attrs)
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+        tr.total_ms = round((time.perf_counter() - tr.t0) * 1000, 3)
+        if ENABLED:
+            _observe(_spans, "turn", tr.total_ms / 1000, LATENCY_BUCKETS)
+            inc("turns")
+            write_trace(tr)
+
+
+# ---- JSON-lines trace log ----
+_trace_lock = threading.Lock()
+_trace_file = None
+
+
+def write_trace(tr: Trace):
+    global _trace_file, TRACE_PATH
+    if not TRACE_PATH:
+        return
+    line = json.dumps(tr.to_dict(), ensure_ascii=False, default=str)
+    with _trace_lock:
+        try:
+            if _trace_file is None:
+                os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+                _trace_file = open(TRACE_PATH, "a", encoding="utf-8", buffering=1)
+            _trace_file.write(line + "\n")
+        except OSError as e:
+            print(f"[Metrics] trace log disabled: {e}")
+            _trace_file, TRACE_PATH = None, None
+
+
+# ---- export ----
+def _metric(name: str) -> str:
+    return PREFIX + "_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def _hist_lines(family: str, h: Histogram, label: str = "") -> List[str]:
+    sep = "," if label else ""
+    out, acc = [], 0
+    for le, c in zip(h.buckets, h.counts):
+        acc += c
+        out.append(f'{family}_bucket{{{label}{sep}le="{_fmt(le)}"}} {acc}')
+    out.append(f'{family}_bucket{{{label}{sep}le="+Inf"}} {h.count}')
+    lab = f"{{{label}}}" if label else ""
+    out.append(f"{family}_sum{lab} {_fmt(h.sum)}")
+    out.append(f"{family}_count{lab} {h.count}")
+    return out
+
+
+def prometheus_text() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    with _lock:
+        spans = {k: (h, h.quantiles()) for k, h in sorted(_spans.items())}
+        values = {k: (h, h.quantiles()) for k, h in sorted(_values.items())}
+        counters = dict(sorted(_counters.items()))
+        lines: List[str] = []
+        if spans:
+            fam = f"{PREFIX}_span_seconds"
+            lines += [f"# HELP {fam} Latency of pipeline spans.", f"# TYPE {fam} histogram"]
+            for name, (h, _) in spans.items():
+                lines += _hist_lines(fam, h, f'span="{name}"')
+            fam = f"{PREFIX}_span_quantile_seconds"
+            lines += [f"# HELP {fam} Span latency quantiles over the last {WINDOW} samples.",
+                      f"# TYPE {fam} gauge"]
+            for name, (_, qs) in spans.items():
+                lines += [f'{fam}{{span="{name}",quantile="{q}"}} {_fmt(v)}' for q, v in qs.items()]
+        for name, (h, qs) in values.items():
+            fam = _metric(name)
+            lines += [f"# TYPE {fam} histogram"] + _hist_lines(fam, h)
+            lines += [f"# TYPE {fam}_quantile gauge"]
+            lines += [f'{fam}_quantile{{quantile="{q}"}} {_fmt(v)}' for q, v in qs.items()]
+    for name, v in counters.items():
+        fam = _metric(name) + "_total"
+        lines += [f"# TYPE {fam} counter", f"{fam} {_fmt(v)}"]
+    for fn in list(_gauges):
+        try:
+            for name, v in fn().items():
+                fam = _metric(name)
+                lines += [f"# TYPE {fam} gauge", f"{fam} {_fmt(v)}"]
+        except Exception as e:
+            print(f"[Metrics] gauge callback failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """{span: {count, p50_ms, p95_ms, p99_ms}} plus counters, for logs and tools."""
+    with _lock:
+        out = {name: {"count": h.count, **{f"p{int(q * 100)}_ms": round(v * 1000, 2)
+                                           for q, v in h.quantiles().items()}}
+               for name, h in sorted(_spans.items())}
+        out["counters"] = dict(_counters)
+    return out
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _values.clear()
+        _counters.clear()
+
+
+# ---- HTTP endpoint ----
+_routes: Dict[str, Callable[[Dict[str, str]], Tuple[str, str]]] = {
+    "/metrics": lambda q: ("text/plain; version=0.0.4; charset=utf-8", prometheus_text()),
+    "/traces/summary": lambda q: ("application/json", json.dumps(snapshot())),
+}
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def add_route(path: str, fn: Callable[[Dict[str, str]], Tuple[str, str]]):
+    """Serve fn(query) -> (content_type, body) at path on the metrics port."""
+    _routes[path] = fn
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        fn = _routes.get(url.path)
+        if fn is None:
+            self.send_error(404)
+            return
+        try:
+            ctype, body = fn(dict(parse_qsl(url.query)))
+            data = body.encode("utf-8")
+            self.send_response(200)
+        except Exception as e:
+            ctype, data = "text/plain", f"error: {e}\n".encode("utf-8")
+            self.send_response(500)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass   # scrapes every few seconds would flood stdout
+
+
+def serve(port: int = PORT, host: str = HOST) -> Optional[ThreadingHTTPServer]:
+    """Start the endpoint in a daemon thread (once). port <= 0 disables it."""
+    global _server
+    if _server is not None or not ENABLED or port <= 0:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"[Metrics] endpoint not started on {host}:{port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[Metrics] http://{host}:{port}/metrics")
+    return _server
@@ -2,24 +2,27 @@
 import re
 import unicodedata
 
+# Compiled once; normalize() runs on every turn
+_PUNCT = str.maketrans({"।": "."})  # Danda -> period for consistency
+_HI_DROP = re.compile(r"[^ऀ-ॿ0-9\s.,?!\-–—():;\"']+")
+_EN_DROP = re.compile(r"[^a-z0-9\s.,?!\-–—():;\"']+")
+_SPACES = re.compile(r"\s+")
+
 def normalize(text: str, lang: str = None) -> str:
     """
     Normalize text for NLU while preserving Hindi matras.
     """
-    # Ensure composed characters (fixes dropped matras)
-    text = unicodedata.normalize("NFC", text)
-
-    # Normalize some punctuation across both langs
-    text = text.replace("।", ".")  # Danda -> period for consistency
+    # Ensure composed characters (fixes dropped matras); skip the work for plain ASCII
+    if not text.isascii():
+        text = unicodedata.normalize("NFC", text).translate(_PUNCT)
 
     if lang == "hi":
         # Keep Devanagari block + digits + spaces + common punctuation
-        text = re.sub(r"[^ऀ-ॿ0-9\s.,?!\-–—():;\"']", "", text)
+        text = _HI_DROP.sub("", text)
     elif lang == "en":
-        text = text.lower()
-        text = re.sub(r"[^a-z0-9\s.,?!\-–—():;\"']", "", text)
+        text = _EN_DROP.sub("", text.lower())
     else:
         # Unknown: be conservative
-        text = re.sub(r"\s+", " ", text)
+        text = _SPACES.sub(" ", text)
 
     return text.strip()
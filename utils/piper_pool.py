@@ -0,0 +1,217 @@
+# utils/piper_pool.py
+# Long-lived Piper workers (one process per slot, per voice) so each reply
+# skips process start, ONNX model load and espeak-ng init.
+#
+# Each worker runs `piper --json-input --output_dir <dir>`; we write one JSON
+# line {"text": ..., "output_file": ...} per utterance and Piper prints the
+# written path on stdout when the WAV is complete.
+import os
+import json
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+import collections
+from typing import Dict, List, Optional
+
+
+class PiperTimeout(RuntimeError):
+    """Piper did not finish in time (the worker has already been restarted)."""
+
+
+class PiperWorker:
+    """One persistent Piper process for a single voice model."""
+
+    def __init__(self, piper_bin: str, voice: str, extra_args: List[str], work_dir: str):
+        self.piper_bin = piper_bin
+        self.voice = voice
+        self.extra_args = list(extra_args)
+        self.work_dir = work_dir
+        self.proc: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._eof = threading.Event()
+        self._stderr = collections.deque(maxlen=20)
+
+    # ---- lifecycle ----
+    def start(self):
+        cmd = [
+            self.piper_bin,
+            "--model", self.voice,
+            "--json-input",
+            "--output_dir", self.work_dir,
+            *self.extra_args,
+        ]
+        self._lines = queue.Queue()
+        self._eof = threading.Event()
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        threading.Thread(target=self._pump_stdout, args=(self.proc, self._lines, self._eof),
+                         daemon=True).start()
+        threading.Thread(target=self._pump_stderr, args=(self.proc,), daemon=True).start()
+
+    def stop(self):
+        p, self.proc = self.proc, None
+        if p is None:
+            return
+        try:
+            p.stdin.close()
+        except Exception:
+            pass
+        try:
+            p.wait(timeout=2)
+        except Exception:
+            p.kill()
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def alive(self) -> bool:
+        # stdout EOF counts as dead even before the exit status is reaped
+        return self.proc is not None and self.proc.poll() is None and not self._eof.is_set()
+
+    # stdout/stderr must be drained continuously or Piper blocks on a full pipe
+    @staticmethod
+    def _pump_stdout(proc: subprocess.Popen, lines: "queue.Queue[Optional[str]]",
+                     eof: threading.Event):
+        for raw in proc.stdout:
+            lines.put(raw.decode("utf-8", "ignore").strip())
+        eof.set()
+        lines.put(None)  # EOF => process died
+
+    def _pump_stderr(self, proc: subprocess.Popen):
+        for raw in proc.stderr:
+            self._stderr.append(raw.decode("utf-8", "ignore").rstrip())
+
+    def last_stderr(self) -> str:
+        return "\n".join(self._stderr)
+
+    # ---- work ----
+    def synthesize(self, text: str, out_path: str, timeout: float = 20.0) -> str:
+        """Render one utterance to out_path; raises RuntimeError on crash/timeout."""
+        if not self.alive():
+            self.restart()
+        req = json.dumps({"text": text, "output_file": out_path}, ensure_ascii=False) + "\n"
+        try:
+            self.proc.stdin.write(req.encode("utf-8"))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise RuntimeError(f"Piper worker died. stderr={self.last_stderr()}")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                self.restart()  # a hung worker is useless; start fresh for the next call
+                raise PiperTimeout(f"Piper timed out. stderr={self.last_stderr()}")
+            try:
+                line = self._lines.get(timeout=left)
+            except queue.Empty:
+                continue
+            if line is None:
+                raise RuntimeError(f"Piper worker exited (code {self.proc.poll()}). stderr={self.last_stderr()}")
+            if os.path.abspath(line) == os.path.abspath(out_path):
+                return out_path
+            # anything else on stdout is noise; keep waiting for our path
+
+
+class PiperPool:
+    """
+    pool_size persistent workers per voice. Callers check a worker out for
+    one utterance, so up to pool_size syntheses per voice run in parallel.
+    """
+
+    def __init__(self, piper_bin: str, voices: List[str], pool_size: int = 1,
+                 extra_args: Optional[List[str]] = None, timeout: float = 20.0):
+        self.piper_bin = piper_bin
+        self.pool_size = max(1, int(pool_size))
+        self.extra_args = list(extra_args or [])
+        self.timeout = timeout
+        self.work_dir = tempfile.mkdtemp(prefix="piper_pool_")
+        self._idle: Dict[str, "queue.Queue[PiperWorker]"] = {}
+        self._all: Dict[str, List[PiperWorker]] = {}
+        self._lock = threading.Lock()
+        for v in dict.fromkeys(voices):
+            self._idle[v] = queue.Queue()
+            self._all[v] = []
+
+    def _grow(self, voice: str) -> bool:
+        with self._lock:
+            if voice not in self._all:
+                self._idle[voice] = queue.Queue()
+                self._all[voice] = []
+            if len(self._all[voice]) >= self.pool_size:
+                return False
+            w = PiperWorker(self.piper_bin, voice, self.extra_args, self.work_dir)
+            self._all[voice].append(w)
+        w.start()
+        self._idle[voice].put(w)
+        return True
+
+    def start(self, voices: Optional[List[str]] = None):
+        """Eagerly spawn every worker (otherwise they start on first use)."""
+        for v in (voices or list(self._all)):
+            while self._grow(v):
+                pass
+
+    def synthesize(self, text: str, voice: str, out_path: str) -> str:
+        if voice not in self._idle or self._idle[voice].empty():
+            self._grow(voice)  # lazily add a worker, up to pool_size
+        idle = self._idle[voice]
+        try:
+            w = idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"Piper pool busy: no idle worker for {os.path.basename(voice)} "
+                               f"within {self.timeout:g}s (pool_size={self.pool_size})") from None
+        try:
+            try:
+                return w.synthesize(text, out_path, timeout=self.timeout)
+            except PiperTimeout:
+                raise   # already restarted; a retry would just wait out the timeout again
+            except RuntimeError:
+                # one retry on a fresh process (crash mid-utterance, stale pipe)
+                w.restart()
+                return w.synthesize(text, out_path, timeout=self.timeout)
+        finally:
+            idle.put(w)
+
+    def health(self) -> Dict[str, dict]:
+        """
+        Per-voice liveness. Dead *idle* workers are restarted here; a busy
+        worker that dies is restarted by its own synthesize() call.
+        """
+        out = {}
+        for v, workers in self._all.items():
+            idle = self._idle[v]
+            checked = []
+            while True:
+                try:
+                    checked.append(idle.get_nowait())
+                except queue.Empty:
+                    break
+            for w in checked:
+                if not w.alive():
+                    try:
+                        w.restart()
+                    except Exception:
+                        pass
+                idle.put(w)
+            out[v] = {"size": len(workers),
+                      "alive": sum(int(w.alive()) for w in workers),
+                      "idle": len(checked),
+                      "restarts": sum(w.restarts for w in workers)}
+        return out
+
+    def close(self):
+        for workers in self._all.values():
+            for w in workers:
+                w.stop()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
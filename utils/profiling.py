@@ -0,0 +1,392 @@
+# utils/profiling.py
+# On-demand profiling of a live bot process (main.py loop or server.py).
+#
+# Triggers (install() wires both, per config):
+#   kill -USR1 <pid>    cProfile the next PROFILE_TURNS turns
+#   kill -USR2 <pid>    stack-sample every thread for PROFILE_SECONDS
+#   curl 'http://127.0.0.1:9108/debug/profile?mode=sample&seconds=10'
+#   curl 'http://127.0.0.1:9108/debug/profile?mode=cprofile&turns=5&memory=1'
+#   curl  http://127.0.0.1:9108/debug/profile/status
+#
+# cProfile sees the threads that run turn work: the caller's thread inside
+# turn() (main.py) and server stage jobs run through call(). The sampler
+# walks sys._current_frames() of every thread, so it also covers Whisper's
+# pool/batch threads and the playback producer. With memory on, tracemalloc
+# snapshots are taken around each turn and diffed (process-wide, so turns
+# that overlap in the server share allocations). The server passes
+# offload=True so snapshots, diffs and artifact writing run on one profiler
+# thread instead of its asyncio loop.
+#
+# Artifacts go to PROFILE_DIR, named <time>_<mode>_<first turn>..<last turn>:
+#   .prof (pstats) + .txt        cProfile
+#   .folded + .txt               sampler (flamegraph.pl / speedscope input)
+#   .mem.txt + .tracemalloc      per-turn allocation diffs, last snapshot
+import os
+import io
+import sys
+import time
+import json
+import signal
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from utils import metrics
+
+# ---- Config (safe defaults if config.py is missing) ----
+try:
+    import config as CFG
+    PROFILE_DIR = getattr(CFG, "PROFILE_DIR", "logs/profiles")
+    SIGNALS = bool(getattr(CFG, "PROFILE_SIGNALS", True))
+    ENDPOINT = bool(getattr(CFG, "PROFILE_ENDPOINT", True))
+    DEFAULT_TURNS = int(getattr(CFG, "PROFILE_TURNS", 20))
+    DEFAULT_SECONDS = float(getattr(CFG, "PROFILE_SECONDS", 30))
+    SAMPLE_HZ = float(getattr(CFG, "PROFILE_SAMPLE_HZ", 100))
+    MEMORY = bool(getattr(CFG, "PROFILE_MEMORY", True))
+    MEMORY_FRAMES = int(getattr(CFG, "PROFILE_MEMORY_FRAMES", 16))
+except Exception:
+    PROFILE_DIR = "logs/profiles"
+    SIGNALS = True
+    ENDPOINT = True
+    DEFAULT_TURNS = 20
+    DEFAULT_SECONDS = 30.0
+    SAMPLE_HZ = 100.0
+    MEMORY = True
+    MEMORY_FRAMES = 16
+
+MODES = ("cprofile", "sample")
+MAX_SECONDS = 600.0     # a forgotten capture must not run forever
+
+
+class Capture:
+    """One profiling run: cProfile over turns, or stack sampling over turns/seconds."""
+
+    def __init__(self, mode: str, turns: Optional[int], seconds: Optional[float], memory: bool):
+        self.mode = mode
+        self.turns = turns
+        self.seconds = min(seconds or MAX_SECONDS, MAX_SECONDS)
+        self.memory = memory
+        self.t0 = time.time()
+        self.turn_ids: List[str] = []
+        self.busy = 0                      # cProfile sections skipped (another profiler active)
+        self.stats: Optional[pstats.Stats] = None
+        self.stacks: Counter = Counter()   # folded stack -> samples
+        self.samples = 0
+        self.mem: List[str] = []
+        self.last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.started_tracemalloc = False
+        self.done = threading.Event()
+        self.artifacts: List[str] = []
+
+    def info(self) -> dict:
+        return {"mode": self.mode, "turns": self.turns, "seconds": self.seconds, "memory": self.memory,
+                "elapsed_s": round(time.time() - self.t0, 1), "turns_seen": len(self.turn_ids),
+                "samples": self.samples, "busy": self.busy, "artifacts": self.artifacts}
+
+
+_lock = threading.Lock()
+_active: Optional[Capture] = None
+_last: Optional[Capture] = None
+
+
+def status() -> dict:
+    cap = _active
+    return {"active": cap.info() if cap else None, "last": _last.info() if _last else None}
+
+
+def start(mode: str = "cprofile", turns: Optional[int] = None, seconds: Optional[float] = None,
+          memory: bool = MEMORY) -> dict:
+    """Arm a capture. cprofile defaults to DEFAULT_TURNS turns, sample to DEFAULT_SECONDS."""
+    global _active
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    if turns is None and seconds is None:
+        turns, seconds = (DEFAULT_TURNS, None) if mode == "cprofile" else (None, DEFAULT_SECONDS)
+    with _lock:
+        if _active is not None:
+            return {"started": False, "reason": "capture already running", **status()}
+        cap = _active = Capture(mode, turns, seconds, memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_FRAMES)
+        cap.started_tracemalloc = True
+    target = _sampler if mode == "sample" else _timer
+    threading.Thread(target=target, args=(cap,), name=f"profile-{mode}", daemon=True).start()
+    print(f"[Profile] {mode} capture started (turns={turns} seconds={cap.seconds:g} memory={memory})")
+    return {"started": True, **status()}
+
+
+def stop() -> Optional[dict]:
+    """End the running capture now and write its artifacts."""
+    global _active, _last
+    with _lock:
+        cap, _active = _active, None
+    if cap is None:
+        return None
+    cap.done.set()
+    if cap.started_tracemalloc:
+        tracemalloc.stop()
+    try:
+        _write(cap)
+    except Exception as e:
+        print(f"[Profile] writing artifacts failed: {e}")
+    _last = cap
+    print(f"[Profile] {cap.mode} capture done: {', '.join(cap.artifacts) or 'nothing captured'}")
+    return cap.info()
+
+
+def _timer(cap: Capture):
+    if not cap.done.wait(cap.seconds):
+        stop()
+
+
+# ---- cProfile ----
+def _profile_section(cap: Capture):
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        # 3.12+: one cProfile per process at a time; concurrent turns are skipped
+        cap.busy += 1
+        return None
+    return prof
+
+
+def _merge(cap: Capture, prof: cProfile.Profile):
+    prof.disable()
+    with _lock:
+        if cap.stats is None:
+            cap.stats = pstats.Stats(prof)
+        else:
+            cap.stats.add(prof)
+
+
+def call(fn, *args):
+    """Run fn(*args), under cProfile if a cprofile capture is running (server stage jobs)."""
+    cap = _active
+    if cap is None or cap.mode != "cprofile":
+        return fn(*args)
+    prof = _profile_section(cap)
+    if prof is None:
+        return fn(*args)
+    try:
+        return fn(*args)
+    finally:
+        _merge(cap, prof)
+
+
+@contextmanager
+def turn(turn_id: str, profile_thread: bool = True, offload: bool = False):
+    """
+    Wrap one caller turn. Counts it toward an N-turn capture, profiles this
+    thread (cprofile mode, unless profile_thread=False) and diffs tracemalloc
+    snapshots around it. offload=True moves the snapshots, the diff and a
+    finishing stop() to the profiler thread (callers on an event loop).
+    Free when no capture is running.
+    """
+    cap = _active
+    if cap is None:
+        yield
+        return
+    prof = _profile_section(cap) if (profile_thread and cap.mode == "cprofile") else None
+    before = None
+    if cap.memory and tracemalloc.is_tracing():
+        before = _offload(_snapshot) if offload else _snapshot()
+    try:
+        yield
+    finally:
+        if prof is not None:
+            _merge(cap, prof)
+        if offload:
+            _offload(_end_turn, cap, turn_id, before)
+        else:
+            _end_turn(cap, turn_id, before)
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _offload(fn, *args) -> Future:
+    # one worker: a turn's "before" snapshot is always taken before its diff
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(1, thread_name_prefix="profile-mem")
+    return _pool.submit(fn, *args)
+
+
+def _end_turn(cap: Capture, turn_id: str, before):
+    try:
+        if isinstance(before, Future):
+            before = before.result()
+        if before is not None and tracemalloc.is_tracing():
+            _mem_diff(cap, turn_id, before)
+    except Exception as e:
+        print(f"[Profile] memory diff for {turn_id} failed: {e}")
+    with _lock:
+        cap.turn_ids.append(turn_id)
+        finished = cap.turns is not None and len(cap.turn_ids) >= cap.turns
+    if finished and cap is _active:
+        stop()
+
+
+# ---- memory ----
+_MEM_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, pstats.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+
+
+def _snapshot() -> Optional[tracemalloc.Snapshot]:
+    if not tracemalloc.is_tracing():
+        return None   # the capture stopped meanwhile
+    snap = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    return snap
+
+
+def _mem_diff(cap: Capture, turn_id: str, before: tracemalloc.Snapshot, top: int = 15):
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot().filter_traces(_MEM_FILTERS)
+    diff = after.compare_to(before.filter_traces(_MEM_FILTERS), "lineno")
+    grown = sum(d.size_diff for d in diff)
+    lines = [f"== turn {turn_id}: net {grown / 1024:+.1f} KiB, traced peak {peak / 1024:.1f} KiB"]
+    lines += [f"  {d}" for d in diff[:top]]
+    with _lock:
+        cap.mem.append("\n".join(lines))
+        cap.last_snapshot = after
+
+
+# ---- sampler ----
+def _fold(frame) -> str:
+    parts = []
+    while frame is not None:
+        co = frame.f_code
+        parts.append(f"{os.path.basename(co.co_filename)}:{co.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _sampler(cap: Capture):
+    me = threading.get_ident()
+    names = {}
+    interval = 1.0 / max(1.0, SAMPLE_HZ)
+    deadline = time.monotonic() + cap.seconds
+    while not cap.done.is_set() and time.monotonic() < deadline:
+        if len(names) != threading.active_count():
+            names = {t.ident: t.name for t in threading.enumerate()}
+        for tid, frame in sys._current_frames().items():
+            if tid != me:
+                cap.stacks[f"{names.get(tid, tid)};{_fold(frame)}"] += 1
+        cap.samples += 1
+        time.sleep(interval)
+    if not cap.done.is_set():
+        stop()
+
+
+# ---- artifacts ----
+def _base(cap: Capture) -> str:
+    ids = cap.turn_ids
+    span = f"{ids[0]}..{ids[-1]}" if ids else "noturns"
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(cap.t0))
+    safe = "".join(c if c.isalnum() or c in "-._" else "_" for c in span)
+    return os.path.join(PROFILE_DIR, f"{stamp}_{cap.mode}_{safe}")
+
+
+def _write(cap: Capture):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = _base(cap)
+    head = json.dumps({k: v for k, v in cap.info().items() if k != "artifacts"}) + "\n" \
+        + f"turn ids: {' '.join(cap.turn_ids) or '-'}\n\n"
+    if cap.stats is not None:
+        cap.stats.dump_stats(base + ".prof")
+        out = io.StringIO()
+        st = pstats.Stats(base + ".prof", stream=out)
+        st.sort_stats("cumulative").print_stats(40)
+        st.sort_stats("tottime").print_stats(25)
+        _text(base + ".txt", head + out.getvalue())
+        cap.artifacts += [base + ".prof", base + ".txt"]
+    if cap.stacks:
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, n in cap.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        _text(base + ".txt", head + _sample_summary(cap))
+        cap.artifacts += [base + ".folded", base + ".txt"]
+    if cap.mem:
+        _text(base + ".mem.txt", head + "\n\n".join(cap.mem) + "\n")
+        cap.artifacts.append(base + ".mem.txt")
+    if cap.last_snapshot is not None:
+        cap.last_snapshot.dump(base + ".tracemalloc")
+        cap.artifacts.append(base + ".tracemalloc")
+
+
+# leaf frames of threads that are parked, not working
+_IDLE = ("threading.py:wait:", "threading.py:_wait_for_tstate_lock:", "selectors.py:select:",
+         "queue.py:get:", "socketserver.py:serve_forever:")
+
+
+def _sample_summary(cap: Capture, top: int = 40) -> str:
+    """Self and inclusive sample counts per frame over busy samples (thread names dropped)."""
+    own: Counter = Counter()
+    incl: Counter = Counter()
+    idle = 0
+    for stack, n in cap.stacks.items():
+        frames = stack.split(";")[1:]
+        if not frames or frames[-1].startswith(_IDLE):
+            idle += n
+            continue
+        own[frames[-1]] += n
+        for fr in set(frames):
+            incl[fr] += n
+    total = sum(own.values()) or 1
+    rows = [f"{cap.samples} sample rounds at {SAMPLE_HZ:g} Hz: {sum(own.values())} busy, "
+            f"{idle} idle thread samples", "", "self:"]
+    rows += [f"  {n / total:6.1%}  {n:7d}  {fr}" for fr, n in own.most_common(top)]
+    rows += ["", "inclusive:"]
+    rows += [f"  {n / total:6.1%}  {n:7d}  {fr}" for fr, n in incl.most_common(top)]
+    return "\n".join(rows) + "\n"
+
+
+def _text(path: str, body: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(body)
+
+
+# ---- triggers ----
+def _start_async(**kw):
+    # signal handlers run on the main thread between bytecodes; keep them lock-free
+    threading.Thread(target=lambda: start(**kw), name="profile-trigger", daemon=True).start()
+
+
+def _route_start(q: Dict[str, str]):
+    turns = int(q["turns"]) if q.get("turns") else None
+    seconds = float(q["seconds"]) if q.get("seconds") else None
+    memory = q.get("memory", "1" if MEMORY else "0") not in ("0", "false", "no")
+    res = start(q.get("mode", "cprofile"), turns=turns, seconds=seconds, memory=memory)
+    return "application/json", json.dumps(res)
+
+
+def _route_stop(q: Dict[str, str]):
+    return "application/json", json.dumps({"stopped": stop()})
+
+
+def install(signals: bool = SIGNALS, endpoint: bool = ENDPOINT):
+    """SIGUSR1/SIGUSR2 handlers (call from the main thread) and /debug/profile on the metrics port."""
+    if signals and hasattr(signal, "SIGUSR1"):
+        try:
+            signal.signal(signal.SIGUSR1, lambda *_: _start_async(mode="cprofile", turns=DEFAULT_TURNS))
+            signal.signal(signal.SIGUSR2, lambda *_: _start_async(mode="sample", seconds=DEFAULT_SECONDS))
+            print(f"[Profile] kill -USR1 {os.getpid()} (cProfile {DEFAULT_TURNS} turns), "
+                  f"-USR2 (sample {DEFAULT_SECONDS:g}s)")
+        except ValueError as e:   # not the main thread
+            print(f"[Profile] signals not installed: {e}")
+    if endpoint:
+        metrics.add_route("/debug/profile", _route_start)
+        metrics.add_route("/debug/profile/stop", _route_stop)
+        metrics.add_route("/debug/profile/status", lambda q: ("application/json", json.dumps(status())))
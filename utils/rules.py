@@ -0,0 +1,75 @@
+# utils/rules.py
+# Ordered regex intent rules compiled into ONE pattern.
+#
+# Each rule becomes a named lookahead branch:
+#     \A(?:(?=(?s:.*?)(?P<r0>pat0))|(?=(?s:.*?)(?P<r1>pat1))|...)
+# The regex engine tries the branches in table order, so a single match()
+# call returns the FIRST rule that hits anywhere in the text — the same
+# answer as looping re.search over the table, without the Python loop.
+# Patterns that only compile on their own (a leading global flag like
+# "(?i)", numbered backreferences, a group named like ours) make the
+# combined pattern fail; the set then falls back to that loop.
+#
+# Rules come from intents.json ("rules": [[pattern, intent], ...] or
+# [{"pattern": ..., "intent": ...}, ...]) when present, else the defaults
+# passed in by the caller.
+import re
+from typing import List, Optional, Sequence, Tuple
+
+Rule = Tuple[str, str]   # (pattern, intent)
+
+
+def parse_rules(raw) -> List[Rule]:
+    """Accept [[pat, intent], ...] or [{"pattern":..., "intent":...}, ...]; skip bad entries."""
+    out: List[Rule] = []
+    for item in raw or []:
+        if isinstance(item, dict):
+            pat, lab = item.get("pattern"), item.get("intent")
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            pat, lab = item
+        else:
+            continue
+        if isinstance(pat, str) and isinstance(lab, str) and pat and lab:
+            out.append((pat, lab))
+    return out
+
+
+class RuleSet:
+    def __init__(self, rules: Sequence[Rule], flags: int = re.I):
+        self.rules: List[Rule] = []
+        branches = []
+        for pat, lab in rules:
+            try:
+                re.compile(pat, flags)
+            except re.error as e:
+                print(f"[Rules] skipping bad pattern {pat!r} ({lab}): {e}")
+                continue
+            # scoped DOTALL: only the skip-ahead crosses newlines, the rule keeps its own "."
+            branches.append(f"(?=(?s:.*?)(?P<r{len(self.rules)}>(?:{pat})))")
+            self.rules.append((pat, lab))
+        self.labels = [lab for _, lab in self.rules]
+        self._rx = None
+        self._each: Optional[List[Tuple["re.Pattern", str]]] = None
+        if branches:
+            try:
+                self._rx = re.compile(r"\A(?:" + "|".join(branches) + ")", flags)
+            except re.error as e:
+                print(f"[Rules] combined pattern failed ({e}); matching rule by rule")
+                self._each = [(re.compile(pat, flags), lab) for pat, lab in self.rules]
+
+    def first(self, text: str) -> Optional[str]:
+        """Intent of the first rule (in table order) that matches anywhere in text."""
+        if not text:
+            return None
+        if self._each is not None:
+            return next((lab for rx, lab in self._each if rx.search(text)), None)
+        if self._rx is None:
+            return None
+        m = self._rx.match(text)
+        if m is None:
+            return None
+        # the named group closes after any groups inside the user pattern
+        return self.labels[int(m.lastgroup[1:])]
+
+    def __len__(self):
+        return len(self.rules)
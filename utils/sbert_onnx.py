@@ -0,0 +1,190 @@
+# utils/sbert_onnx.py
+# ONNX Runtime backend for the SBERT intent encoder (no torch at runtime).
+#
+# export() converts the HF sentence encoder to ONNX once (needs torch +
+# transformers + onnx, e.g. on a build box) and writes an int8 dynamically
+# quantized copy next to it. OnnxSentenceEncoder then serves encode() with
+# onnxruntime + the fast `tokenizers` library: mean pooling over the last
+# hidden state + L2 norm, same as all-MiniLM-L6-v2's sentence-transformers
+# pipeline.
+#
+#   python -m utils.sbert_onnx --export            # build cache/sbert_onnx/<model>/
+#   python -m utils.sbert_onnx --check             # torch vs onnx on intents.json
+import os
+import time
+import json
+from typing import List, Optional
+
+import numpy as np
+
+# ---- Config (safe defaults if config.py is missing) ----
+try:
+    import config as CFG
+    ONNX_DIR = getattr(CFG, "SBERT_ONNX_DIR", "cache/sbert_onnx")
+    ONNX_QUANTIZED = bool(getattr(CFG, "SBERT_ONNX_INT8", True))
+    ONNX_THREADS = int(getattr(CFG, "SBERT_ONNX_THREADS", 1))
+except Exception:
+    ONNX_DIR = "cache/sbert_onnx"
+    ONNX_QUANTIZED = True
+    ONNX_THREADS = 1
+
+MAX_SEQ_LEN = 256     # sentence-transformers' setting for all-MiniLM-L6-v2
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def model_dir(model_name: str, root: str = ONNX_DIR) -> str:
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def is_exported(model_name: str, quantized: bool = ONNX_QUANTIZED, root: str = ONNX_DIR) -> bool:
+    d = model_dir(model_name, root)
+    return (os.path.isfile(os.path.join(d, INT8_FILE if quantized else FP32_FILE))
+            and os.path.isfile(os.path.join(d, "tokenizer.json")))
+
+
+# ---- export (build time) ----
+def export(model_name: str, root: str = ONNX_DIR, quantize: bool = True, opset: int = 14) -> str:
+    """Export the transformer to ONNX (+ int8 copy) and save its tokenizer. Returns the model dir."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out = model_dir(model_name, root)
+    os.makedirs(out, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    enc = tok(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in enc]
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    fp32 = os.path.join(out, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(enc[n] for n in names), fp32,
+                          input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=opset, do_constant_folding=True)
+    tok.save_pretrained(out)  # writes tokenizer.json for the fast tokenizer
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32, os.path.join(out, INT8_FILE), weight_type=QuantType.QInt8)
+    with open(os.path.join(out, "export.json"), "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "inputs": names, "opset": opset, "int8": quantize}, f)
+    return out
+
+
+# ---- runtime ----
+class OnnxSentenceEncoder:
+    """Drop-in for SentenceTransformer.encode() on exported models; returns unit-norm float32 rows."""
+
+    def __init__(self, model_name: str, quantized: bool = ONNX_QUANTIZED, threads: int = ONNX_THREADS,
+                 root: str = ONNX_DIR, max_seq_len: int = MAX_SEQ_LEN):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        d = model_dir(model_name, root)
+        path = os.path.join(d, INT8_FILE if quantized else FP32_FILE)
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            so.intra_op_num_threads = threads
+            so.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, so, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.path = path
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(d, "tokenizer.json"))
+        pad_id = self.tokenizer.token_to_id("[PAD]")
+        self.tokenizer.enable_padding(pad_id=0 if pad_id is None else pad_id, pad_token="[PAD]")
+        self.tokenizer.enable_truncation(max_length=max_seq_len)
+
+    def encode(self, sentences: List[str], batch_size: int = 32, convert_to_tensor: bool = False, **_):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        outs = []
+        for i in range(0, len(sentences), batch_size):
+            encs = self.tokenizer.encode_batch(list(sentences[i:i + batch_size]))
+            ids = np.asarray([e.ids for e in encs], dtype=np.int64)
+            mask = np.asarray([e.attention_mask for e in encs], dtype=np.int64)
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feed["token_type_ids"] = np.asarray([e.type_ids for e in encs], dtype=np.int64)
+            hidden = self.session.run(None, feed)[0]
+            m = mask[:, :, None].astype(np.float32)
+            outs.append((hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None))
+        if not outs:
+            return np.zeros((0, 0), dtype=np.float32)
+        emb = np.concatenate(outs).astype(np.float32)
+        emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+        return emb
+
+
+# ---- accuracy / latency check ----
+def _loo_accuracy(emb: np.ndarray, labels: List[str]) -> List[str]:
+    """Leave-one-out nearest-example label for every example."""
+    sims = emb @ emb.T
+    np.fill_diagonal(sims, -np.inf)
+    return [labels[int(j)] for j in np.argmax(sims, axis=1)]
+
+
+def _per_query_ms(encoder, texts: List[str], n: int = 200) -> float:
+    encoder.encode(texts[:1])
+    t0 = time.perf_counter()
+    for i in range(n):
+        encoder.encode([texts[i % len(texts)]])
+    return (time.perf_counter() - t0) * 1000 / n
+
+
+def check(model_name: str, intents_path: Optional[str] = None, quantized: bool = ONNX_QUANTIZED) -> dict:
+    """Compare ONNX against the PyTorch backend on every intents.json example."""
+    from sentence_transformers import SentenceTransformer
+    from utils.domain import resolve_intents_path
+    from utils.intent_classifier import INTENT_KEYS
+
+    with open(intents_path or resolve_intents_path(), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    labels, texts = [], []
+    for intent, phrases in data.items():
+        if intent in INTENT_KEYS:
+            for p in phrases:
+                labels.append(intent)
+                texts.append(p)
+
+    ref_model = SentenceTransformer(model_name)
+    ref = np.asarray(ref_model.encode(texts, convert_to_tensor=False), dtype=np.float32)
+    ref /= np.clip(np.linalg.norm(ref, axis=1, keepdims=True), 1e-12, None)
+    onnx_model = OnnxSentenceEncoder(model_name, quantized=quantized)
+    got = onnx_model.encode(texts)
+
+    cos = np.sum(ref * got, axis=1)
+    pred_ref, pred_onnx = _loo_accuracy(ref, labels), _loo_accuracy(got, labels)
+    n = len(labels)
+    return {
+        "model": model_name, "onnx": onnx_model.path, "examples": n,
+        "cosine_vs_torch": {"min": round(float(cos.min()), 4), "mean": round(float(cos.mean()), 4)},
+        "loo_acc_torch": round(sum(a == b for a, b in zip(pred_ref, labels)) / n, 4),
+        "loo_acc_onnx": round(sum(a == b for a, b in zip(pred_onnx, labels)) / n, 4),
+        "agreement": round(sum(a == b for a, b in zip(pred_ref, pred_onnx)) / n, 4),
+        "ms_per_query_torch": round(_per_query_ms(ref_model, texts), 2),
+        "ms_per_query_onnx": round(_per_query_ms(onnx_model, texts), 2),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.intent_classifier import DEFAULT_MODEL
+
+    ap = argparse.ArgumentParser(description="ONNX backend for the SBERT intent encoder")
+    ap.add_argument("--model", default=DEFAULT_MODEL)
+    ap.add_argument("--export", action="store_true", help="export to ONNX + int8 (needs torch, transformers, onnx)")
+    ap.add_argument("--check", action="store_true", help="compare against the PyTorch backend on intents.json")
+    ap.add_argument("--fp32", action="store_true", help="check the unquantized model instead of int8")
+    ap.add_argument("--intents", default=None)
+    args = ap.parse_args()
+
+    if args.export:
+        print(f"[SBERT-ONNX] exported to {export(args.model)}")
+    if args.check:
+        print(json.dumps(check(args.model, args.intents, quantized=not args.fp32), indent=2))
+    if not (args.export or args.check):
+        ap.print_help()
@@ -0,0 +1,19 @@
+# utils/session.py
+# One caller = one Session: dialogue state and a turn counter. Audio stays in
+# memory buffers (capture, STT input, TTS PCM), so nothing per-call lives at
+# a fixed global path and any number of sessions can share a process.
+import uuid
+from typing import Optional
+
+from utils.dialogue import DialogueCtx
+
+
+class Session:
+    def __init__(self, session_id: Optional[str] = None, tenant: str = "ashar"):
+        self.id = session_id or uuid.uuid4().hex[:12]
+        self.ctx = DialogueCtx(tenant=tenant)
+        self.turn = 0
+
+    def next_turn(self) -> int:
+        self.turn += 1
+        return self.turn
@@ -0,0 +1,162 @@
+# utils/startup.py
+# Parallel engine loading + warm-up, off the import path.
+#
+# Whisper, the SBERT intent classifier and the Piper pool load in their own
+# background threads; each one then runs a dummy inference so the first
+# real caller doesn't pay for lazy allocations. Progress is visible through
+# status(), and ready() tells a front end when it can accept calls.
+#
+#   from utils import startup
+#   startup.start(stt_kwargs={"model_size": "small"})
+#   startup.wait(timeout=120)
+#   print(startup.status())
+import time
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+# ---- Config (safe defaults if config.py is missing) ----
+try:
+    import config as CFG
+    WARMUP = bool(getattr(CFG, "STARTUP_WARMUP", True))
+    REQUIRED = tuple(getattr(CFG, "STARTUP_REQUIRED", ("stt",)))
+except Exception:
+    WARMUP = True
+    REQUIRED = ("stt",)
+
+COMPONENTS = ("stt", "nlu", "tts")
+
+
+class Component:
+    """Load state for one engine: pending -> loading -> warming -> ready | failed."""
+
+    def __init__(self, name: str, load: Callable[[], None], warm: Optional[Callable[[], None]] = None):
+        self.name = name
+        self._load = load
+        self._warm = warm
+        self.state = "pending"
+        self.load_ms: Optional[float] = None
+        self.warm_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.t_done: Optional[float] = None
+        self.done = threading.Event()
+
+    def run(self, warmup: bool = WARMUP):
+        try:
+            self.state = "loading"
+            t0 = time.perf_counter()
+            self._load()
+            self.load_ms = round((time.perf_counter() - t0) * 1000, 1)
+            if warmup and self._warm:
+                self.state = "warming"
+                t0 = time.perf_counter()
+                try:
+                    self._warm()
+                except Exception as e:  # a failed warm-up still leaves a usable engine
+                    print(f"[Startup] {self.name} warm-up failed: {e}")
+                self.warm_ms = round((time.perf_counter() - t0) * 1000, 1)
+            self.state = "ready"
+        except Exception as e:
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.t_done = time.perf_counter()
+            self.done.set()
+
+    def to_dict(self) -> dict:
+        return {"state": self.state, "load_ms": self.load_ms, "warm_ms": self.warm_ms, "error": self.error}
+
+
+# ---- engine loaders ----
+def _stt_component(stt_kwargs: Optional[dict]) -> Component:
+    def load():
+        from utils import stt
+        stt.init(**(stt_kwargs or {}))
+
+    def warm():
+        from utils import stt
+        # low noise rather than zeros so VAD/encoder/decoder all actually run
+        noise = np.random.default_rng(0).normal(0, 0.01, stt.SAMPLE_RATE).astype(np.float32)
+        stt.transcribe(noise, language="en")
+
+    return Component("stt", load, warm)
+
+
+def _nlu_component() -> Component:
+    def load():
+        from utils import dialogue
+        if dialogue.load_classifier() is None:
+            raise RuntimeError("SBERT classifier unavailable (rules only)")
+
+    def warm():
+        from utils import dialogue
+        dialogue.load_classifier().predict("hello")
+
+    return Component("nlu", load, warm)
+
+
+def _tts_component() -> Component:
+    def load():
+        from utils import tts
+        if tts.USE_POOL:
+            tts.get_pool().start()
+
+    def warm():
+        from utils import tts
+        # not synthesize_pcm: a cached "Hello." would never reach Piper
+        for lang in ("en", "hi"):
+            tts.warm(lang, "Hello." if lang == "en" else "नमस्ते।")
+
+    return Component("tts", load, warm)
+
+
+# ---- process-wide startup ----
+_components: Dict[str, Component] = {}
+_lock = threading.Lock()
+_t_start: Optional[float] = None
+
+
+def start(components: Iterable[str] = COMPONENTS, stt_kwargs: Optional[dict] = None,
+          warmup: bool = WARMUP) -> Dict[str, Component]:
+    """Kick off loading in background threads; returns immediately. Idempotent per component."""
+    global _t_start
+    makers = {"stt": lambda: _stt_component(stt_kwargs), "nlu": _nlu_component, "tts": _tts_component}
+    with _lock:
+        if _t_start is None:
+            _t_start = time.perf_counter()
+        for name in components:
+            if name in _components:
+                continue
+            comp = makers[name]()
+            _components[name] = comp
+            threading.Thread(target=comp.run, args=(warmup,), name=f"startup-{name}", daemon=True).start()
+    return dict(_components)
+
+
+def wait(timeout: Optional[float] = None, components: Optional[Iterable[str]] = None) -> bool:
+    """Block until the given (default: all started) components finish; True if none failed."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    names = list(components) if components is not None else list(_components)
+    for name in names:
+        comp = _components.get(name)
+        if comp is None:
+            continue
+        left = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not comp.done.wait(left):
+            return False
+    return all(_components[n].state == "ready" for n in names if n in _components)
+
+
+def ready(required: Iterable[str] = REQUIRED) -> bool:
+    """True once every required component is ready (others may still be loading)."""
+    return all(n in _components and _components[n].state == "ready" for n in required)
+
+
+def status() -> dict:
+    out = {name: comp.to_dict() for name, comp in _components.items()}
+    if _components and all(c.done.is_set() for c in _components.values()):
+        # wall time: components overlap, so this is ~max, not the sum
+        out["total_ms"] = round((max(c.t_done for c in _components.values()) - _t_start) * 1000, 1)
+    out["ready"] = ready()
+    return out
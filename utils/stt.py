@@ -3,22 +3,82 @@
 # Fixes ValueError: max() arg is an empty sequence when auto language sees no segments.
 
 from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+import numpy as np
 import unicodedata
 import re
+import os
+import json
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union, List, Dict
+
+from utils.domain import resolve_intents_path, CAT_LABELS, ATTR_LABELS
+from utils import metrics
 
 _model: Optional[WhisperModel] = None
 
-def init(model_size: str = "small", device: str = "cpu", compute_type: str = "int8"):
+# ---- Config (safe defaults if config.py is missing) ----
+try:
+    import config as CFG
+    LID_MODE     = getattr(CFG, "STT_LID_MODE", "single_pass")
+    LID_MIN_PROB = float(getattr(CFG, "STT_LID_MIN_PROB", 0.6))
+    PARALLEL_FALLBACK = bool(getattr(CFG, "STT_PARALLEL_FALLBACK", True))
+    CPU_THREADS  = int(getattr(CFG, "STT_CPU_THREADS", 0))
+    NUM_WORKERS  = int(getattr(CFG, "STT_NUM_WORKERS", 2))
+    DECODE_PROFILES = list(getattr(CFG, "STT_DECODE_PROFILES", None) or [])
+    ESC_LOGPROB     = float(getattr(CFG, "STT_ESCALATE_LOGPROB", -0.8))
+    ESC_COMPRESSION = float(getattr(CFG, "STT_ESCALATE_COMPRESSION", 2.4))
+    ESC_NO_SPEECH   = float(getattr(CFG, "STT_ESCALATE_NO_SPEECH", 0.6))
+    BIAS_PROMPT  = bool(getattr(CFG, "STT_BIAS_PROMPT", True))
+    USE_HOTWORDS = bool(getattr(CFG, "STT_HOTWORDS", False))
+    BIAS_BRAND   = str(getattr(CFG, "STT_BIAS_BRAND", "Ashar Group"))
+except Exception:
+    LID_MODE     = "single_pass"
+    LID_MIN_PROB = 0.6
+    PARALLEL_FALLBACK = True
+    CPU_THREADS  = 0
+    NUM_WORKERS  = 2
+    DECODE_PROFILES = []
+    ESC_LOGPROB     = -0.8
+    ESC_COMPRESSION = 2.4
+    ESC_NO_SPEECH   = 0.6
+    BIAS_PROMPT  = True
+    USE_HOTWORDS = False
+    BIAS_BRAND   = "Ashar Group"
+
+# Cheapest first; the last entry is the old fixed beam-5 decode.
+DECODE_PROFILES = DECODE_PROFILES or [
+    {"name": "greedy", "beam_size": 1, "temperature": [0.0]},
+    {"name": "beam",   "beam_size": 5, "temperature": [0.0, 0.2, 0.4]},
+]
+
+ALLOWED_LANGS = ("hi", "en")
+
+SAMPLE_RATE = 16000  # Whisper's native rate; in-memory buffers must already be at this rate
+
+# A WAV/audio file path, or mono float32 samples @ SAMPLE_RATE
+AudioInput = Union[str, np.ndarray]
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+def init(model_size: str = "small", device: str = "cpu", compute_type: str = "int8",
+         cpu_threads: int = CPU_THREADS, num_workers: int = NUM_WORKERS):
     """
     Initialize the STT model once (call at startup).
     model_size: "small" (fast) or "medium" (better quality if CPU allows)
     compute_type: "int8" (fastest on CPU), "float32" (highest quality on CPU)
+    cpu_threads: CTranslate2 intra-op threads per decode (0 = library default)
+    num_workers: concurrent decodes the model accepts (>=2 lets en/hi fallbacks overlap)
     """
-    global _model
+    global _model, _pool
     if _model is None:
-        _model = WhisperModel(model_size, device=device, compute_type=compute_type)
+        _model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                              cpu_threads=cpu_threads, num_workers=max(1, num_workers))
+        if PARALLEL_FALLBACK and num_workers > 1:
+            _pool = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="stt")
 
 # ---------- heuristics ----------
 DEVANAGARI_RE = re.compile(r"[ऀ-ॿ]")
@@ -40,71 +100,275 @@ def _is_gibberish(s: str) -> bool:
 def _script_score(s: str) -> Tuple[int, int]:
     return len(DEVANAGARI_RE.findall(s or "")), len(LATIN_RE.findall(s or ""))
 
+def _pick_en_hi(text_en: str, p_en: float, text_hi: str, p_hi: float) -> Tuple[str, str, float]:
+    """Choose between a forced-EN and a forced-HI decode by script & non-gibberish heuristics."""
+    score_en = 0
+    if not _is_gibberish(text_en):
+        deva_en, latin_en = _script_score(text_en)
+        score_en = latin_en + len(text_en)
+
+    score_hi = 0
+    if not _is_gibberish(text_hi):
+        deva_hi, latin_hi = _script_score(text_hi)
+        score_hi = deva_hi + len(text_hi)
+
+    if score_hi == 0 and score_en == 0:
+        # Silence or noise: return safe empty result (no crash)
+        return "", "en", 0.0
+    if score_hi >= score_en:
+        return text_hi, "hi", max(p_hi, 0.66)
+    return text_en, "en", max(p_en, 0.66)
+
+# ---------- domain biasing (initial_prompt / hotwords) ----------
+_INTENTS_PATH = resolve_intents_path()   # resolved once; decodes only stat() this file
+_bias_lock = threading.Lock()
+_bias_key: Optional[int] = None
+_bias: Dict[str, Dict[str, str]] = {}
+
+def _build_bias(raw: dict) -> Dict[str, Dict[str, str]]:
+    """Per-language prompt + hotword string from project facts and category/attribute labels."""
+    facts = raw.get("project_facts", {}) or {}
+    brand = (raw.get("config") or {}).get("brand_name") or BIAS_BRAND
+    names = [rec.get("name", k.title()) for k, rec in facts.items()]
+    cats = [c for c in CAT_LABELS if c in (raw.get("project_categories") or CAT_LABELS)]
+    hotwords = ", ".join(dict.fromkeys(names + [k.title() for k in facts]))
+
+    out = {}
+    for L in ("en", "hi"):
+        cat_names = ", ".join(CAT_LABELS[c][L] for c in cats)
+        attr_names = ", ".join(ATTR_LABELS[a][L] for a in ATTR_LABELS)
+        if L == "hi":
+            prompt = f"{brand}। प्रोजेक्ट्स: {', '.join(names)}। {cat_names}। {attr_names}, BHK।"
+        else:
+            prompt = f"{brand}. Projects: {', '.join(names)}. {cat_names}. Price, {attr_names}, BHK."
+        out[L] = {"prompt": prompt, "hotwords": hotwords}
+    return out
+
+def _bias_for(lang: Optional[str]) -> Dict[str, str]:
+    """
+    Cached biasing strings for a decode language (auto => English prompt).
+    Rebuilt only when intents.json changes on disk (one stat() per call).
+    """
+    global _bias_key, _bias
+    if not BIAS_PROMPT:
+        return {}
+    try:
+        key = os.stat(_INTENTS_PATH).st_mtime_ns
+        if key != _bias_key:
+            with _bias_lock:
+                if key != _bias_key:
+                    with open(_INTENTS_PATH, "r", encoding="utf-8") as f:
+                        _bias = _build_bias(json.load(f))
+                    _bias_key = key
+    except Exception:
+        return {}
+    return _bias.get("hi" if lang == "hi" else "en", {})
+
+# ---------- per-turn counters ----------
+# Thread-local so concurrent sessions each see their own turn; pool workers
+# borrow the caller's namespace (see _decode_pair), hence the lock.
+_turn = threading.local()
+_stats_lock = threading.Lock()
+
+def _count(field: str, n: int = 1):
+    st = _stats()
+    with _stats_lock:
+        setattr(st, field, getattr(st, field) + n)
+    metrics.inc(f"stt_{field}", n)
+
+def _begin_turn():
+    _turn.stats = SimpleNamespace(decodes=0, lid_runs=0, path="", lid=None, tiers=[])
+
+def _note_tier(name: str):
+    st = _stats()
+    with _stats_lock:
+        st.tiers.append(name)
+
+def _stats() -> SimpleNamespace:
+    if getattr(_turn, "stats", None) is None:
+        _begin_turn()
+    return _turn.stats
+
+def last_turn_stats() -> SimpleNamespace:
+    """Counters for the most recent transcribe() on this thread (decodes, lid_runs, path, lid, tiers)."""
+    return _stats()
+
+def _as_audio(audio: AudioInput) -> np.ndarray:
+    """
+    Bring any supported input to mono float32 @ SAMPLE_RATE, once per turn.
+    Paths are decoded here so the fallback passes don't re-read the file.
+    """
+    if isinstance(audio, np.ndarray):
+        x = audio
+        if x.ndim > 1:
+            x = x[:, 0]
+        return np.ascontiguousarray(x, dtype=np.float32)
+    return decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
 # ---------- low-level decode with safety ----------
-def _decode_one(wav_path: str, lang: Optional[str], use_vad: bool) -> Tuple[str, str, float]:
+def _needs_escalation(segs: list) -> bool:
+    """True if a decode looks unreliable enough to retry with a heavier profile."""
+    if not segs:
+        return False  # silence: a bigger beam won't find words that aren't there
+    n_tok = sum(max(1, len(s.tokens)) for s in segs)
+    avg_logprob = sum(s.avg_logprob * max(1, len(s.tokens)) for s in segs) / n_tok
+    return (avg_logprob < ESC_LOGPROB
+            or max(s.compression_ratio for s in segs) > ESC_COMPRESSION
+            or max(s.no_speech_prob for s in segs) > ESC_NO_SPEECH)
+
+def _decode_one(audio: AudioInput, lang: Optional[str], use_vad: bool) -> Tuple[str, str, float]:
     """
     Run a single decode. Returns (text, lang_code, lang_prob).
+    Walks DECODE_PROFILES cheapest first (greedy), escalating to the next
+    profile (beam search) only when the result fails the confidence checks.
     Safe against faster-whisper auto-language edge cases.
     """
     if _model is None:
         init()
 
+    bias = _bias_for(lang)
     try:
-        segments, info = _model.transcribe(
-            wav_path,
-            language=lang,                    # None => auto
-            vad_filter=bool(use_vad),
-            vad_parameters={"min_silence_duration_ms": 200},
-            word_timestamps=False,
-            temperature=[0.0, 0.2, 0.4],
-            beam_size=5,
-            # suppress_tokens=None  # don't pass a string here
-        )
-        text = "".join(seg.text for seg in segments).strip()
-        text = unicodedata.normalize("NFC", text)  # fix Hindi matras
-        lang_code = (info.language or (lang or "auto")).split("-")[0] if hasattr(info, "language") else (lang or "auto")
-        lang_prob = float(getattr(info, "language_probability", 0.0) or 0.0)
-        return text, lang_code, lang_prob
+        with metrics.span("stt.decode", lang=lang or "auto") as sp:
+            for i, prof in enumerate(DECODE_PROFILES):
+                _count("decodes")
+                segments, info = _model.transcribe(
+                    audio,
+                    language=lang,                    # None => auto
+                    vad_filter=bool(use_vad),
+                    vad_parameters={"min_silence_duration_ms": 200},
+                    word_timestamps=False,
+                    temperature=list(prof.get("temperature", [0.0])),
+                    beam_size=int(prof.get("beam_size", 1)),
+                    initial_prompt=bias.get("prompt"),  # domain vocabulary (project names etc.)
+                    hotwords=bias.get("hotwords") if USE_HOTWORDS else None,
+                    # suppress_tokens=None  # don't pass a string here
+                )
+                segs = list(segments)
+                if i == len(DECODE_PROFILES) - 1 or not _needs_escalation(segs):
+                    break
+            sp["tier"] = prof.get("name", str(i))
+            _note_tier(sp["tier"])
+            text = "".join(seg.text for seg in segs).strip()
+            text = unicodedata.normalize("NFC", text)  # fix Hindi matras
+            lang_code = (info.language or (lang or "auto")).split("-")[0] if hasattr(info, "language") else (lang or "auto")
+            lang_prob = float(getattr(info, "language_probability", 0.0) or 0.0)
+            return text, lang_code, lang_prob
     except Exception:
         # Return "empty but valid" result so callers can fallback
         return "", (lang or "auto"), 0.0
 
+def _decode_in(st: SimpleNamespace, audio: np.ndarray, lang: str, use_vad: bool):
+    # runs on a pool thread: attribute counters to the calling turn
+    _turn.stats = st
+    try:
+        return _decode_one(audio, lang, use_vad)
+    finally:
+        _turn.stats = None
+
+def _decode_pair(audio: np.ndarray, langs: Tuple[str, str], use_vad: bool = True) -> dict:
+    """
+    Forced decodes for both languages -> {lang: (text, lang, prob)}.
+    Runs them concurrently when the worker pool is up, else one after the other.
+    """
+    if _pool is None:
+        return {l: _decode_one(audio, l, use_vad) for l in langs}
+    st = _stats()
+    # copy_context: the pool thread's spans join the caller's turn trace
+    futs = {l: _pool.submit(contextvars.copy_context().run, _decode_in, st, audio, l, use_vad)
+            for l in langs}
+    return {l: f.result() for l, f in futs.items()}
+
+# ---------- language ID (one encoder pass, hi/en only) ----------
+def _detect_lang(audio: np.ndarray) -> Optional[List[Tuple[str, float]]]:
+    """
+    Run Whisper language detection once on the first 30 s of mel features
+    and renormalize over ALLOWED_LANGS. Returns [(lang, prob), ...] best
+    first, or None if detection isn't possible.
+    """
+    fe = _model.feature_extractor
+    try:
+        _count("lid_runs")
+        with metrics.span("stt.lid"):
+            features = fe(audio[: fe.n_samples])
+            enc = _model.encode(features[:, : fe.nb_max_frames])
+            results = _model.model.detect_language(enc)[0]
+    except Exception:
+        return None
+    return _rank_allowed(results)
+
+def _rank_allowed(results: List[Tuple[str, float]]) -> Optional[List[Tuple[str, float]]]:
+    """detect_language output ('<|xx|>', p) -> [(lang, p)] over ALLOWED_LANGS, renormalized, best first."""
+    probs = {tok[2:-2]: float(p) for tok, p in results}
+    total = sum(probs.get(l, 0.0) for l in ALLOWED_LANGS)
+    if total <= 0.0:
+        return None
+    ranked = [(l, probs.get(l, 0.0) / total) for l in ALLOWED_LANGS]
+    ranked.sort(key=lambda lp: lp[1], reverse=True)
+    return ranked
+
+def _transcribe_single_pass(audio: np.ndarray) -> Optional[Tuple[str, str, float]]:
+    """
+    LID once, decode once in the winning language; only decode the other
+    language too when the winner's probability is below LID_MIN_PROB or
+    its text looks like gibberish. None => caller should use the legacy path.
+    """
+    ranked = _detect_lang(audio)
+    if not ranked:
+        return None
+    st = _stats()
+    st.path = "single_pass"
+    st.lid = ranked
+
+    (l1, p1), (l2, p2) = ranked[0], ranked[1]
+    probs = {l1: p1, l2: p2}
+    if p1 < LID_MIN_PROB:
+        # both decodes are needed anyway: run them side by side
+        outs = _decode_pair(audio, (l1, l2))
+        return _pick_en_hi(outs["en"][0], probs["en"], outs["hi"][0], probs["hi"])
+
+    text1, _, _ = _decode_one(audio, l1, use_vad=True)
+    if not _is_gibberish(text1):
+        return text1, l1, p1
+
+    text2, _, _ = _decode_one(audio, l2, use_vad=True)
+    texts = {l1: text1, l2: text2}
+    return _pick_en_hi(texts["en"], probs["en"], texts["hi"], probs["hi"])
+
 # ---------- public API ----------
-def transcribe(wav_path: str, language: str = None) -> Tuple[str, str, float]:
+def transcribe(audio: AudioInput, language: str = None) -> Tuple[str, str, float]:
     """
     Robust bilingual STT limited to Hindi/English with guardrails.
+    audio: WAV path or mono float32 numpy buffer @ 16 kHz (no disk I/O).
     Returns: (text, lang, lang_prob)
     """
     if _model is None:
         init()
 
+    try:
+        audio = _as_audio(audio)
+    except Exception:
+        return "", "en", 0.0
+    if audio.size == 0:
+        return "", "en", 0.0
+
+    _begin_turn()
+    if LID_MODE == "single_pass":
+        out = _transcribe_single_pass(audio)
+        if out is not None:
+            return out
+
+    _stats().path = "legacy"
     # Pass A: Try AUTO language detection without VAD (avoids empty-buffer crash)
-    text_a, lang_a, p_a = _decode_one(wav_path, None, use_vad=False)
+    text_a, lang_a, p_a = _decode_one(audio, None, use_vad=False)
 
     # If auto produced clean hi/en text with some confidence, accept
     if lang_a in {"hi", "en"} and not _is_gibberish(text_a):
         return text_a, lang_a, max(p_a, 0.7 if text_a else 0.0)
 
-    # Pass B: Force EN and HI with VAD to clean up silences
-    text_en, lang_en, p_en = _decode_one(wav_path, "en", use_vad=True)
-    text_hi, lang_hi, p_hi = _decode_one(wav_path, "hi", use_vad=True)
+    # Pass B: Force EN and HI with VAD to clean up silences (concurrently if pooled)
+    outs = _decode_pair(audio, ("en", "hi"))
+    text_en, lang_en, p_en = outs["en"]
+    text_hi, lang_hi, p_hi = outs["hi"]
 
     # Score by script & non-gibberish heuristics
-    score_en = 0
-    if not _is_gibberish(text_en):
-        deva_en, latin_en = _script_score(text_en)
-        score_en = latin_en + len(text_en)
-
-    score_hi = 0
-    if not _is_gibberish(text_hi):
-        deva_hi, latin_hi = _script_score(text_hi)
-        score_hi = deva_hi + len(text_hi)
-
-    # Choose best
-    if score_hi == 0 and score_en == 0:
-        # Silence or noise: return safe empty result (no crash)
-        return "", "en", 0.0
-    if score_hi >= score_en:
-        return text_hi, "hi", max(p_hi, 0.66)
-    else:
-        return text_en, "en", max(p_en, 0.66)
+    return _pick_en_hi(text_en, p_en, text_hi, p_hi)
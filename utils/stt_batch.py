@@ -0,0 +1,212 @@
+# utils/stt_batch.py
+# Batching scheduler in front of utils/stt for many concurrent calls.
+#
+# Finished utterances from different sessions are collected for up to
+# window_ms (or until max_batch), then run through Whisper together:
+# one batched encoder pass, batched hi/en language ID, and one batched
+# greedy decode. Items that fail the usual confidence checks (LID prob,
+# gibberish, avg_logprob, compression ratio) are re-run individually
+# through stt.transcribe(), so guardrails stay the same as the solo path.
+import time
+import queue
+import threading
+import unicodedata
+from collections import deque, Counter
+from concurrent.futures import Future, ThreadPoolExecutor, InvalidStateError
+from typing import List, Optional, Tuple
+
+import numpy as np
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_ctranslate2_storage, get_compression_ratio, get_suppressed_tokens
+
+from utils import stt, metrics
+
+# ---- Config (safe defaults if config.py is missing) ----
+try:
+    import config as CFG
+    WINDOW_MS = float(getattr(CFG, "STT_BATCH_WINDOW_MS", 30))
+    MAX_BATCH = int(getattr(CFG, "STT_BATCH_MAX", 8))
+except Exception:
+    WINDOW_MS = 30.0
+    MAX_BATCH = 8
+
+# (text, lang, prob, info)
+Result = Tuple[str, str, float, dict]
+
+
+class BatchScheduler:
+    def __init__(self, window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH, fallback_workers: int = 2):
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._q: "queue.Queue[Tuple[np.ndarray, Future, float]]" = queue.Queue()
+        self._fallback = ThreadPoolExecutor(max_workers=fallback_workers, thread_name_prefix="stt-fb")
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=2000)   # queue wait per item (s)
+        self._sizes: Counter = Counter()   # batch size -> count
+        self.items = 0
+        self.fallbacks = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="stt-batch", daemon=True)
+        self._thread.start()
+
+    # ---- public ----
+    def submit(self, audio: stt.AudioInput) -> "Future[Result]":
+        fut: Future = Future()
+        self._q.put((audio, fut, time.monotonic()))
+        return fut
+
+    def transcribe(self, audio: stt.AudioInput) -> Result:
+        """Blocking convenience wrapper."""
+        return self.submit(audio).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            n_batches = sum(self._sizes.values())
+            pct = lambda q: round(waits[min(len(waits) - 1, int(q * (len(waits) - 1)))] * 1000, 1) if waits else 0.0
+            return {
+                "items": self.items,
+                "batches": n_batches,
+                "mean_batch": round(sum(k * v for k, v in self._sizes.items()) / n_batches, 2) if n_batches else 0.0,
+                "batch_sizes": dict(sorted(self._sizes.items())),
+                "queue_wait_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)},
+                "fallbacks": self.fallbacks,
+                "window_ms": self.window * 1000, "max_batch": self.max_batch,
+            }
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self._fallback.shutdown(wait=False)
+
+    # ---- scheduler loop ----
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                first = self._q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = first[2] + self.window
+            while len(batch) < self.max_batch:
+                # whatever queued up while the last batch ran goes in right away
+                left = deadline - time.monotonic()
+                try:
+                    batch.append(self._q.get_nowait() if left <= 0 else self._q.get(timeout=left))
+                except queue.Empty:
+                    break
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        now = time.monotonic()
+        with self._lock:
+            self._sizes[len(batch)] += 1
+            self.items += len(batch)
+            self._waits.extend(now - t for _, _, t in batch)
+
+        infos = [{"path": "batch", "batch_size": len(batch), "queue_wait_ms": round((now - t) * 1000, 1)}
+                 for _, _, t in batch]
+        metrics.record("stt_batch_size", len(batch))
+        for _, _, t in batch:
+            metrics.observe("stt.queue_wait", now - t)
+        try:
+            audios = [stt._as_audio(a) for a, _, _ in batch]
+            with metrics.span("stt.batch", size=len(batch)):
+                outs = _run_batch(audios)
+        except Exception:
+            audios = [a for a, _, _ in batch]
+            outs = [None] * len(batch)
+
+        for (_, fut, _), audio, out, info in zip(batch, audios, outs, infos):
+            if fut.cancelled():
+                continue  # caller hung up while queued
+            if out is not None:
+                _resolve(fut, (*out, info))
+            else:
+                with self._lock:
+                    self.fallbacks += 1
+                info["path"] = "fallback"
+                self._fallback.submit(self._solo, audio, fut, info)
+
+    @staticmethod
+    def _solo(audio, fut: Future, info: dict):
+        try:
+            text, lang, p = stt.transcribe(audio)
+            st = stt.last_turn_stats()
+            info.update(decodes=st.decodes, tiers=list(st.tiers), solo_path=st.path)
+            _resolve(fut, (text, lang, p, info))
+        except Exception as e:
+            _resolve(fut, error=e)
+
+
+def _resolve(fut: Future, value=None, error: Optional[BaseException] = None):
+    """Set a result unless the caller already cancelled (hung up)."""
+    try:
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(value)
+    except InvalidStateError:
+        pass
+
+
+# ---- batched Whisper ----
+def _run_batch(audios: List[np.ndarray]) -> List[Optional[Tuple[str, str, float]]]:
+    """
+    One encoder pass + LID + greedy decode for every item that fits in a
+    single 30 s window. Returns (text, lang, prob) per item, or None where
+    the item must go through the solo path.
+    """
+    if stt._model is None:
+        stt.init()
+    m = stt._model
+    fe = m.feature_extractor
+    n_frames = fe.nb_max_frames
+
+    idx = [i for i, a in enumerate(audios) if 0 < a.size <= fe.n_samples]
+    out: List[Optional[Tuple[str, str, float]]] = [None] * len(audios)
+    for i, a in enumerate(audios):
+        if a.size == 0:
+            out[i] = ("", "en", 0.0)
+    if not idx:
+        return out
+
+    feats = np.stack([fe(audios[i])[:, :n_frames] for i in idx]).astype(np.float32)
+    enc = m.model.encode(get_ctranslate2_storage(feats), to_cpu=False)
+    lid = m.model.detect_language(enc)
+
+    prompts, tokenizers, ranked = [], [], []
+    for res in lid:
+        r = stt._rank_allowed(res) or [("en", 0.0), ("hi", 0.0)]
+        lang = r[0][0]
+        tok = Tokenizer(m.hf_tokenizer, m.model.is_multilingual, task="transcribe", language=lang)
+        bias = stt._bias_for(lang).get("prompt")
+        prev = tok.encode(" " + bias.strip()) if bias else []
+        prompts.append(m.get_prompt(tok, prev, without_timestamps=True))
+        tokenizers.append(tok)
+        ranked.append(r)
+
+    results = m.model.generate(
+        enc, prompts,
+        beam_size=1,
+        max_length=m.max_length,
+        return_scores=True,
+        return_no_speech_prob=True,
+        suppress_blank=True,
+        suppress_tokens=get_suppressed_tokens(tokenizers[0], [-1]),
+    )
+
+    for j, (i, res) in enumerate(zip(idx, results)):
+        tokens = res.sequences_ids[0]
+        text = unicodedata.normalize("NFC", tokenizers[j].decode(tokens).strip())
+        lang, p = ranked[j][0]
+        avg_logprob = res.scores[0] * len(tokens) / (len(tokens) + 1)
+        if res.no_speech_prob > stt.ESC_NO_SPEECH and avg_logprob < stt.ESC_LOGPROB:
+            out[i] = ("", "en", 0.0)  # silence, same answer the solo path gives
+            continue
+        ok = (p >= stt.LID_MIN_PROB
+              and not stt._is_gibberish(text)
+              and avg_logprob >= stt.ESC_LOGPROB
+              and get_compression_ratio(text) <= stt.ESC_COMPRESSION)
+        out[i] = (text, lang, p) if ok else None
+    return out
@@ -1,7 +1,17 @@
 # utils/tts.py
 import os
+import re
+import tempfile
+import threading
 import subprocess
-from typing import Optional
+from typing import Optional, List, Iterator, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from utils.piper_pool import PiperPool
+from utils.tts_cache import TTSCache, cache_key
+from utils import metrics
 
 # ---- Config (safe defaults if config.py is missing) ----
 try:
@@ -10,50 +20,88 @@ try:
     OUT_SR    = int(getattr(CFG, "PIPER_OUTPUT_SR", 16000))
     HINDI     = getattr(CFG, "HINDI_VOICE_MODEL", "voices/hi_IN-priyamvada-medium.onnx")
     ENGLISH   = getattr(CFG, "EN_IN_VOICE_MODEL", "voices/en_GB-cori-medium.onnx")
+    USE_POOL  = bool(getattr(CFG, "PIPER_POOL", True))
+    POOL_SIZE = int(getattr(CFG, "PIPER_POOL_SIZE", 1))
+    STREAMING = bool(getattr(CFG, "TTS_STREAMING", True))
+    USE_CACHE = bool(getattr(CFG, "TTS_CACHE", True))
+    CACHE_MB  = int(getattr(CFG, "TTS_CACHE_MAX_MB", 64))
+    CACHE_DIR = getattr(CFG, "TTS_CACHE_DIR", None)
 except Exception:
     PIPER_BIN = "./piper/piper"
     OUT_SR    = 16000
     HINDI     = "voices/hi_IN-priyamvada-medium.onnx"
     ENGLISH   = "voices/en_GB-cori-medium.onnx"
+    USE_POOL  = True
+    POOL_SIZE = 1
+    STREAMING = True
+    USE_CACHE = True
+    CACHE_MB  = 64
+    CACHE_DIR = None
 
 VOICE_MAP = {"hi": HINDI, "en": ENGLISH}
 DEFAULT_LANG = "en"
-OUT_WAV = "/tmp/bot_tts.wav"
 
-def _pick_voice(lang: Optional[str]) -> str:
-    return VOICE_MAP.get(lang, VOICE_MAP[DEFAULT_LANG])
+# Shared by the one-shot and pooled paths
+PIPER_ARGS = [
+    "--output_sample_rate", str(OUT_SR),
+    "--sentence_silence", "0.6",
+    # You can un-comment to tweak prosody:
+    # "--length_scale", "0.95",
+    # "--noise_scale", "0.6",
+    # "--noise_w", "0.7",
+]
 
-def synthesize(text: str, lang: Optional[str]) -> str:
-    """
-    Synthesize TTS with Piper by piping text via stdin.
-    Adds a timeout to avoid hangs.
-    Returns path to generated WAV.
-    """
-    text = (text or "").strip()
-    if not text:
-        text = "..." if (lang == "en") else "..."
+_pool: Optional[PiperPool] = None
+_pool_lock = threading.Lock()
 
-    # Light punctuation fix; Piper is fine with UTF-8
-    text = text.replace("।", ".")
+def get_pool() -> PiperPool:
+    """Process-wide Piper pool (workers start lazily on first use per voice)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PiperPool(PIPER_BIN, list(VOICE_MAP.values()),
+                                  pool_size=POOL_SIZE, extra_args=PIPER_ARGS, timeout=20)
+    return _pool
 
-    voice = _pick_voice(lang)
+def set_pool_size(n: int):
+    """Workers per voice for the shared pool (e.g. the server's TTS concurrency); workers grow lazily."""
+    global POOL_SIZE
+    POOL_SIZE = max(1, int(n))
+    with _pool_lock:
+        if _pool is not None:
+            _pool.pool_size = POOL_SIZE
+
+def shutdown():
+    """Stop the Piper workers (if any were started) and remove their scratch dir."""
+    global _pool
+    with _pool_lock:
+        p, _pool = _pool, None
+    if p is not None:
+        p.close()
+
+_cache: Optional[TTSCache] = None
+
+def get_cache() -> TTSCache:
+    global _cache
+    if _cache is None:
+        with _pool_lock:
+            if _cache is None:
+                _cache = TTSCache(max_bytes=CACHE_MB << 20, disk_dir=CACHE_DIR)
+    return _cache
+
+def _key(text: str, voice: str) -> str:
+    return cache_key(voice, text, OUT_SR, PIPER_ARGS)
 
-    # Build Piper command (no --text_file; we feed stdin instead)
-    cmd = [
-        PIPER_BIN,
-        "--model", voice,
-        "--output_file", OUT_WAV,
-        "--output_sample_rate", str(OUT_SR),
-        "--sentence_silence", "0.6",
-        # You can un-comment to tweak prosody:
-        # "--length_scale", "0.95",
-        # "--noise_scale", "0.6",
-        # "--noise_w", "0.7",
-    ]
+def _pick_voice(lang: Optional[str]) -> str:
+    return VOICE_MAP.get(lang, VOICE_MAP[DEFAULT_LANG])
 
+def _run_once(text: str, voice: str, out_path: str):
+    """Legacy path: spawn Piper for this one utterance."""
+    cmd = [PIPER_BIN, "--model", voice, "--output_file", out_path, *PIPER_ARGS]
     try:
         # Provide one utterance via stdin; Piper expects newline-terminated lines
-        completed = subprocess.run(
+        subprocess.run(
             cmd,
             input=(text + "\n").encode("utf-8"),
             stdout=subprocess.PIPE,
@@ -70,8 +118,118 @@ def synthesize(text: str, lang: Optional[str]) -> str:
             f"Piper failed (exit {e.returncode}). stderr={ e.stderr.decode('utf-8','ignore') }"
         )
 
-    # Sanity check: WAV must exist and have size
-    if not os.path.exists(OUT_WAV) or os.path.getsize(OUT_WAV) < 1024:
-        raise RuntimeError("Piper produced no audio or an empty file.")
+def _clean(text: str) -> str:
+    text = (text or "").strip()
+    if not text:
+        text = "..."
+    # Light punctuation fix; Piper is fine with UTF-8
+    text = text.replace("।", ".")
+    # one JSON/stdin line == one utterance
+    return " ".join(text.splitlines())
+
+def synthesize_pcm(text: str, lang: Optional[str]) -> Tuple[np.ndarray, int]:
+    """
+    Synthesize a whole reply and return (mono float32, sample_rate).
+    No shared files: safe to call from many sessions at once.
+    """
+    with metrics.span("tts.synthesize"):
+        return _render(_clean(text), _pick_voice(lang))
+
+def synthesize(text: str, lang: Optional[str], out_path: Optional[str] = None) -> str:
+    """
+    Synthesize TTS with Piper and write it to a WAV.
+    out_path: caller-owned path; if None a unique temp file is created and the
+    caller is responsible for removing it. The bot itself uses synthesize_pcm().
+    Returns path to generated WAV.
+    """
+    pcm, rate = synthesize_pcm(text, lang)
+    if out_path is None:
+        fd, out_path = tempfile.mkstemp(prefix="bot_tts_", suffix=".wav")
+        os.close(fd)
+    sf.write(out_path, pcm, rate, subtype="PCM_16")
+    return out_path
+
+# ---- Streaming (sentence by sentence) ----
+_SENT_END = re.compile(r"(?<=[.!?।])\s+")
+_CLAUSE_END = re.compile(r"(?<=[;—])\s+")
+_NO_SPLIT_AFTER = ("No.", "Rs.", "Mr.", "Mrs.", "Dr.", "St.")  # "No. of Towers", "Rs. 1.25 Cr"
+MAX_PIECE_CHARS = 80   # longer sentences are further cut at ; and —
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Cut a reply into sentence-sized pieces for streaming synthesis.
+    Long sentences (e.g. proj_details) are also cut at clause marks so the
+    first piece is short and plays quickly.
+    """
+    text = (text or "").replace("।", "। ")
+    pieces: List[str] = []
+    for sent in _SENT_END.split(text.strip()):
+        if pieces and pieces[-1].endswith(_NO_SPLIT_AFTER):
+            pieces[-1] = f"{pieces[-1]} {sent}"
+            continue
+        pieces.append(sent)
+    out: List[str] = []
+    for sent in pieces:
+        if len(sent) > MAX_PIECE_CHARS:
+            out.extend(c for c in _CLAUSE_END.split(sent) if c.strip())
+        elif sent.strip():
+            out.append(sent)
+    return [p.strip() for p in out]
+
+def _render(text: str, voice: str) -> Tuple[np.ndarray, int]:
+    """Synthesize one piece (cache first) and return (mono float32, rate)."""
+    with metrics.span("tts.render", chars=len(text)) as sp:
+        if USE_CACHE:
+            hit = get_cache().get(_key(text, voice))
+            sp["cached"] = hit is not None
+            metrics.inc("tts_cache_hits" if hit is not None else "tts_cache_misses")
+            if hit is not None:
+                return hit
+        wav, rate = _piper(text, voice)
+        if USE_CACHE:
+            get_cache().put(_key(text, voice), wav, rate)
+        return wav, rate
+
+def _piper(text: str, voice: str) -> Tuple[np.ndarray, int]:
+    """Run Piper (pool or one-shot) for one piece; never consults the cache."""
+    fd, path = tempfile.mkstemp(prefix="tts_", suffix=".wav")
+    os.close(fd)
+    try:
+        if USE_POOL:
+            get_pool().synthesize(text, voice, path)
+        else:
+            _run_once(text, voice, path)
+        # Sanity check: WAV must exist and have size
+        if not os.path.exists(path) or os.path.getsize(path) < 1024:
+            raise RuntimeError("Piper produced no audio or an empty file.")
+        wav, rate = sf.read(path, dtype="float32", always_2d=False)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if wav.ndim > 1:
+        wav = wav[:, 0]
+    return wav, int(rate)
+
+def warm(lang: Optional[str], text: str = "Hello.") -> Tuple[np.ndarray, int]:
+    """Real synthesis for lang's voice, bypassing the cache (start-up warm-up)."""
+    return _piper(_clean(text), _pick_voice(lang))
+
+def synthesize_stream(text: str, lang: Optional[str]) -> Iterator[Tuple[np.ndarray, int]]:
+    """
+    Yields (pcm float32 mono, sample_rate) one sentence/clause at a time, so
+    playback can start after the first piece instead of the whole reply.
+    Stop iterating (close the generator) to skip the remaining pieces.
+    """
+    voice = _pick_voice(lang)
+    for piece in pieces(text):
+        yield _render(piece, voice)
+
+def pieces(text: str, split: bool = True) -> List[str]:
+    """The units a reply is synthesized (and cached) in: sentence pieces, or the whole reply."""
+    return (split_sentences(_clean(text)) or ["..."]) if split else [_clean(text)]
 
-    return OUT_WAV
+def render_piece(text: str, lang: Optional[str]) -> Tuple[np.ndarray, int]:
+    """Synthesize one item of pieces() (cache first); for callers that schedule pieces themselves."""
+    return _render(text, _pick_voice(lang))
@@ -0,0 +1,148 @@
+# utils/tts_cache.py
+# Content-addressed cache of synthesized PCM for the (mostly fixed) bot replies.
+#  • key = sha1(voice model name + size + mtime, text, sample rate, Piper prosody args),
+#    so a retrained .onnx dropped in under the same name never serves stale audio
+#  • in-memory LRU bounded by bytes
+#  • optional on-disk store of .npy files, loaded back with mmap
+#
+# Warm-up (deploy time): python -m utils.tts_cache --warm
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+def _voice_stamp(voice: str) -> str:
+    try:
+        st = os.stat(voice)
+    except OSError:
+        return os.path.basename(voice)   # not on disk (yet): name only
+    return f"{os.path.basename(voice)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def cache_key(voice: str, text: str, sr: int, params: Iterable[str]) -> str:
+    h = hashlib.sha1()
+    for part in (_voice_stamp(voice), text, str(sr), "\x1f".join(params)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class TTSCache:
+    def __init__(self, max_bytes: int = 64 << 20, disk_dir: Optional[str] = None):
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = disk_dir
+        self._mem: "OrderedDict[str, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._bytes = 0
+        self._disk: Dict[str, Tuple[str, int]] = {}  # key -> (path, rate)
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            for fn in os.listdir(disk_dir):
+                # <key>.<rate>.npy
+                parts = fn.split(".")
+                if len(parts) == 3 and parts[2] == "npy" and parts[1].isdigit():
+                    self._disk[parts[0]] = (os.path.join(disk_dir, fn), int(parts[1]))
+
+    def _remember(self, key: str, pcm: np.ndarray, rate: int):
+        # caller holds the lock
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._bytes -= old[0].nbytes
+        self._mem[key] = (pcm, rate)
+        self._bytes += pcm.nbytes
+        while self._bytes > self.max_bytes and len(self._mem) > 1:
+            _, (ev, _) = self._mem.popitem(last=False)
+            self._bytes -= ev.nbytes
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, int]]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return hit
+            on_disk = self._disk.get(key)
+            if on_disk is None:
+                self.misses += 1
+                return None
+        path, rate = on_disk
+        try:
+            pcm = np.load(path, mmap_mode="r")  # pages in lazily, shared across workers
+        except Exception:
+            with self._lock:
+                self._disk.pop(key, None)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, pcm, rate)
+        return pcm, rate
+
+    def put(self, key: str, pcm: np.ndarray, rate: int):
+        pcm = np.ascontiguousarray(pcm, dtype=np.float32)
+        pcm.setflags(write=False)
+        with self._lock:
+            self._remember(key, pcm, rate)
+        if self.disk_dir and key not in self._disk:
+            path = os.path.join(self.disk_dir, f"{key}.{int(rate)}.npy")
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    np.save(f, pcm)
+                os.replace(tmp, path)
+                with self._lock:
+                    self._disk[key] = (path, int(rate))
+            except OSError:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "items": len(self._mem), "bytes": self._bytes, "disk_items": len(self._disk)}
+
+
+# ---- Warm-up CLI ----
+def warm(langs=("en", "hi"), stream: Optional[bool] = None) -> dict:
+    """Pre-render every static reply (templates × projects × attributes × languages)."""
+    from utils import tts
+    from utils.dialogue import all_static_replies
+
+    if stream is None:
+        stream = tts.STREAMING
+    n = 0
+    for L in langs:
+        for text in all_static_replies(L):
+            for piece in tts.pieces(text, split=stream):
+                tts.render_piece(piece, L)
+                n += 1
+    out = tts.get_cache().stats()
+    out["rendered"] = n
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser(description="TTS reply cache tools")
+    ap.add_argument("--warm", action="store_true", help="pre-render all static replies")
+    ap.add_argument("--mode", choices=["auto", "stream", "full"], default="auto",
+                    help="render sentence pieces (stream) or whole replies (full)")
+    args = ap.parse_args()
+    if args.warm:
+        from utils import tts
+        stream = None if args.mode == "auto" else (args.mode == "stream")
+        try:
+            print(json.dumps(warm(stream=stream), indent=2))
+        finally:
+            tts.shutdown()
+    else:
+        ap.print_help()